@@ -0,0 +1,235 @@
+import threading
+
+import numpy as np
+
+
+def _nearest(x, centroids, chunk=65536):
+    """Numéro du centroïde le plus proche (distance euclidienne) pour chaque ligne de x."""
+    c_norm = (centroids ** 2).sum(axis=1)
+    out = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), chunk):
+        block = x[start:start + chunk]
+        out[start:start + chunk] = (c_norm[None, :] - 2 * block @ centroids.T).argmin(axis=1)
+    return out
+
+
+def _kmeans(x, nlist, iterations, rng):
+    """k-means simple, entraîné sur un échantillon de x."""
+    sample = x[rng.choice(len(x), min(len(x), nlist * 40), replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(sample, centroids)
+        counts = np.bincount(assign, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class _Snapshot:
+    """État d'une construction de l'index, jamais modifié une fois publié."""
+
+    def __init__(self, indexed, layout, centroids, order, offsets, vectors, buckets):
+        self.indexed = indexed
+        self.layout = layout
+        self.centroids = centroids
+        self.centroid_norms = (centroids ** 2).sum(axis=1)
+        # Listes inversées contiguës : la liste i occupe order[offsets[i]:offsets[i + 1]]
+        self.order = order
+        self.offsets = offsets
+        self.vectors = vectors
+        self.norms = (vectors ** 2).sum(axis=1)
+        self.buckets = buckets
+
+
+class IVFIndex:
+    """
+    Index approximatif (IVF : k-means + listes inversées) sur les profils encodés d'un MatchingEngine,
+    pour les très grandes populations. Chaque profil devient un vecteur dont la distance euclidienne
+    suit le score du schéma (one-hot pondérés, bitsets normalisés, curseurs divisés par leur amplitude).
+    Une recherche ne parcourt que les nprobe listes les plus proches, garde les n_candidates
+    profils admissibles les plus proches, puis les re-classe avec le score exact du moteur.
+    Les profils ajoutés après la construction sont scorés exactement, jusqu'à ce qu'ils
+    dépassent rebuild_ratio de la population indexée (l'index est alors reconstruit).
+    Chaque construction publie un nouveau _Snapshot en une seule affectation : les recherches
+    en cours, sans verrou, gardent l'ancien jusqu'à leur fin.
+    Avec background=True, les recherches ne construisent jamais l'index : un thread de fond appelle
+    refresh(), et d'ici là les recherches utilisent la dernière construction publiée (un scan exact
+    des profils admissibles avant la première).
+    """
+
+    def __init__(self, engine, nlist=None, nprobe=16, n_candidates=300, iterations=10,
+                 rebuild_ratio=0.1, seed=0, background=False):
+        self.engine = engine
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.n_candidates = n_candidates
+        self.iterations = iterations
+        self.rebuild_ratio = rebuild_ratio
+        self.seed = seed
+        self.background = background
+        self.lock = threading.Lock()
+        self.snapshot = None
+
+    # ------------------------------------------------------------------------
+    # Encodage des vecteurs
+    # ------------------------------------------------------------------------
+    def _encode_population(self, size):
+        """Vecteurs des 'size' premiers profils, et la disposition de leurs blocs (critère, largeur, échelle)."""
+        layout = []
+        blocks = []
+        for f in self.engine.schema.features:
+            key, kind = f.key, f.compare
+            scale = np.sqrt(f.weight)
+            if kind == "exact":
+                width = len(self.engine.vocabularies[key].codes)
+                block = np.zeros((size, width), dtype=np.float32)
+                block[np.arange(size), self.engine.columns[key][:size]] = scale
+            elif kind == "jaccard":
+                packed, sizes, width = self.engine.columns[key]
+                bits = np.unpackbits(packed[:size], axis=1)[:, :width].astype(np.float32)
+                block = bits * (scale / np.sqrt(np.maximum(sizes[:size], 1)))[:, None]
+            else:
+                values, valid = self.engine.columns[key]
+                block = np.where(valid[:size], values[:size], f.default)[:, None]
+                block = (block * scale / f.range).astype(np.float32)
+                width = 1
+            layout.append((f, width, scale))
+            blocks.append(block)
+        return np.hstack(blocks), layout
+
+    def _encode_query(self, user_static, layout):
+        parts = []
+        for f, width, scale in layout:
+            key, kind = f.key, f.compare
+            part = np.zeros(width, dtype=np.float32)
+            if kind == "exact":
+                code = self.engine.vocabularies[key].lookup(user_static.get(key))
+                if 0 <= code < width:
+                    part[code] = scale
+            elif kind == "jaccard":
+                user_packed, user_size = self.engine._encode_user_set(key, user_static)
+                bits = np.unpackbits(user_packed)[:width]
+                part[:len(bits)] = bits * (scale / np.sqrt(max(user_size, 1)))
+            else:
+                try:
+                    part[0] = float(user_static.get(key, f.default)) * scale / f.range
+                except Exception:
+                    part[0] = f.default * scale / f.range
+            parts.append(part)
+        return np.concatenate(parts)
+
+    # ------------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------------
+    @property
+    def indexed(self):
+        """Nombre de profils couverts par la dernière construction."""
+        snapshot = self.snapshot
+        return snapshot.indexed if snapshot is not None else 0
+
+    def build(self):
+        with self.lock:
+            self._build()
+
+    def _build(self):
+        size = self.engine.size
+        if size == 0:
+            self.snapshot = None
+            return
+        vectors, layout = self._encode_population(size)
+        nlist = self.nlist or max(1, int(np.sqrt(size)))
+        nlist = min(nlist, size)
+        rng = np.random.default_rng(self.seed)
+        centroids = _kmeans(vectors, nlist, self.iterations, rng)
+        assign = _nearest(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+        buckets = np.array(self.engine.index.bucket_of[:size], dtype=np.int32)[order]
+        self.snapshot = _Snapshot(size, layout, centroids, order, offsets, vectors[order], buckets)
+
+    def _stale(self):
+        indexed = self.indexed
+        return self.engine.size - indexed > self.rebuild_ratio * max(indexed, 1)
+
+    def refresh(self):
+        """Reconstruit l'index si trop de profils ont été ajoutés depuis la dernière construction."""
+        if self._stale():
+            with self.lock:
+                # Un autre thread a pu reconstruire l'index pendant l'attente du verrou
+                if self._stale():
+                    self._build()
+
+    # ------------------------------------------------------------------------
+    # Recherche
+    # ------------------------------------------------------------------------
+    def _allowed(self, user_static, exclude_user_id):
+        index = self.engine.index
+        allowed_ids = np.array([index.key_ids[k] for k in index.allowed_keys(user_static)], dtype=np.int32)
+        excluded = np.array(self.engine.rows_by_user.get(exclude_user_id, []), dtype=np.int64)
+        return allowed_ids, excluded
+
+    def candidates(self, user_static, exclude_user_id=None, nearby=None):
+        """
+        Positions (triées) des profils à re-classer exactement pour user_static (dernières versions seulement).
+        nearby : positions triées auxquelles se limiter (GeoIndex.within), appliquées avant de garder les
+        n_candidates plus proches. S'il y en a moins que de profils dans les listes sondées, elles sont
+        toutes re-classées exactement.
+        """
+        if not self.background:
+            self.refresh()
+        snapshot = self.snapshot
+        indexed = snapshot.indexed if snapshot is not None else 0
+        size = self.engine.size
+        allowed_ids, excluded = self._allowed(user_static, exclude_user_id)
+        found = []
+        if indexed:
+            q = self._encode_query(user_static, snapshot.layout)
+            nprobe = min(self.nprobe, len(snapshot.centroids))
+            d_centroids = snapshot.centroid_norms - 2 * snapshot.centroids @ q
+            probe = np.argpartition(d_centroids, nprobe - 1)[:nprobe]
+            offsets = snapshot.offsets
+            if nearby is not None and nearby.size <= (offsets[probe + 1] - offsets[probe]).sum():
+                engine = self.engine
+                positions = engine.live(np.intersect1d(engine.index.candidates(user_static), nearby, assume_unique=True))
+                if excluded.size:
+                    positions = positions[~np.isin(positions, excluded)]
+                return positions
+            order = snapshot.order
+            idx = np.concatenate([np.arange(offsets[p], offsets[p + 1]) for p in probe])
+            idx = idx[np.isin(snapshot.buckets[idx], allowed_ids) & self.engine.current[order[idx]]]
+            if nearby is not None:
+                idx = idx[np.isin(order[idx], nearby)]
+            if excluded.size:
+                idx = idx[~np.isin(order[idx], excluded)]
+            if idx.size > self.n_candidates:
+                dist = snapshot.norms[idx] - 2 * snapshot.vectors[idx] @ q
+                idx = idx[np.argpartition(dist, self.n_candidates - 1)[:self.n_candidates]]
+            found.append(order[idx])
+
+        # Profils arrivés depuis la construction : scorés exactement
+        if size > indexed:
+            tail = np.arange(indexed, size)
+            tail_buckets = np.array(self.engine.index.bucket_of[indexed:size], dtype=np.int32)
+            tail = tail[np.isin(tail_buckets, allowed_ids) & self.engine.current[tail]]
+            if nearby is not None:
+                tail = tail[np.isin(tail, nearby)]
+            if excluded.size:
+                tail = tail[~np.isin(tail, excluded)]
+            found.append(tail)
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def top_k(self, user_static, k=1, exclude_user_id=None, radius_km=None):
+        """Même interface que MatchingEngine.top_k, avec une recherche approximative puis un re-classement exact."""
+        if self.engine.size == 0 or k <= 0:
+            return []
+        nearby = None
+        if radius_km is not None:
+            nearby = self.engine.geo.within(user_static.get("location"), radius_km)
+        candidates = self.candidates(user_static, exclude_user_id, nearby)
+        if candidates.size == 0:
+            return []
+        return self.engine.rank(candidates, self.engine.scores(user_static, candidates), k)
@@ -0,0 +1,127 @@
+"""
+Rappel et latence de la recherche approximative (IVFIndex) comparée au scan exact (MatchingEngine.top_k)
+sur des populations synthétiques.
+Mesure aussi la première recherche après une croissance de plus de rebuild_ratio : reconstruction de l'index
+dans la requête (background=False), ou ancienne construction servie pendant qu'un thread la reconstruit
+(background=True, comme dans l'application).
+Les résultats sont écrits en JSON pour comparer les versions entre elles.
+
+Lancer depuis la racine du dépôt :
+    python -m benchmarks.bench_ann --sizes 10000 100000 1000000 --queries 50 --k 10 --output bench_ann.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+import threading
+import time
+
+import numpy as np
+
+from ann import IVFIndex
+from benchmarks.bench_rerun import summarize
+from benchmarks.synthetic import generate_profiles, scoring_answers
+from matching import MatchingEngine
+
+
+def build_engine(size, chunk=100_000, engine=None):
+    engine = engine or MatchingEngine()
+    first = engine.size
+    for start in range(first, first + size, chunk):
+        pairs = list(generate_profiles(min(chunk, first + size - start), start=start))
+        engine.extend([p[0] for p in pairs], [p[1] for p in pairs])
+    return engine
+
+
+def growth(index, engine, rng, queries):
+    """Ajoute 11 % de profils puis mesure les recherches suivantes, dans le mode index.background."""
+    build_engine(int(engine.size * 0.11) + 1, engine=engine)
+    times = []
+    rebuild = None
+    if index.background:
+        rebuild = threading.Thread(target=index.refresh)
+        rebuild.start()
+    for _ in range(queries):
+        user = scoring_answers(rng)
+        t0 = time.perf_counter()
+        index.top_k(user, 10)
+        times.append(time.perf_counter() - t0)
+    if rebuild is not None:
+        rebuild.join()
+    return times
+
+
+def run(size, queries, k, nprobe, n_candidates):
+    start = time.perf_counter()
+    engine = build_engine(size)
+    encode_s = time.perf_counter() - start
+
+    index = IVFIndex(engine, nprobe=nprobe, n_candidates=n_candidates)
+    start = time.perf_counter()
+    index.build()
+    build_s = time.perf_counter() - start
+
+    rng = random.Random(42)
+    exact_times, ann_times = [], []
+    id_recall, score_recall = [], []
+    for _ in range(queries):
+        user = scoring_answers(rng)
+        t0 = time.perf_counter()
+        exact = engine.top_k(user, k)
+        t1 = time.perf_counter()
+        approx = index.top_k(user, k)
+        t2 = time.perf_counter()
+        exact_times.append(t1 - t0)
+        ann_times.append(t2 - t1)
+        if not exact:
+            continue
+        # Avec beaucoup d'ex-aequo, on compte aussi les résultats aussi bons que le k-ième exact
+        id_recall.append(len({u for u, _ in exact} & {u for u, _ in approx}) / len(exact))
+        kth = exact[-1][1]
+        score_recall.append(sum(1 for _, s in approx if s >= kth) / len(exact))
+
+    inline = growth(index, engine, rng, queries)
+    index.background = True
+    start = time.perf_counter()
+    background = growth(index, engine, rng, queries)
+    background_s = time.perf_counter() - start
+
+    return {
+        "profiles": size,
+        "encode_s": round(encode_s, 2),
+        "ann_build_s": round(build_s, 2),
+        "exact": summarize(exact_times),
+        "ann": summarize(ann_times),
+        "recall_ids": round(sum(id_recall) / len(id_recall), 3),
+        "recall_scores": round(sum(score_recall) / len(score_recall), 3),
+        "after_growth_first_search_inline_s": round(inline[0], 3),
+        "after_growth_inline": summarize(inline),
+        "after_growth_first_search_background_s": round(background[0], 3),
+        "after_growth_background": summarize(background),
+        "background_rebuild_wall_s": round(background_s, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--candidates", type=int, default=300)
+    parser.add_argument("--output", default="bench_ann.json")
+    args = parser.parse_args()
+    results = [run(size, args.queries, args.k, args.nprobe, args.candidates) for size in args.sizes]
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "k": args.k,
+        "nprobe": args.nprobe,
+        "candidates": args.candidates,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,142 @@
+"""
+Export en colonnes (export.py) contre les analyses faites directement sur la Google Sheet.
+Une analyse type (inscriptions par jour et par genre, âge moyen) est calculée de deux façons :
+  - comme aujourd'hui : get_all_values() sur une feuille en mémoire (FakeWorksheet, latence par appel
+    et par ligne) puis json.loads de chaque cellule 'data' ;
+  - sur l'export Parquet puis Arrow (fichiers projetés en mémoire), en ne lisant que les colonnes utiles.
+Mesure aussi l'export complet depuis la copie locale, un export incrémental après de nouvelles
+inscriptions, la taille des fichiers et la lecture des dernières versions (latest_profiles).
+Vérifie que les deux calculs donnent exactement le même résultat.
+
+Lancer depuis la racine du dépôt :
+    python -m benchmarks.bench_export --profiles 100000 --days 365 --increment 1000 --row-latency 0.00002
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import tempfile
+import time
+from collections import defaultdict
+
+import pyarrow as pa
+
+from benchmarks.fakes import FakeWorksheet
+from benchmarks.synthetic import sheet_rows
+from export import export_profiles, latest_profiles, open_dataset
+from profile_store import ProfileStore
+
+
+def dated_rows(count, days, seed, start=0, total=None):
+    """Lignes de la Sheet dont les dates d'inscription s'étalent sur 'days' jours, dans l'ordre."""
+    total = total or count
+    first = datetime.datetime(2024, 1, 1, 8)
+    rows = sheet_rows(count, seed=seed, start=start)
+    for i, row in enumerate(rows, start):
+        moment = first + datetime.timedelta(days=i * days / total)
+        row[1] = moment.strftime("%Y-%m-%d %H:%M:%S")
+    return rows
+
+
+def sheet_analysis(sheet):
+    """Inscriptions et âge moyen par (jour, genre), à partir de get_all_values()."""
+    groups = defaultdict(list)
+    for row in sheet.get_all_values()[1:]:
+        static = json.loads(row[2]).get("static_answers", {})
+        groups[(row[1][:10], static.get("gender"))].append(static.get("age"))
+    return {key: (len(ages), round(sum(ages) / len(ages), 6)) for key, ages in groups.items()}
+
+
+def export_analysis(out_dir):
+    """Même analyse sur l'export, en ne lisant que les colonnes date, gender et age."""
+    table = open_dataset(out_dir).to_table(columns=["date", "gender", "age"])
+    table = table.set_column(1, "gender", table["gender"].cast(pa.string()))
+    grouped = table.group_by(["date", "gender"]).aggregate([("age", "count"), ("age", "mean")])
+    return {(d, g): (c, round(m, 6)) for d, g, c, m in zip(*(grouped[name].to_pylist() for name in
+                                                              ("date", "gender", "age_count", "age_mean")))}
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def folder_mb(path):
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return round(size / 2 ** 20, 2)
+
+
+def run(profiles, days, increment, seed, latency, row_latency, batch_size, workdir):
+    rows = dated_rows(profiles, days, seed, total=profiles + increment)
+    sheet = FakeWorksheet(latency=latency)
+    sheet.rows.extend(rows)
+    store = ProfileStore(os.path.join(workdir, "onelove_profiles.db"))
+    store.add_rows(2, rows)
+
+    def legacy():
+        # get_all_values n'a pas de coût par ligne dans la fausse feuille : ajouté ici
+        time.sleep(row_latency * len(sheet.rows))
+        return sheet_analysis(sheet)
+    expected, legacy_s = timed(legacy)
+
+    result = {"profiles": profiles, "days": days, "sheet_analysis_s": round(legacy_s, 3),
+              "db_mb": round(os.path.getsize(os.path.join(workdir, "onelove_profiles.db")) / 2 ** 20, 2)}
+    new_rows = dated_rows(increment, days, seed, start=profiles, total=profiles + increment)
+    for fmt in ("parquet", "arrow"):
+        out = os.path.join(workdir, fmt)
+        full, full_s = timed(lambda: export_profiles(store, out, fmt, batch_size))
+        analysis, analysis_s = timed(lambda: export_analysis(out))
+        result[fmt] = {
+            "export_full_s": round(full_s, 3),
+            "export_rows_per_s": round(full["rows"] / full_s),
+            "files": len(full["files"]),
+            "size_mb": folder_mb(out),
+            "analysis_s": round(analysis_s, 3),
+            "analysis_mismatch": analysis != expected,
+        }
+    # Nouvelles inscriptions : seules ces lignes sont exportées au lancement suivant
+    store.add_rows(2 + profiles, new_rows)
+    sheet.rows.extend(new_rows)
+    expected = sheet_analysis(sheet)
+    for fmt in ("parquet", "arrow"):
+        out = os.path.join(workdir, fmt)
+        delta, delta_s = timed(lambda: export_profiles(store, out, fmt, batch_size))
+        latest, latest_s = timed(lambda: latest_profiles(out))
+        result[fmt].update({
+            "export_incremental_rows": delta["rows"],
+            "export_incremental_s": round(delta_s, 3),
+            "incremental_analysis_mismatch": export_analysis(out) != expected,
+            "latest_profiles_s": round(latest_s, 3),
+            "latest_profiles_rows": latest.num_rows,
+        })
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--days", type=int, default=365, help="jours sur lesquels s'étalent les inscriptions")
+    parser.add_argument("--increment", type=int, default=1000, help="inscriptions ajoutées avant l'export incrémental")
+    parser.add_argument("--latency", type=float, default=0.05, help="latence de l'appel get_all_values (s)")
+    parser.add_argument("--row-latency", type=float, default=0.00002, help="coût de chaque ligne lue (s)")
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_export.json")
+    args = parser.parse_args()
+
+    results = []
+    for profiles in sorted(args.profiles):
+        with tempfile.TemporaryDirectory() as workdir:
+            results.append(run(profiles, args.days, args.increment, args.seed, args.latency, args.row_latency,
+                               args.batch_size, workdir))
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pyarrow": pa.__version__,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
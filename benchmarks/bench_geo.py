@@ -0,0 +1,150 @@
+"""
+Filtre géographique du matching (geo.py) sur des populations synthétiques dont la réponse "location" est
+un texte libre : villes de la table tirées selon leur population, écrites de plusieurs façons
+("Paris 15e", "st etienne", "LYON, France", fautes de frappe, régions) et quelques lieux inconnus.
+Mesure le taux de lieux reconnus, le nombre de candidats scorés par requête et la latence de top_k
+pour plusieurs rayons, et vérifie que top_k avec un rayon donne exactement le même classement
+qu'un filtre par distance sur tous les profils admissibles.
+
+Lancer depuis la racine du dépôt :
+    python -m benchmarks.bench_geo --sizes 10000 100000 --radius 50 100 200 --queries 50
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+import time
+
+import numpy as np
+
+from benchmarks.bench_rerun import summarize
+from benchmarks.synthetic import generate_profiles
+from geo import distance_km, load_places, locate
+from matching import MatchingEngine
+
+# Lieux hors de la table (jamais filtrés)
+UNKNOWN = ["Trifouilly-les-Oies", "à la campagne", "un peu partout", "Tahiti", "Berlin"]
+
+
+def variants(name, rng):
+    """Façons d'écrire un nom de ville dans le champ libre du questionnaire."""
+    forms = [name, name.upper(), name.lower(), f"{name}, France", f"{name} centre", f"{name} {rng.randint(1, 20)}e"]
+    if name.startswith("Saint-"):
+        forms.append("st " + name[len("Saint-"):])
+    if len(name) > 6:
+        i = rng.randrange(1, len(name) - 1)
+        forms.append(name[:i] + name[i + 1:])  # lettre oubliée
+    return forms
+
+
+def locations(count, seed, unknown_rate):
+    """count réponses "location" en texte libre, avec le lieu attendu (None : inconnu)."""
+    rng = random.Random(seed)
+    places = list({id(p): p for p in load_places().values()}.values())
+    cities = [p for p in places if p.kind == "ville"]
+    regions = [p for p in places if p.kind == "région"]
+    weights = [p.population for p in cities]
+    answers = []
+    for _ in range(count):
+        draw = rng.random()
+        if draw < unknown_rate:
+            answers.append((rng.choice(UNKNOWN), None))
+        elif draw < unknown_rate + 0.05:
+            region = rng.choice(regions)
+            answers.append((region.name, region))
+        else:
+            city = rng.choices(cities, weights)[0]
+            answers.append((rng.choice(variants(city.name, rng)), city))
+    return answers
+
+
+def brute_force(engine, static, radius_km, k):
+    """Classement de référence : profils admissibles filtrés un par un par distance, puis rank()."""
+    candidates = engine.index.candidates(static)
+    place = locate(static.get("location"))
+    if place is not None:
+        keep = [engine.geo.place_of[p] is None or distance_km(place, engine.geo.place_of[p]) <= radius_km
+                for p in candidates]
+        candidates = candidates[np.array(keep, dtype=bool)] if len(keep) else candidates
+    if candidates.size == 0:
+        return []
+    return engine.rank(candidates, engine.scores(static, candidates), k)
+
+
+def run(size, radii, queries, seed, unknown_rate, k):
+    profiles = list(generate_profiles(size, seed=seed))
+    answers = locations(size + queries, seed, unknown_rate)
+    statics = []
+    for (_, static), (text, _) in zip(profiles, answers):
+        static["location"] = text
+        statics.append(static)
+
+    start = time.perf_counter()
+    engine = MatchingEngine([user_id for user_id, _ in profiles], statics)
+    build_s = time.perf_counter() - start
+
+    recognized = sum(locate(text) is not None for text, _ in answers)
+    correct = sum(locate(text) is expected for text, expected in answers if expected is not None)
+    expected_total = sum(expected is not None for _, expected in answers)
+
+    query_statics = []
+    for i, (_, static) in enumerate(generate_profiles(queries, seed=seed + 1)):
+        static["location"] = answers[size + i][0]
+        query_statics.append(static)
+
+    result = {
+        "profiles": size,
+        "engine_build_s": round(build_s, 3),
+        "locations_recognized": round(recognized / len(answers), 3),
+        "locations_correct": round(correct / max(expected_total, 1), 3),
+        "indexed_places": len(engine.geo.places),
+        "radius": {},
+    }
+    for radius in [None] + list(radii):
+        times, counts, mismatches = [], [], 0
+        for static in query_statics:
+            candidates = engine.index.candidates(static)
+            if radius is not None:
+                nearby = engine.geo.within(static.get("location"), radius)
+                if nearby is not None:
+                    candidates = np.intersect1d(candidates, nearby, assume_unique=True)
+            counts.append(int(candidates.size))
+            t0 = time.perf_counter()
+            top = engine.top_k(static, k=k, radius_km=radius)
+            times.append(time.perf_counter() - t0)
+            if radius is not None and top != brute_force(engine, static, radius, k):
+                mismatches += 1
+        result["radius"][str(radius)] = {
+            "mean_candidates": round(sum(counts) / len(counts), 1),
+            "candidate_fraction": round(sum(counts) / len(counts) / size, 4),
+            "top_k": summarize(times),
+            "mismatches": mismatches,
+        }
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--radius", type=float, nargs="+", default=[50, 100, 200], help="rayons testés (km)")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--unknown-rate", type=float, default=0.05, help="part des lieux hors de la table")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_geo.json")
+    args = parser.parse_args()
+
+    results = [run(size, args.radius, args.queries, args.seed, args.unknown_rate, args.k)
+               for size in sorted(args.sizes)]
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "queries": args.queries,
+        "k": args.k,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
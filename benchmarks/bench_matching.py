@@ -0,0 +1,178 @@
+"""
+Matching de bout en bout (chemin de page_matching hors Streamlit) sur des populations synthétiques :
+une Google Sheet en mémoire remplie de profils aux réponses du questionnaire, puis pour chaque requête
+un nouveau profil ajouté à la Sheet, synchronisation de la copie locale, lecture par user_id de la
+version enregistrée (get_data) et recherche du meilleur match avec les réponses de la session.
+Mesure aussi l'ancien get_all_data_as_df seul, l'ancienne lecture du profil courant par filtre sur tout
+le DataFrame comparée à get_profile, l'ancienne boucle compute_compatibility (petites populations)
+et le pic de mémoire (tracemalloc) du chargement initial et d'une première requête.
+Les résultats sont écrits en JSON pour comparer les versions entre elles.
+
+Lancer depuis la racine du dépôt :
+    python -m benchmarks.bench_matching --sizes 1000 10000 50000 --queries 20 --output bench_matching.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_rerun import summarize
+from benchmarks.fakes import FakeWorksheet
+from benchmarks.synthetic import matching_profile, sheet_rows
+from matching import compute_compatibility, partner_allowed
+from profile_store import COLUMNS, ProfileStore
+
+
+def load_sheet(size, seed, chunk=10_000):
+    sheet = FakeWorksheet()
+    for start in range(0, size, chunk):
+        sheet.rows.extend(sheet_rows(min(chunk, size - start), seed=seed, start=start))
+    return sheet
+
+
+def get_all_data_as_df(store, sheet):
+    """Ancienne lecture de toute la copie locale en DataFrame (get_all_data_as_df, retirée de onelove.py)."""
+    store.sync(sheet)
+    records = store.records()
+    if not records:
+        return pd.DataFrame()
+    return pd.DataFrame(records, columns=COLUMNS)
+
+
+def page_matching(store, sheet, user_id, static_answers):
+    """Chemin de page_matching sans liste précalculée : renvoie (user_id, score) du meilleur match ou None."""
+    store.sync(sheet)
+    # La page compare cette version à celle de la session avant de consulter les listes précalculées
+    store.get_data(user_id)
+    top = store.engine().top_k(static_answers, k=1, exclude_user_id=user_id)
+    return top[0] if top and top[0][1] > 0 else None
+
+
+def dataframe_lookup(df, user_id):
+    """Ancienne lecture du profil courant : filtre booléen sur tout le DataFrame puis JSON relu."""
+    row = df[df["user_id"] == user_id]
+    return json.loads(row["data"].iloc[0])["static_answers"] if not row.empty else None
+
+
+def scalar_matching(df, user_id, static_answers):
+    """Ancienne boucle de page_matching : JSON relu et compute_compatibility pour chaque ligne."""
+    best_match, best_score = None, 0
+    for _, row in df.iterrows():
+        if row["user_id"] == user_id:
+            continue
+        other = json.loads(row["data"]).get("static_answers", {})
+        if not partner_allowed(static_answers, other):
+            continue
+        score = compute_compatibility(static_answers, other)
+        if score > best_score:
+            best_match, best_score = row["user_id"], score
+    return best_match, best_score
+
+
+def new_profile(rng, size, i):
+    """Nouveau profil soumis pendant la mesure (ligne ajoutée à la Sheet, comme le ferait SheetWriter)."""
+    profile = matching_profile(rng)
+    user_id = f"new{size}_{i}"
+    return user_id, profile, [user_id, "2024-02-01 00:00:00", json.dumps(profile, ensure_ascii=False), "0", ""]
+
+
+def run(size, queries, seed, scalar_max, workdir):
+    sheet = load_sheet(size, seed)
+    rng = random.Random(seed + 1)
+
+    # Pic de mémoire : chargement initial de la copie locale et première requête
+    tracemalloc.start()
+    start = time.perf_counter()
+    store = ProfileStore(os.path.join(workdir, f"traced{size}.db"))
+    user_id, profile, row = new_profile(rng, size, "traced")
+    sheet.rows.append(row)
+    page_matching(store, sheet, user_id, profile["static_answers"])
+    traced_s = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    store.conn.close()
+    del store
+
+    # Chargement à froid puis requêtes successives, sans tracemalloc
+    store = ProfileStore(os.path.join(workdir, f"timed{size}.db"))
+    start = time.perf_counter()
+    store.sync(sheet)
+    store.engine()
+    cold_s = time.perf_counter() - start
+
+    end_to_end, df_times, filter_times, lookup_times = [], [], [], []
+    for i in range(queries):
+        user_id, profile, row = new_profile(rng, size, i)
+        sheet.rows.append(row)
+        t0 = time.perf_counter()
+        page_matching(store, sheet, user_id, profile["static_answers"])
+        end_to_end.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        df = get_all_data_as_df(store, sheet)
+        df_times.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        dataframe_lookup(df, user_id)
+        filter_times.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        store.get_profile(user_id).static_answers()
+        lookup_times.append(time.perf_counter() - t0)
+
+    result = {
+        "profiles": size,
+        "cold_load_s": round(cold_s, 3),
+        "end_to_end": summarize(end_to_end),
+        "throughput_qps": round(queries / sum(end_to_end), 2),
+        "get_all_data_as_df": summarize(df_times),
+        "lookup_dataframe_filter": summarize(filter_times),
+        "lookup_get_profile": summarize(lookup_times),
+        "peak_traced_mb": round(peak / 2 ** 20, 1),
+        "traced_first_query_s": round(traced_s, 3),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+    if size <= scalar_max:
+        df = get_all_data_as_df(store, sheet)
+        scalar = []
+        for i in range(min(queries, 5)):
+            user_id, profile, _ = new_profile(rng, size, f"scalar{i}")
+            t0 = time.perf_counter()
+            scalar_matching(df, user_id, profile["static_answers"])
+            scalar.append(time.perf_counter() - t0)
+        result["scalar_compute_compatibility"] = summarize(scalar)
+    store.conn.close()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scalar-max", type=int, default=10_000,
+                        help="population maximale pour mesurer l'ancienne boucle compute_compatibility")
+    parser.add_argument("--output", default="bench_matching.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [run(size, args.queries, args.seed, args.scalar_max, workdir) for size in sorted(args.sizes)]
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "queries": args.queries,
+        "seed": args.seed,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
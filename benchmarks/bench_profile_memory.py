@@ -0,0 +1,59 @@
+"""
+Mémoire et temps de chargement des profils : dictionnaires issus du JSON de la colonne 'data'
+(ancienne représentation) comparés aux profils compacts ProfileRecord (texte chargé à la demande).
+
+Lancer depuis la racine du dépôt :
+    python -m benchmarks.bench_profile_memory --profiles 20000
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from benchmarks.synthetic import full_profile
+from profiles import ProfileRecord
+
+
+def measure(build):
+    """Renvoie (objet construit, octets alloués, secondes)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def run(count):
+    rng = random.Random(0)
+    rows = [[f"user{i}", "2024-01-01 00:00:00", json.dumps(full_profile(rng), ensure_ascii=False), "0", ""]
+            for i in range(count)]
+
+    _, json_bytes, json_s = measure(lambda: [json.loads(row[2]) for row in rows])
+    _, static_bytes, static_s = measure(lambda: [json.loads(row[2])["static_answers"] for row in rows])
+    records, record_bytes, record_s = measure(
+        lambda: [ProfileRecord.from_static(r[0], r[1], json.loads(r[2])["static_answers"]) for r in rows]
+    )
+    blobs = [(r.user_id, r.timestamp, r.to_bytes(), r.location) for r in records]
+    del records
+    _, loaded_bytes, loaded_s = measure(lambda: [ProfileRecord.from_bytes(*b) for b in blobs])
+
+    def summary(size, seconds):
+        return {"bytes_per_profile": round(size / count), "load_s": round(seconds, 3)}
+
+    return {
+        "profiles": count,
+        "json_full_data": summary(json_bytes, json_s),
+        "json_static_answers_only": summary(static_bytes, static_s),
+        "compact_from_json": summary(record_bytes, record_s),
+        "compact_from_store": summary(loaded_bytes, loaded_s),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=20000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.profiles), indent=2))
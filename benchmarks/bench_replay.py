@@ -0,0 +1,304 @@
+"""
+Rejeu de sessions complètes contre l'application, sans navigateur : chaque session est une streamlit.testing
+AppTest qui parcourt main() de page_login à page_matching (questionnaire, 3 réponses au chatbot, résumé,
+matching), comme un utilisateur. Les sessions tournent en parallèle dans un seul processus et partagent
+donc les ressources st.cache_resource (Sheet, copie locale, passerelle OpenAI...), comme sur le serveur.
+Google Sheets est remplacée par un classeur en mémoire (FakeSpreadsheet, profils synthétiques répartis
+dans les shards) et OpenAI par un faux serveur local ; leurs latences sont réglables.
+Rapporte le débit (sessions et reruns par seconde), la latence de chaque étape par page affichée
+(percentiles, mesurés côté client) et les mesures internes de l'application (metrics.py) par page.
+
+Les sessions rejouées sont générées (réponses aléatoires) ou lues dans un fichier JSON Lines (--script),
+une session par ligne : {"user_id": ..., "answers": {réponses du questionnaire}, "chat": [3 réponses],
+"interaction": "discuter par chat"}. --dump-script écrit les sessions générées dans ce format.
+
+Lancer depuis la racine du dépôt :
+    python -m benchmarks.bench_replay --sessions 40 --concurrency 8 --profiles 5000 \\
+        --openai-first-token 0.3 --openai-token 0.01 --sheet-latency 0.05
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_rerun import summarize
+from benchmarks.synthetic import COUPLE_VALUES, IDEAL_DAYS, questionnaire_answers, sheet_rows
+from questions import CHOICES, MULTI_CHOICES, QUESTION_ORDER, SLIDERS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECRETS = {"openai": {"api_key": "replay"}, "GCP_SERVICE_ACCOUNT": "{}", "admin": {"password": "replay"}}
+# Pages du questionnaire (formulaires) : préfixe de leurs réponses et bouton de validation, dans l'ordre du parcours
+FORM_PAGES = [("values", "valeur_", "Suivant"), ("attachment", "attach_", "Suivant"),
+              ("communication", "comm_", "Suivant"), ("lifestyle", "lifestyle_", "Suivant"),
+              ("sociability", "soc_", "Suivant"), ("vision", "vision_", "Suivant"),
+              ("experience", "exp_", "Terminer")]
+INTERACTIONS = ["discuter par chat", "par téléphone", "se rencontrer directement"]
+
+
+class ReplayError(Exception):
+    """Exception levée par l'application pendant le rejeu d'une session."""
+
+
+def generate_scripts(count, seed):
+    rng = random.Random(seed)
+    scripts = []
+    for i in range(count):
+        answers = questionnaire_answers(rng)
+        chat = [" ".join(rng.choice(IDEAL_DAYS + COUPLE_VALUES) for _ in range(rng.randint(5, 25)))
+                for _ in range(3)]
+        scripts.append({"user_id": f"replay{i}", "answers": answers, "chat": chat,
+                        "interaction": rng.choice(INTERACTIONS)})
+    return scripts
+
+
+def pin_streamlit_globals():
+    """
+    AppTest remplace le temps d'un rerun des objets globaux de Streamlit (runtime factice, st.secrets,
+    option global.appTest) puis les remet en place : avec plusieurs sessions en parallèle, une session
+    qui termine les retirerait à une autre encore en cours. On les fixe une fois pour tout le rejeu.
+    Le script est aussi compilé une seule fois pour toutes les sessions, comme sur le serveur (AppTest le
+    recompile à chaque rerun, et ast.parse n'est pas sûr entre threads en Python 3.11).
+    """
+    import streamlit as st
+    from streamlit import config
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    secrets = Secrets()
+    secrets._secrets = SECRETS
+    st.secrets = secrets
+    config.set_option("global.appTest", True)
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+    # Dernier runtime factice installé par une AppTest, rendu même après son retrait
+    last = [None]
+    instance, exists = Runtime.instance.__func__, Runtime.exists.__func__
+
+    def pinned_instance(cls):
+        if cls._instance is not None:
+            last[0] = cls._instance
+        return last[0] if last[0] is not None else instance(cls)
+
+    def pinned_exists(cls):
+        return last[0] is not None or exists(cls)
+
+    Runtime.instance = classmethod(pinned_instance)
+    Runtime.exists = classmethod(pinned_exists)
+
+
+class Session:
+    """Une session rejouée : AppTest pilotée étape par étape, durée de chaque rerun notée par page affichée."""
+
+    def __init__(self, app, script, think_time, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(app, default_timeout=timeout)
+        self.script = script
+        self.think_time = think_time
+        self.steps = []  # (page affichée, secondes)
+
+    def step(self, action):
+        start = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - start
+        page = self.at.session_state["page"]
+        self.steps.append((page, elapsed))
+        if self.at.exception:
+            raise ReplayError(f"{page} : {self.at.exception[0].value}")
+        time.sleep(self.think_time)
+
+    def button(self, label):
+        for button in self.at.button:
+            if button.label == label:
+                return button
+        raise ReplayError(f"{self.at.session_state['page']} : pas de bouton « {label} »")
+
+    def click(self, label):
+        self.step(lambda: self.button(label).click().run())
+
+    def fill_form(self, prefix):
+        answers = self.script["answers"]
+        radios, sliders, multiselects = iter(self.at.radio), iter(self.at.slider), iter(self.at.multiselect)
+        for key in QUESTION_ORDER:
+            if not key.startswith(prefix):
+                continue
+            if key in CHOICES:
+                next(radios).set_value(answers[key])
+            elif key in MULTI_CHOICES:
+                next(multiselects).set_value(answers[key])
+            elif key in SLIDERS:
+                next(sliders).set_value(answers[key])
+
+    def run(self):
+        at, answers = self.at, self.script["answers"]
+        self.step(at.run)
+        at.text_input[0].input(self.script["user_id"])
+        self.click("Commencer")
+
+        at.radio[0].set_value(answers["gender"])
+        at.number_input[0].set_value(answers["age"])
+        at.text_input[0].input(answers["location"])
+        self.click("Suivant")
+        for _, prefix, submit in FORM_PAGES:
+            self.fill_form(prefix)
+            self.click(submit)
+
+        for message in self.script["chat"]:
+            if at.session_state["question_count"] >= 3:
+                break
+            at.text_input[0].input(message)
+            self.click("Envoyer")
+        # Le bouton du résumé n'apparaît qu'au rerun suivant la dernière réponse
+        self.step(at.run)
+        self.click("Voir le résumé de votre profil")
+        self.click("Découvrez si nous avons quelqu’un de compatible avec vous")
+        if at.radio:
+            at.radio[0].set_value(self.script["interaction"])
+            self.step(at.run)
+
+
+def replay(app, scripts, concurrency, think_time, timeout):
+    """Rejoue les sessions avec 'concurrency' sessions simultanées ; renvoie (sessions, erreurs, durée totale)."""
+    sessions, errors = [], []
+    lock = threading.Lock()
+
+    def play(script):
+        session = Session(app, script, think_time, timeout)
+        try:
+            session.run()
+        except Exception as e:
+            with lock:
+                errors.append(f"{script['user_id']} — {type(e).__name__}: {e}")
+        with lock:
+            sessions.append(session)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as pool:
+        list(pool.map(play, scripts))
+    return sessions, errors, time.perf_counter() - start
+
+
+def wait_for_rows(spreadsheet, user_ids, timeout=15.0):
+    """Attend que SheetWriter ait écrit les profils des sessions ; renvoie le nombre de profils trouvés."""
+    from shards import ALL_SHARDS, shard_title
+    deadline = time.monotonic() + timeout
+    while True:
+        written = {row[0] for shard in ALL_SHARDS for row in spreadsheet.worksheet(shard_title(shard)).rows[1:]}
+        found = len(user_ids & written)
+        if found == len(user_ids) or time.monotonic() > deadline:
+            return found
+        time.sleep(0.2)
+
+
+def main(args):
+    scripts = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            scripts = [json.loads(line) for line in f if line.strip()]
+    else:
+        scripts = generate_scripts(args.sessions, args.seed)
+        if args.dump_script:
+            with open(args.dump_script, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(s, ensure_ascii=False) + "\n" for s in scripts)
+
+    workdir = tempfile.mkdtemp(prefix="onelove-replay-")
+    # Fichiers locaux de l'application (SQLite, mesures) créés dans un dossier vide
+    shutil.copy(os.path.join(os.path.dirname(args.app), "OneLove_IA.png"), workdir)
+    os.chdir(workdir)
+
+    from benchmarks.fakes import FakeOpenAIServer, FakeSpreadsheet
+    server = FakeOpenAIServer(first_token_delay=args.openai_first_token, token_delay=args.openai_token)
+    # openai lit OPENAI_API_BASE à son import : avant le premier rerun
+    os.environ["OPENAI_API_BASE"] = server.api_base
+
+    import clients
+    from shards import shard_of_row, shard_title
+    spreadsheet = FakeSpreadsheet(args.sheet_latency, args.sheet_row_latency)
+    for row in sheet_rows(args.profiles, seed=args.seed):
+        spreadsheet.worksheet(shard_title(shard_of_row(row))).rows.append(row)
+    clients.open_google_worksheet = spreadsheet.open_worksheet
+
+    from metrics import METRICS
+    pin_streamlit_globals()
+    with server:
+        # Une session seule d'abord : ressources partagées créées, copie locale synchronisée
+        warmup, warmup_errors, warmup_s = replay(args.app, generate_scripts(1, args.seed + 1)[:1], 1, 0.0,
+                                                 args.timeout)
+        METRICS.reset()
+        calls, requests = spreadsheet.calls, len(server.requests)
+        sessions, errors, wall_s = replay(args.app, scripts, args.concurrency, args.think_time, args.timeout)
+        openai_requests = len(server.requests) - requests
+        max_concurrent = server.max_concurrent
+    sheet_calls = spreadsheet.calls - calls
+    written = wait_for_rows(spreadsheet, {s["user_id"] for s in scripts})
+
+    by_page = defaultdict(list)
+    for session in sessions:
+        for page, seconds in session.steps:
+            by_page[page].append(seconds)
+    reruns = sum(len(s.steps) for s in sessions)
+    completed = len(sessions) - len(errors)
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sessions": len(scripts),
+        "concurrency": args.concurrency,
+        "profiles": args.profiles,
+        "latencies_s": {"openai_first_token": args.openai_first_token, "openai_token": args.openai_token,
+                        "sheet_call": args.sheet_latency, "sheet_row": args.sheet_row_latency,
+                        "think_time": args.think_time},
+        "warmup_s": round(warmup_s, 3),
+        "warmup_errors": warmup_errors,
+        "wall_s": round(wall_s, 3),
+        "completed": completed,
+        "errors": errors[:20],
+        "sessions_per_s": round(completed / wall_s, 3),
+        "reruns_per_s": round(reruns / wall_s, 2),
+        "session_s": summarize([sum(t for _, t in s.steps) for s in sessions]) if sessions else None,
+        "steps_by_page": {page: dict(summarize(times), count=len(times)) for page, times in by_page.items()},
+        "app_metrics": [{k: v for k, v in row.items() if k != "buckets"} for row in METRICS.snapshot()],
+        "openai_requests": openai_requests,
+        "openai_max_concurrent": max_concurrent,
+        "sheet_api_calls": sheet_calls,
+        "profiles_written": written,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=40, help="sessions générées (sans --script)")
+    parser.add_argument("--concurrency", type=int, default=8, help="sessions simultanées")
+    parser.add_argument("--profiles", type=int, default=2000, help="profils déjà présents dans la Sheet")
+    parser.add_argument("--script", help="sessions à rejouer (JSON Lines) au lieu de sessions générées")
+    parser.add_argument("--dump-script", help="écrit les sessions générées dans ce fichier (JSON Lines)")
+    parser.add_argument("--openai-first-token", type=float, default=0.3, help="délai avant le premier token (s)")
+    parser.add_argument("--openai-token", type=float, default=0.01, help="délai entre deux tokens (s)")
+    parser.add_argument("--sheet-latency", type=float, default=0.05, help="latence de chaque appel à la Sheet (s)")
+    parser.add_argument("--sheet-row-latency", type=float, default=0.00002, help="coût de chaque ligne lue (s)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="pause de l'utilisateur entre deux étapes (s)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="durée maximale d'un rerun (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--app", default=os.path.join(ROOT, "onelove.py"))
+    parser.add_argument("--output", default="bench_replay.json")
+    args = parser.parse_args()
+    args.app = os.path.abspath(args.app)
+    args.output = os.path.abspath(args.output)
+
+    report = main(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    sys.exit(1 if report["errors"] or report["warmup_errors"] else 0)
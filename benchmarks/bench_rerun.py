@@ -0,0 +1,91 @@
+"""
+Accès à la Sheet à chaque rerun Streamlit : feuille rouverte à chaque rerun (ancien code) ou une seule
+SheetConnection pour le processus.
+L'authentification OAuth, l'ouverture du classeur et les lectures sont simulées (time.sleep des fakes) :
+le banc compte les ouvertures évitées et en déduit la latence par rerun pour ces durées ; il ne mesure pas
+la réutilisation des connexions HTTP. Le seul coût réellement mesuré est celui du passage par
+SheetConnection (lectures sans latence simulée, directes ou via la connexion partagée).
+
+Lancer depuis la racine du dépôt :
+    python -m benchmarks.bench_rerun --reruns 50 --auth-latency 0.15 --open-latency 0.1
+"""
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.fakes import FakeWorksheet, fake_open_worksheet
+from clients import SheetConnection
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(durations):
+    return {
+        "mean_ms": round(statistics.mean(durations) * 1000, 3),
+        "p50_ms": round(percentile(durations, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(durations, 0.99) * 1000, 3),
+    }
+
+
+def run(reruns, auth_latency, open_latency, read_latency, calls=100_000):
+    worksheet = FakeWorksheet(latency=read_latency)
+    worksheet.rows.append(["u0", "2024-01-01 00:00:00", "{}", "0", ""])
+    opens = [0]
+    fake_open = fake_open_worksheet(worksheet, auth_latency, open_latency)
+
+    def open_worksheet():
+        opens[0] += 1
+        return fake_open()
+
+    # Ancien code : authentification + ouverture du classeur à chaque rerun
+    before = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        sheet = open_worksheet()
+        sheet.get_values("A2:E")
+        before.append(time.perf_counter() - start)
+
+    opens_before, opens[0] = opens[0], 0
+
+    # Nouveau code : une seule connexion, créée au premier rerun
+    connection = SheetConnection(open_worksheet)
+    after = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        connection.get_values("A2:E")
+        after.append(time.perf_counter() - start)
+
+    # Surcoût réel de SheetConnection : mêmes lectures sans latence simulée
+    worksheet.latency = 0
+    start = time.perf_counter()
+    for _ in range(calls):
+        worksheet.get_values("A2:E")
+    direct_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(calls):
+        connection.get_values("A2:E")
+    wrapped_s = time.perf_counter() - start
+
+    return {
+        "reruns": reruns,
+        "opens_per_rerun_connection": opens_before,
+        "opens_shared_connection": opens[0],
+        "simulated_per_rerun_connection": summarize(before),
+        "simulated_shared_connection": summarize(after),
+        "simulated_speedup": round(statistics.mean(before) / statistics.mean(after), 1),
+        "sheet_connection_overhead_us": round((wrapped_s - direct_s) / calls * 1e6, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=50)
+    parser.add_argument("--auth-latency", type=float, default=0.15, help="durée simulée de l'échange OAuth (s)")
+    parser.add_argument("--open-latency", type=float, default=0.1, help="durée simulée de open_by_key (s)")
+    parser.add_argument("--read-latency", type=float, default=0.05, help="durée simulée d'une lecture (s)")
+    args = parser.parse_args()
+    print(json.dumps(run(args.reruns, args.auth_latency, args.open_latency, args.read_latency), indent=2))
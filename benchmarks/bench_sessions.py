@@ -0,0 +1,210 @@
+"""
+Mémoire par session Streamlit avec des milliers de sessions simultanées (hors Streamlit).
+Ancienne représentation : tout dans st.session_state (static_answers, personal_info en double, conversation,
+résumé, copie complète du profil enregistré, un pool d'un thread par session pour le résumé en arrière-plan).
+Nouvelle représentation : valeurs légères dans st.session_state, données lourdes dans SessionManager
+(sessions.py) ; conversation déchargée dans SQLite une fois le profil enregistré, sessions inactives évincées.
+Les sessions sont jouées en parallèle (questionnaire, chatbot, résumé, enregistrement, choix du mode de
+contact) ; après éviction, chaque session est rechargée et comparée à ce qui a été joué.
+
+Lancer depuis la racine du dépôt :
+    python -m benchmarks.bench_sessions --sessions 5000 --workers 16 --thread-sessions 1000
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from benchmarks.bench_rerun import summarize
+from benchmarks.bench_startup import rss_mb
+from benchmarks.synthetic import full_profile
+from sessions import SessionManager, SessionStore, profile_digest
+
+PERSONAL_KEYS = ("gender", "age", "location")
+
+
+class ManualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def scripts(count, seed):
+    """Contenu joué par chaque session : profil complet (ville en texte libre saisi, donc une chaîne par session)."""
+    rng = random.Random(seed)
+    profiles = []
+    for _ in range(count):
+        profile = full_profile(rng)
+        profile["static_answers"]["location"] = "".join(list(profile["static_answers"]["location"]))
+        profiles.append(profile)
+    return profiles
+
+
+def legacy_session(i, profile):
+    """st.session_state d'une session terminée, avant le gestionnaire de sessions (sans le pool de threads)."""
+    static = profile["static_answers"]
+    summary_done = Future()
+    summary_done.set_result(profile["profile_summary"])
+    state = {
+        "page": "matching", "user_id": f"user{i}", "question_count": 3, "interaction_choice": None,
+        "is_admin": False,
+        "personal_info": {key: static[key] for key in PERSONAL_KEYS},
+        "static_answers": dict(static),
+        "chat_history": [dict(m) for m in profile["chat_history"]],
+        "profile_summary": profile["profile_summary"],
+        "summary_prefetch": ("key", summary_done),
+    }
+    state["stored_profile"] = copy.deepcopy({key: state[key] for key in
+                                             ("static_answers", "chat_history", "profile_summary")})
+    return state
+
+
+def light_session(i, key):
+    """Valeurs restant dans st.session_state avec le gestionnaire de sessions."""
+    return {"session_key": key, "page": "matching", "user_id": f"user{i}", "question_count": 3,
+            "interaction_choice": None, "is_admin": False, "stored_profile": None}
+
+
+def play(manager, key, profile):
+    """Parcours d'une session sur le gestionnaire : questionnaire page par page puis chatbot et résumé."""
+    static = profile["static_answers"]
+    keys = list(static)
+    for start in range(0, len(keys), 3):
+        manager.get(key).static_answers.update({k: static[k] for k in keys[start:start + 3]})
+    for message in profile["chat_history"]:
+        manager.get(key).chat_history.append(dict(message))
+    manager.get(key).profile_summary = profile["profile_summary"]
+
+
+def measure(func):
+    """Renvoie (résultat, octets alloués encore vivants, secondes)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def legacy_threads(count):
+    """RSS ajouté par un pool d'un thread par session (ancien résumé en arrière-plan), en Mo."""
+    before = rss_mb()
+    pools = [ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary-prefetch") for _ in range(count)]
+    for future in [pool.submit(lambda: None) for pool in pools]:
+        future.result()
+    delta = rss_mb() - before
+    for pool in pools:
+        pool.shutdown()
+    return delta
+
+
+def run(sessions, workers, thread_sessions, seed, workdir):
+    os.makedirs(workdir, exist_ok=True)
+    profiles = scripts(sessions, seed)
+    per = lambda size: round(size / sessions)
+
+    legacy, legacy_bytes, _ = measure(lambda: [legacy_session(i, p) for i, p in enumerate(profiles)])
+    del legacy
+
+    clock = ManualClock()
+    store = SessionStore(os.path.join(workdir, "onelove_profiles.db"))
+    manager = SessionManager(store, idle_timeout=1800, sweep_interval=float("inf"), clock=clock)
+    keys = [f"session{i}" for i in range(sessions)]
+    pool = ThreadPoolExecutor(max_workers=workers)
+    # Mémoire suivie sur tout le parcours : chaque étape compte aussi ce qu'elle libère
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+
+    # Toutes les sessions jouées en même temps, jusqu'au résumé (conversation en mémoire)
+    start = time.perf_counter()
+    list(pool.map(lambda i: play(manager, keys[i], profiles[i]), range(sessions)))
+    light = [light_session(i, key) for i, key in enumerate(keys)]
+    play_s = time.perf_counter() - start
+    active_bytes = tracemalloc.get_traced_memory()[0] - baseline
+
+    # Profils enregistrés : empreinte dans st.session_state, conversation déchargée
+    def finish(i):
+        record = manager.get(keys[i])
+        light[i]["stored_profile"] = profile_digest(record.to_dict())
+        manager.offload(keys[i])
+        record.static_answers["interaction_choice"] = "discuter par chat"
+    start = time.perf_counter()
+    list(pool.map(finish, range(sessions)))
+    offload_s = time.perf_counter() - start
+    offloaded_bytes = tracemalloc.get_traced_memory()[0] - baseline
+
+    # Une session sur deux reste inactive au-delà du délai : évincée au ménage suivant
+    clock.now = 1000.0
+    for key in keys[1::2]:
+        manager.get(key)
+    clock.now = manager.idle_timeout + 500.0
+    start = time.perf_counter()
+    evicted = manager.sweep()
+    sweep_s = time.perf_counter() - start
+    resident = manager.stats()["resident"]
+    swept_bytes = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    # Retour des utilisateurs : sessions rechargées et comparées à ce qui a été joué
+    restore_times, get_times, mismatches = [], [], 0
+    for i, key in enumerate(keys):
+        start = time.perf_counter()
+        record = manager.get(key)
+        (restore_times if i % 2 == 0 else get_times).append(time.perf_counter() - start)
+        expected = dict(profiles[i]["static_answers"], interaction_choice="discuter par chat")
+        if (record.static_answers != expected or record.chat_history != profiles[i]["chat_history"]
+                or record.profile_summary != profiles[i]["profile_summary"]):
+            mismatches += 1
+    pool.shutdown()
+
+    return {
+        "sessions": sessions,
+        "workers": workers,
+        "legacy_bytes_per_session": per(legacy_bytes),
+        "legacy_thread_rss_kb_per_session": round(legacy_threads(thread_sessions) * 1024 / max(thread_sessions, 1), 1),
+        "active_bytes_per_session": per(active_bytes),
+        "offloaded_bytes_per_session": per(offloaded_bytes),
+        "after_sweep_bytes_per_session": per(swept_bytes),
+        "resident_after_sweep": resident,
+        "evicted": evicted,
+        "play_s": round(play_s, 3),
+        "offload_s": round(offload_s, 3),
+        "sweep_s": round(sweep_s, 3),
+        "get_resident": summarize(get_times),
+        "get_restored": summarize(restore_times),
+        "mismatches": mismatches,
+        "db_mb": round(os.path.getsize(os.path.join(workdir, "onelove_profiles.db")) / 2 ** 20, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--workers", type=int, default=16, help="threads jouant les sessions en parallèle")
+    parser.add_argument("--thread-sessions", type=int, default=1000,
+                        help="sessions de l'ancienne représentation pour mesurer le coût d'un thread par session")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_sessions.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [run(n, args.workers, args.thread_sessions, args.seed, os.path.join(workdir, str(n)))
+                   for n in args.sessions]
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
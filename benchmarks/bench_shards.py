@@ -0,0 +1,129 @@
+"""
+Profils répartis en shards (une feuille par genre, voir shards.py) sur un classeur en mémoire à plusieurs
+feuilles (FakeSpreadsheet), avec une latence par appel et un coût par ligne lue.
+Mesure la première synchronisation complète de la copie locale (une seule feuille contre tous les shards
+lus en parallèle), puis, pour des profils soumis un par un par SheetWriter (nouveaux profils et mises à
+jour), la synchronisation de page_matching : shards admissibles seulement contre tous les shards.
+Vérifie que les deux copies locales contiennent les mêmes profils et donnent les mêmes meilleurs scores,
+et que les mises à jour ne créent pas de doublons.
+
+Lancer depuis la racine du dépôt :
+    python -m benchmarks.bench_shards --profiles 20000 --queries 20 --latency 0.05 --row-latency 0.00002
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+
+from benchmarks.bench_rerun import summarize
+from benchmarks.fakes import FakeSpreadsheet
+from benchmarks.synthetic import matching_profile, sheet_rows
+from profile_store import ProfileStore
+from sheet_writer import SheetWriter
+from shards import ShardedSheets, eligible_shards, shard_of_row, shard_title
+
+
+def build(profiles, seed, latency, row_latency):
+    """Mêmes profils dans une seule feuille et répartis dans les feuilles des shards."""
+    rows = sheet_rows(profiles, seed=seed)
+    single = FakeSpreadsheet(latency, row_latency)
+    single.sheet1.rows.extend(rows)
+    sharded = FakeSpreadsheet(latency, row_latency)
+    for row in rows:
+        sharded.worksheet(shard_title(shard_of_row(row))).rows.append(row)
+    sheets = ShardedSheets(lambda shard: sharded.worksheet(shard_title(shard)))
+    return single, sharded, sheets
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def top_scores(store, static, k=10):
+    return [score for _, score in store.engine().top_k(static, k=k)]
+
+
+def run(profiles, queries, seed, latency, row_latency, workdir):
+    os.makedirs(workdir, exist_ok=True)
+    single, sharded, sheets = build(profiles, seed, latency, row_latency)
+    rng = random.Random(seed + 1)
+
+    # Première synchronisation complète
+    flat = ProfileStore(os.path.join(workdir, "single.db"))
+    cold_single = timed(lambda: flat.sync(single.sheet1))
+    eligible_store = ProfileStore(os.path.join(workdir, "eligible.db"))
+    cold_sharded = timed(lambda: eligible_store.sync_shards(sheets))
+    all_store = ProfileStore(os.path.join(workdir, "all.db"))
+    all_store.sync_shards(sheets)
+    assert sorted(r[0] for r in flat.records()) == sorted(r[0] for r in eligible_store.records())
+    mismatches = sum(top_scores(flat, s) != top_scores(eligible_store, s)
+                     for s in (matching_profile(rng)["static_answers"] for _ in range(20)))
+
+    # Profils soumis un par un : moitié nouveaux profils, moitié mises à jour d'utilisateurs existants (même genre)
+    writer = SheetWriter(sheets, store=all_store, flush_interval=3600)
+    eligible_times, all_times, eligible_calls, all_calls = [], [], [], []
+    for i in range(queries):
+        profile = matching_profile(rng)
+        if i % 2 == 0:
+            user_id = f"new{i}"
+        else:
+            user_id = f"user{rng.randrange(profiles)}"
+            profile["static_answers"]["gender"] = all_store.get_profile(user_id).static_answers()["gender"]
+        writer.submit(user_id, [user_id, f"2024-02-01 00:00:{i % 60:02d}", json.dumps(profile, ensure_ascii=False), 0, ""])
+        writer.flush()
+        static = profile["static_answers"]
+        calls = sharded.calls
+        eligible_times.append(timed(lambda: eligible_store.sync_shards(sheets, eligible_shards(static))))
+        eligible_calls.append(sharded.calls - calls)
+        calls = sharded.calls
+        all_times.append(timed(lambda: all_store.sync_shards(sheets)))
+        all_calls.append(sharded.calls - calls)
+
+    user_ids = [row[0] for shard in sheets.shards for row in sharded.worksheet(shard_title(shard)).rows[1:]]
+    return {
+        "profiles": profiles,
+        "rows_per_shard": {shard_title(shard) or "sheet1": len(sharded.worksheet(shard_title(shard)).rows) - 1
+                           for shard in sheets.shards},
+        "cold_sync_single_sheet_s": round(cold_single, 3),
+        "cold_sync_sharded_parallel_s": round(cold_sharded, 3),
+        "top_k_mismatches": mismatches,
+        "sync_eligible_shards": summarize(eligible_times),
+        "sync_all_shards": summarize(all_times),
+        "api_calls_eligible_shards": sum(eligible_calls) / queries,
+        "api_calls_all_shards": sum(all_calls) / queries,
+        "rows_written": writer.rows_written,
+        "rows_updated": writer.rows_updated,
+        "duplicate_rows": len(user_ids) - len(set(user_ids)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, nargs="+", default=[20_000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.05, help="latence de chaque appel à la Sheet (s)")
+    parser.add_argument("--row-latency", type=float, default=0.00002, help="coût de chaque ligne lue (s)")
+    parser.add_argument("--output", default="bench_shards.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [run(n, args.queries, args.seed, args.latency, args.row_latency, os.path.join(workdir, str(n)))
+                   for n in args.profiles]
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "latency_s": args.latency,
+        "row_latency_s": args.row_latency,
+        "queries": args.queries,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
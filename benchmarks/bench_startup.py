@@ -0,0 +1,156 @@
+"""
+Démarrage à froid de l'application, page par page : chaque page est affichée dans un processus neuf
+(streamlit.testing AppTest), avec une Google Sheet en mémoire et un faux serveur OpenAI local.
+Mesure l'import de Streamlit, le premier affichage de la page (imports et clients compris), un rerun,
+la mémoire résidente et les dépendances lourdes chargées. Avec --importtime, ajoute les imports
+les plus coûteux de chaque page (python -X importtime).
+
+Lancer depuis la racine du dépôt :
+    python -m benchmarks.bench_startup --pages login values chatbot result matching --runs 3
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["pandas", "numpy", "pyarrow", "openai", "aiohttp", "gspread", "oauth2client", "requests", "tiktoken"]
+# Pages qui lisent ou écrivent la Google Sheet : la feuille en mémoire remplace la connexion Google
+SHEET_PAGES = {"matching", "diagnostics"}
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def child(page, app, profiles):
+    """Affiche 'page' dans ce processus et écrit les mesures en JSON sur la sortie standard."""
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    streamlit_s = time.perf_counter() - start
+
+    if page in SHEET_PAGES:
+        import clients
+        from benchmarks.fakes import FakeSpreadsheet
+        from benchmarks.synthetic import sheet_rows
+        spreadsheet = FakeSpreadsheet()
+        spreadsheet.sheet1.rows.extend(sheet_rows(profiles))
+        clients.open_google_worksheet = spreadsheet.open_worksheet
+
+    at = AppTest.from_file(app, default_timeout=120)
+    at.secrets["openai"] = {"api_key": "bench"}
+    at.secrets["GCP_SERVICE_ACCOUNT"] = "{}"
+    at.secrets["admin"] = {"password": "bench"}
+    at.session_state["page"] = page
+    at.session_state["user_id"] = "bench_user"
+    # Session évincée puis rechargée par le gestionnaire de sessions (fichier de la copie locale, dossier courant)
+    from sessions import SessionStore
+    SessionStore("onelove_profiles.db").save("bench_session", {
+        "static_answers": {"gender": "Femme", "age": 30, "location": "Paris"},
+        "chat_history": [{"role": "assistant", "content": "Bonjour !"},
+                         {"role": "user", "content": "Je cherche une relation sérieuse."}],
+        "profile_summary": "",
+    })
+    at.session_state["session_key"] = "bench_session"
+
+    start = time.perf_counter()
+    at.run()
+    first_s = time.perf_counter() - start
+    start = time.perf_counter()
+    at.run()
+    rerun_s = time.perf_counter() - start
+
+    print(json.dumps({
+        "streamlit_import_s": round(streamlit_s, 3),
+        "first_render_s": round(first_s, 3),
+        "rerun_s": round(rerun_s, 3),
+        "rss_mb": rss_mb(),
+        "heavy_modules": [m for m in HEAVY_MODULES if m in sys.modules],
+        "exceptions": [e.value for e in at.exception],
+    }))
+
+
+def top_imports(stderr, count):
+    """Imports de premier niveau les plus coûteux (temps cumulé) d'une sortie -X importtime."""
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match and len(match.group(3)) == 1:
+            entries.append((int(match.group(2)), match.group(4)))
+    entries.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in entries[:count]]
+
+
+def run_page(page, app, profiles, runs, importtime, api_base):
+    samples = []
+    imports = None
+    for i in range(runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            # Fichiers locaux (SQLite, mesures) créés dans un dossier vide : vrai démarrage à froid
+            shutil.copy(os.path.join(os.path.dirname(app), "OneLove_IA.png"), workdir)
+            cmd = [sys.executable]
+            if importtime and i == 0:
+                cmd += ["-X", "importtime"]
+            cmd += ["-m", "benchmarks.bench_startup", "--child", page, "--app", app, "--profiles", str(profiles)]
+            env = dict(os.environ, PYTHONPATH=ROOT, OPENAI_API_BASE=api_base)
+            done = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True, check=True)
+        samples.append(json.loads(done.stdout.strip().splitlines()[-1]))
+        if importtime and i == 0:
+            imports = top_imports(done.stderr, 15)
+
+    result = {"page": page}
+    for key in ("streamlit_import_s", "first_render_s", "rerun_s", "rss_mb"):
+        result[key] = round(statistics.median(s[key] for s in samples), 3)
+    result["heavy_modules"] = samples[-1]["heavy_modules"]
+    result["exceptions"] = samples[-1]["exceptions"]
+    if imports is not None:
+        result["top_imports"] = imports
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", nargs="+", default=["login", "values", "chatbot", "result", "matching"])
+    parser.add_argument("--runs", type=int, default=3, help="processus lancés par page (médiane)")
+    parser.add_argument("--profiles", type=int, default=1000, help="profils dans la Sheet en mémoire")
+    parser.add_argument("--app", default=os.path.join(ROOT, "onelove.py"))
+    parser.add_argument("--importtime", action="store_true")
+    parser.add_argument("--output", default="bench_startup.json")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.app, args.profiles)
+        sys.exit(0)
+
+    from benchmarks.fakes import FakeOpenAIServer
+
+    with FakeOpenAIServer() as server:
+        results = [run_page(page, os.path.abspath(args.app), args.profiles, args.runs, args.importtime,
+                            server.api_base)
+                   for page in args.pages]
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
@@ -0,0 +1,221 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeWorksheet:
+    """
+    Feuille gspread en mémoire pour les benchmarks : mêmes méthodes que celles utilisées par l'application
+    (append_row, append_rows, get_all_values, lectures de plage avec get_values et batch_get, mises à jour
+    de lignes avec batch_update), avec une latence réseau simulée par appel et, pour get_values,
+    par ligne lue (row_latency).
+    """
+
+    def __init__(self, header=None, latency=0.0, row_latency=0.0):
+        self.rows = [list(header or ["user_id", "timestamp", "data", "score", "feedback"])]
+        self.latency = latency
+        self.row_latency = row_latency
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _request(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def row_count(self):
+        return len(self.rows)
+
+    def append_row(self, row):
+        self._request()
+        with self.lock:
+            self.rows.append([str(v) for v in row])
+
+    def append_rows(self, rows):
+        self._request()
+        with self.lock:
+            self.rows.extend([str(v) for v in row] for row in rows)
+
+    def get_all_values(self):
+        self._request()
+        with self.lock:
+            return [list(r) for r in self.rows]
+
+    def get_values(self, range_name):
+        """Lecture d'une plage 'A<début>:E' ou 'A<début>:E<fin>' (colonnes ignorées)."""
+        self._request()
+        match = re.match(r"[A-Z]+(\d+):[A-Z]+(\d*)$", range_name)
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else None
+        with self.lock:
+            if start > len(self.rows):
+                raise Exception(f"Range ({range_name}) exceeds grid limits")
+            values = [list(r) for r in self.rows[start - 1:end]]
+        if self.row_latency:
+            time.sleep(self.row_latency * len(values))
+        return values
+
+    def batch_get(self, ranges):
+        """Lecture de plusieurs cellules 'A<ligne>' en un appel (seule la première colonne est lue)."""
+        self._request()
+        values = []
+        with self.lock:
+            for range_name in ranges:
+                row = int(re.match(r"[A-Z]+(\d+)$", range_name).group(1))
+                values.append([[self.rows[row - 1][0]]] if row <= len(self.rows) else [])
+        return values
+
+    def batch_update(self, data):
+        """Écriture de lignes entières : data = [{"range": "A<ligne>:E<ligne>", "values": [ligne]}, ...]."""
+        self._request()
+        with self.lock:
+            for entry in data:
+                row = int(re.match(r"[A-Z]+(\d+):", entry["range"]).group(1))
+                self.rows[row - 1] = [str(v) for v in entry["values"][0]]
+        return {"totalUpdatedRows": len(data)}
+
+
+class FakeSpreadsheet:
+    """
+    Classeur en mémoire à plusieurs feuilles (FakeWorksheet) pour les shards : la première feuille
+    (sheet1) et des feuilles nommées, créées à leur première ouverture.
+    """
+
+    def __init__(self, latency=0.0, row_latency=0.0):
+        self.latency = latency
+        self.row_latency = row_latency
+        self.sheet1 = FakeWorksheet(latency=latency, row_latency=row_latency)
+        self.worksheets = {}
+        self.lock = threading.Lock()
+
+    def worksheet(self, title=None):
+        if title is None:
+            return self.sheet1
+        with self.lock:
+            if title not in self.worksheets:
+                self.worksheets[title] = FakeWorksheet(latency=self.latency, row_latency=self.row_latency)
+            return self.worksheets[title]
+
+    def open_worksheet(self, service_account_info, sheet_key, title=None, header=None):
+        """Remplace clients.open_google_worksheet (même signature)."""
+        return self.worksheet(title)
+
+    @property
+    def calls(self):
+        return self.sheet1.calls + sum(w.calls for w in self.worksheets.values())
+
+
+def fake_open_worksheet(worksheet, auth_latency=0.0, open_latency=0.0):
+    """Renvoie une fonction qui simule l'authentification OAuth puis l'ouverture du classeur."""
+    def open_worksheet():
+        time.sleep(auth_latency)
+        time.sleep(open_latency)
+        return worksheet
+    return open_worksheet
+
+
+class FakeOpenAIServer:
+    """
+    Faux point d'accès OpenAI local (/v1/chat/completions) : renvoie toujours 'reply',
+    d'un bloc ou en événements server-sent events (stream=True), un mot par chunk.
+    Peut simuler des réponses lentes, des limites de débit (429) et des erreurs en cours de streaming,
+    et compte les requêtes simultanées.
+    Utilisation : with FakeOpenAIServer() as server: openai.api_base = server.api_base
+    """
+
+    def __init__(self, reply="Bonjour ! Que recherchez-vous en amour ?", first_token_delay=0.0, token_delay=0.0,
+                 rate_limited=0, retry_after=None, fail_after=None):
+        self.reply = reply
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        # Les 'rate_limited' premières requêtes reçoivent une erreur 429 (avec Retry-After si fourni)
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        # Les réponses en streaming s'interrompent par un événement d'erreur après 'fail_after' mots
+        self.fail_after = fail_after
+        self.requests = []
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.api_base = f"http://127.0.0.1:{self.httpd.server_port}/v1"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server.lock:
+                    server.requests.append(body)
+                    limited = len(server.requests) <= server.rate_limited
+                    server.concurrent += 1
+                    server.max_concurrent = max(server.max_concurrent, server.concurrent)
+                try:
+                    self._respond(body, limited)
+                finally:
+                    with server.lock:
+                        server.concurrent -= 1
+
+            def _respond(self, body, limited):
+                if limited:
+                    headers = {"Retry-After": str(server.retry_after)} if server.retry_after is not None else {}
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, headers)
+                    return
+                time.sleep(server.first_token_delay)
+                if body.get("stream"):
+                    self._stream(body)
+                else:
+                    self._send_json(200, {
+                        "id": "chatcmpl-fake", "object": "chat.completion", "model": body["model"],
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": server.reply}}],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                    })
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                words = re.findall(r"\S+\s*", server.reply)
+                for i, word in enumerate(words):
+                    if i == server.fail_after:
+                        error = {"error": {"message": "The server had an error while processing your request.",
+                                           "type": "server_error"}}
+                        self.wfile.write(f"data: {json.dumps(error)}\n\n".encode("utf-8"))
+                        return
+                    if i:
+                        time.sleep(server.token_delay)
+                    chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "model": body["model"],
+                             "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
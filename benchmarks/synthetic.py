@@ -0,0 +1,92 @@
+import json
+import random
+
+from questions import CHOICES, MULTI_CHOICES, QUESTION_ORDER, SLIDER_RANGE, SLIDERS
+
+
+# Orientation : pas encore demandée par le questionnaire, mais utilisée par partner_allowed
+ORIENTATIONS = ["hétérosexuel(le)", "homosexuel(le)", "bisexuel(le)", "pansexuel(le)"]
+ORIENTATION_WEIGHTS = [80, 10, 7, 3]
+# Mots utilisés pour remplir les conversations et les résumés
+COUPLE_VALUES = ["Confiance", "Humour", "Fidélité", "Ambition", "Tendresse", "Respect", "Aventure", "Famille"]
+IDEAL_DAYS = ["Randonnée", "Musée", "Canapé et série", "Soirée entre amis", "Plage", "Restaurant"]
+
+
+# Réponses du questionnaire (pages values à experience)
+CITIES = ["Paris", "Lyon", "Marseille", "Toulouse", "Bordeaux", "Lille", "Nantes", "Nice", "Strasbourg", "Rennes"]
+
+
+def questionnaire_answers(rng):
+    """Réponses aléatoires au questionnaire, avec exactement les options proposées par les pages."""
+    answers = {}
+    for key in QUESTION_ORDER:
+        if key == "age":
+            answers[key] = rng.randint(18, 70)
+        elif key == "location":
+            answers[key] = rng.choice(CITIES)
+        elif key in CHOICES:
+            answers[key] = rng.choice(CHOICES[key])
+        elif key in MULTI_CHOICES:
+            options = MULTI_CHOICES[key]
+            answers[key] = rng.sample(options, rng.randint(0, len(options)))
+        elif key in SLIDERS:
+            answers[key] = rng.randint(*SLIDER_RANGE)
+    return answers
+
+
+def scoring_answers(rng):
+    """Réponses aléatoires au questionnaire (critères du schéma de score), plus l'orientation."""
+    answers = questionnaire_answers(rng)
+    answers["orientation"] = rng.choices(ORIENTATIONS, ORIENTATION_WEIGHTS)[0]
+    return answers
+
+
+def generate_profiles(count, seed=0, start=0):
+    """Génère count couples (user_id, static_answers) reproductibles."""
+    rng = random.Random(seed * 1_000_003 + start)
+    for i in range(start, start + count):
+        yield f"user{i}", scoring_answers(rng)
+
+
+def chat_history(rng, static_answers):
+    """Conversation de la page chatbot : message système, question d'ouverture et 3 échanges."""
+    history = [
+        {"role": "system", "content": (
+            "Tu es un chatbot de matchmaking. Tu connais déjà les informations personnelles et psychologiques de l'utilisateur : "
+            f"{static_answers}. Pose 3 questions complémentaires maximum sur sa personnalité et ses attentes, "
+            "sans insérer de terminaison automatique."
+        )},
+        {"role": "assistant", "content": "Bonjour ! Peux-tu décrire en quelques mots ce que vous recherchez en amour ?"},
+    ]
+    for i in range(3):
+        history.append({"role": "user", "content": " ".join(rng.choice(IDEAL_DAYS + COUPLE_VALUES) for _ in range(25))})
+        if i < 2:
+            history.append({"role": "assistant", "content": "Merci ! Et qu'est-ce qui compte le plus pour toi au quotidien ?"})
+    return history
+
+
+def full_profile(rng):
+    """Contenu complet de la colonne 'data' : static_answers, chat_history et profile_summary."""
+    static = questionnaire_answers(rng)
+    return {
+        "static_answers": static,
+        "chat_history": chat_history(rng, static),
+        "profile_summary": " ".join(rng.choice(COUPLE_VALUES) for _ in range(120)),
+    }
+
+
+def matching_profile(rng):
+    """Profil complet tel qu'enregistré par page_matching, avec l'orientation utilisée par partner_allowed."""
+    profile = full_profile(rng)
+    profile["static_answers"]["orientation"] = rng.choices(ORIENTATIONS, ORIENTATION_WEIGHTS)[0]
+    return profile
+
+
+def sheet_rows(count, seed=0, start=0):
+    """Lignes de la Google Sheet (user_id, timestamp, data JSON, score, feedback) pour count profils."""
+    rng = random.Random(seed * 1_000_003 + start)
+    return [
+        [f"user{i}", f"2024-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}",
+         json.dumps(matching_profile(rng), ensure_ascii=False), "0", ""]
+        for i in range(start, start + count)
+    ]
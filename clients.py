@@ -0,0 +1,106 @@
+import threading
+
+# gspread, oauth2client, requests et openai sont importés à la demande, dans les fonctions
+# qui s'en servent : importer ce module ne coûte rien aux pages qui n'ouvrent aucune connexion.
+
+
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+HTTP_TIMEOUT = 30  # secondes
+
+
+# =============================================================================
+# 1. GOOGLE SHEETS
+# =============================================================================
+def open_google_worksheet(service_account_info, sheet_key, title=None, header=None):
+    """
+    Authentifie le compte de service et ouvre la feuille 'title' du classeur (la première si title est None).
+    Une feuille absente est créée, avec 'header' comme première ligne.
+    """
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    creds = ServiceAccountCredentials.from_json_keyfile_dict(service_account_info, SCOPES)
+    # gspread garde une AuthorizedSession (requests) : connexions HTTP réutilisées
+    # et jeton OAuth rafraîchi automatiquement à son expiration.
+    client = gspread.authorize(creds)
+    client.set_timeout(HTTP_TIMEOUT)
+    spreadsheet = client.open_by_key(sheet_key)
+    if title is None:
+        return spreadsheet.sheet1
+    try:
+        return spreadsheet.worksheet(title)
+    except gspread.exceptions.WorksheetNotFound:
+        worksheet = spreadsheet.add_worksheet(title, rows=1, cols=len(header or []) or 26)
+        if header:
+            worksheet.update([header], "A1")
+        return worksheet
+
+
+def _is_connection_error(error):
+    """Erreurs pour lesquelles il vaut mieux rouvrir la connexion avant de réessayer."""
+    import gspread
+    import requests
+
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return True
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.response.status_code == 401
+    return False
+
+
+class SheetConnection:
+    """
+    Connexion à la Google Sheet partagée par toutes les sessions et tous les reruns d'un processus.
+    S'utilise comme une feuille gspread (sheet.append_row(...), sheet.get_values(...)) :
+    la feuille n'est ouverte qu'au premier appel, et rouverte une fois si la connexion
+    est rompue ou si le jeton a été révoqué.
+    """
+
+    def __init__(self, open_worksheet):
+        # open_worksheet : fonction sans argument qui authentifie et renvoie la feuille
+        self.open_worksheet = open_worksheet
+        self.lock = threading.Lock()
+        self._worksheet = None
+
+    @property
+    def worksheet(self):
+        if self._worksheet is None:
+            with self.lock:
+                if self._worksheet is None:
+                    self._worksheet = self.open_worksheet()
+        return self._worksheet
+
+    def reconnect(self):
+        with self.lock:
+            self._worksheet = self.open_worksheet()
+
+    def call(self, name, *args, **kwargs):
+        """Appelle une méthode de la feuille, avec une reconnexion en cas de connexion rompue."""
+        try:
+            return getattr(self.worksheet, name)(*args, **kwargs)
+        except Exception as e:
+            if not _is_connection_error(e):
+                raise
+            self.reconnect()
+            return getattr(self.worksheet, name)(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attr = getattr(self.worksheet, name)
+        if not callable(attr):
+            return attr
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+
+# =============================================================================
+# 2. OPENAI
+# =============================================================================
+def configure_openai(api_key):
+    """
+    Renseigne la clé d'API du module openai. Les appels passent tous par LLMGateway (llm.py),
+    dont la session aiohttp est partagée par tout le processus.
+    """
+    import openai
+
+    openai.api_key = api_key
@@ -0,0 +1,324 @@
+"""
+Export des profils en fichiers en colonnes (Parquet, ou Arrow IPC pour les lire en mémoire projetée),
+pour les analyses et le matching par lots : plus besoin de relire la Google Sheet (get_all_values)
+ni de décoder la colonne 'data' de chaque ligne.
+
+Les profils sont lus par lots dans la copie locale SQLite (--db), que l'application tient à jour.
+Chaque réponse du questionnaire devient une colonne typée :
+  - choix uniques en catégories ;
+  - choix multiples en listes ;
+  - curseurs et âge en entiers ;
+  - lieu reconnu (geo.py) avec ses coordonnées.
+Les réponses hors vocabulaire restent en JSON dans 'extra'. La conversation et le résumé ne sont pas
+exportés. Les fichiers sont répartis par date d'enregistrement (dossiers date=AAAA-MM-JJ), un découpage
+lu tel quel par pyarrow.dataset, pandas ou DuckDB.
+
+L'export est incrémental. _manifest.json garde le numéro de version (seq) de la dernière ligne exportée.
+Chaque lancement n'ajoute que les lignes apparues depuis, dans de nouveaux fichiers part-<lancement>-*.
+Un profil mis à jour est donc exporté une seconde fois : ne garder que la ligne de plus grand seq
+par user_id, ce que fait latest_profiles().
+
+Exemples, depuis la racine du dépôt :
+    python export.py --db onelove_profiles.db --out export_profils
+    python export.py --db onelove_profiles.db --out export_arrow --format arrow --batch-size 20000
+"""
+import argparse
+import datetime
+import glob
+import json
+import os
+import re
+import sys
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from geo import locate
+from profile_store import SHARD_ROWS, ProfileStore
+from profiles import ABSENT, CODED_FIELDS
+from questions import CHOICES, MULTI_CHOICES, QUESTION_ORDER
+
+
+# Préfixe '_' : ignoré par les lecteurs de datasets (pyarrow, Spark...), comme les fichiers temporaires en '.'
+MANIFEST = "_manifest.json"
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"  # format écrit par store_data_to_sheet
+NO_DATE = "sans_date"  # partition des lignes dont la date est illisible
+_PART = re.compile(r"^part-(\d{5})-\d{4}\.(parquet|arrow)$")
+
+
+# =============================================================================
+# Colonnes
+# =============================================================================
+def _answer_type(key):
+    if key == "location":
+        return pa.string()
+    if key in CHOICES:
+        # Indices dans la liste des options : le même dictionnaire dans tous les fichiers
+        return pa.dictionary(pa.int8(), pa.string())
+    if key in MULTI_CHOICES:
+        return pa.list_(pa.string())
+    return pa.int16()  # curseurs et âge
+
+
+SCHEMA = pa.schema(
+    [("seq", pa.int64()), ("row_index", pa.int64()), ("shard", pa.int8()),
+     ("user_id", pa.string()), ("timestamp", pa.timestamp("s"))]
+    + [(key, _answer_type(key)) for key in QUESTION_ORDER]
+    + [("place", pa.string()), ("lat", pa.float32()), ("lon", pa.float32()),
+       ("extra", pa.string()), ("score", pa.float64()), ("feedback", pa.string())]
+)
+_DICTIONARIES = {key: pa.array(options, pa.string()) for key, options in CHOICES.items()}
+
+
+def schema_fingerprint():
+    return [f"{field.name}: {field.type}" for field in SCHEMA]
+
+
+def parse_timestamp(text):
+    """Date d'enregistrement d'une ligne (datetime sans fuseau), ou None si elle est illisible."""
+    try:
+        return datetime.datetime.strptime(text, TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        try:
+            return datetime.datetime.fromisoformat(text).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return None
+
+
+def _number(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _answer(key, code):
+    if code == ABSENT:
+        return None
+    if key in MULTI_CHOICES:
+        return [option for i, option in enumerate(MULTI_CHOICES[key]) if code & (1 << i)]
+    return code  # indice de l'option pour les choix uniques
+
+
+def batch_table(rows):
+    """
+    Table Arrow d'un lot de lignes de ProfileStore.versions(), et la date (partition) de chaque ligne.
+    Les réponses sont lues dans le profil compact, sans décoder le JSON de 'data'.
+    """
+    columns = {name: [] for name in SCHEMA.names}
+    dates = []
+    for seq, row_index, user_id, timestamp, answers, location, extra, score, feedback in rows:
+        moment = parse_timestamp(timestamp)
+        dates.append(moment.strftime("%Y-%m-%d") if moment else NO_DATE)
+        codes = array("h")
+        if answers is not None:
+            codes.frombytes(answers)
+        # Profil enregistré avant l'ajout de nouvelles questions, ou 'data' illisible
+        codes.extend([ABSENT] * (len(CODED_FIELDS) - len(codes)))
+        for key, code in zip(CODED_FIELDS, codes):
+            columns[key].append(_answer(key, code))
+        place = locate(location)
+        values = {"seq": seq, "row_index": row_index, "shard": row_index // SHARD_ROWS, "user_id": user_id,
+                  "timestamp": moment, "location": location, "place": place.name if place else None,
+                  "lat": place.lat if place else None, "lon": place.lon if place else None,
+                  "extra": extra, "score": _number(score), "feedback": feedback}
+        for name, value in values.items():
+            columns[name].append(value)
+
+    arrays = []
+    for field in SCHEMA:
+        if pa.types.is_dictionary(field.type):
+            indices = pa.array(columns[field.name], pa.int8())
+            arrays.append(pa.DictionaryArray.from_arrays(indices, _DICTIONARIES[field.name]))
+        else:
+            arrays.append(pa.array(columns[field.name], field.type))
+    return pa.Table.from_arrays(arrays, schema=SCHEMA), dates
+
+
+def static_answers(row):
+    """static_answers d'une ligne exportée (dict de latest_profiles().to_pylist()), ou None si 'data' était illisible."""
+    static = {key: row[key] for key in QUESTION_ORDER if row.get(key) is not None}
+    if row.get("extra"):
+        static.update(json.loads(row["extra"]))
+    return static or None
+
+
+# =============================================================================
+# Écriture
+# =============================================================================
+class PartitionWriter:
+    """
+    Fichiers d'un lancement, un par date (dossier date=AAAA-MM-JJ), écrits sous un nom temporaire caché
+    puis renommés par commit(). Au plus max_open fichiers ouverts à la fois : une date revue après la
+    fermeture de son fichier en ouvre un autre (les lignes arrivent à peu près dans l'ordre des dates).
+    """
+
+    def __init__(self, out_dir, run, fmt, max_open=32):
+        self.out_dir = out_dir
+        self.run = run
+        self.fmt = fmt
+        self.max_open = max_open
+        self.writers = OrderedDict()  # date -> writer ouvert, du moins au plus récemment utilisé
+        self.counts = {}  # date -> nombre de fichiers de ce lancement
+        self.paths = []  # (chemin temporaire, chemin final)
+
+    def write(self, date, table):
+        if date in self.writers:
+            self.writers.move_to_end(date)
+        else:
+            if len(self.writers) >= self.max_open:
+                self.writers.popitem(last=False)[1].close()
+            self.writers[date] = self._open(date)
+        self.writers[date].write_table(table)
+
+    def _open(self, date):
+        folder = os.path.join(self.out_dir, f"date={date}")
+        os.makedirs(folder, exist_ok=True)
+        number = self.counts.get(date, 0)
+        self.counts[date] = number + 1
+        name = f"part-{self.run:05d}-{number:04d}{FORMATS[self.fmt]}"
+        path = os.path.join(folder, name)
+        tmp_path = os.path.join(folder, f".{name}.tmp")
+        self.paths.append((tmp_path, path))
+        if self.fmt == "parquet":
+            return pq.ParquetWriter(tmp_path, SCHEMA, compression="zstd")
+        # Arrow IPC sans compression : les colonnes sont lues en place dans le fichier projeté en mémoire
+        return pa.ipc.new_file(tmp_path, SCHEMA)
+
+    def _close_all(self):
+        while self.writers:
+            self.writers.popitem()[1].close()
+
+    def commit(self):
+        """Ferme et renomme les fichiers du lancement ; renvoie leurs chemins."""
+        self._close_all()
+        for tmp_path, path in self.paths:
+            os.replace(tmp_path, path)
+        return [path for _, path in self.paths]
+
+    def abort(self):
+        self._close_all()
+        for tmp_path, _ in self.paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def prepare_output(out_dir, fmt):
+    """
+    Manifeste de l'export de out_dir (nouveau au premier lancement). Les fichiers d'un lancement interrompu
+    avant l'écriture du manifeste sont supprimés : leurs lignes seront exportées de nouveau.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {"format": fmt, "columns": schema_fingerprint(), "last_seq": 0, "runs": 0, "rows": 0}
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest["format"] != fmt or manifest["columns"] != schema_fingerprint():
+        raise SystemExit(f"{out_dir} contient un export d'un autre format ou d'autres colonnes : "
+                         "exporter dans un nouveau dossier.")
+    for folder in glob.glob(os.path.join(out_dir, "date=*")):
+        for name in os.listdir(folder):
+            match = _PART.match(name)
+            if name.endswith(".tmp") or (match and int(match.group(1)) >= manifest["runs"]):
+                os.remove(os.path.join(folder, name))
+    return manifest
+
+
+def write_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+
+def _by_date(dates):
+    """{date: positions} dans l'ordre de première apparition."""
+    groups = {}
+    for position, date in enumerate(dates):
+        groups.setdefault(date, []).append(position)
+    return groups
+
+
+def export_profiles(store, out_dir, fmt="parquet", batch_size=50_000, max_open=32):
+    """
+    Exporte dans out_dir les lignes du ProfileStore apparues depuis le dernier export, par lots de batch_size
+    lignes (un groupe de lignes par date et par lot). Renvoie un résumé : lignes et fichiers écrits, dernier seq.
+    """
+    manifest = prepare_output(out_dir, fmt)
+    if store.seq < manifest["last_seq"]:
+        raise SystemExit("La copie locale a été recréée depuis le dernier export : exporter dans un nouveau dossier.")
+    writer = PartitionWriter(out_dir, manifest["runs"], fmt, max_open)
+    last_seq, rows = manifest["last_seq"], 0
+    try:
+        while True:
+            batch = store.versions(last_seq, batch_size)
+            if not batch:
+                break
+            table, dates = batch_table(batch)
+            for date, positions in _by_date(dates).items():
+                writer.write(date, table.take(pa.array(positions, pa.int64())))
+            last_seq = batch[-1][0]
+            rows += len(batch)
+    except BaseException:
+        writer.abort()
+        raise
+    files = writer.commit()
+    if rows:
+        manifest.update(last_seq=last_seq, runs=manifest["runs"] + 1, rows=manifest["rows"] + rows,
+                        exported_at=datetime.datetime.now().isoformat(timespec="seconds"))
+    write_manifest(out_dir, manifest)
+    return {"rows": rows, "files": files, "last_seq": last_seq, "total_rows": manifest["rows"]}
+
+
+# =============================================================================
+# Lecture
+# =============================================================================
+def open_dataset(out_dir):
+    """Dataset pyarrow de toutes les lignes exportées (colonne de partition 'date'), fichiers projetés en mémoire."""
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+
+    with open(os.path.join(out_dir, MANIFEST), encoding="utf-8") as f:
+        fmt = json.load(f)["format"]
+    partitioning = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+    return ds.dataset(out_dir, schema=SCHEMA.append(pa.field("date", pa.string())),
+                      format="parquet" if fmt == "parquet" else "ipc",
+                      partitioning=partitioning, filesystem=fs.LocalFileSystem(use_mmap=True))
+
+
+def latest_profiles(out_dir, columns=None, filter=None):
+    """
+    Table de la dernière version exportée (plus grand seq) du profil de chaque utilisateur,
+    dans l'ordre des versions, comme ProfileStore.profiles(). columns : colonnes à lire (toutes par défaut).
+    """
+    if columns is not None:
+        columns = list(dict.fromkeys(["seq", "user_id", *columns]))
+    table = open_dataset(out_dir).to_table(columns=columns, filter=filter).sort_by("seq")
+    positions = table.append_column("position", pa.array(np.arange(table.num_rows)))
+    last = positions.group_by("user_id", use_threads=False).aggregate([("position", "max")])
+    return table.take(np.sort(last["position_max"].to_numpy()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="copie locale SQLite des profils (onelove_profiles.db)")
+    parser.add_argument("--out", required=True, help="dossier de l'export (date=*/part-*, _manifest.json)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet",
+                        help="parquet (compressé) ou arrow (IPC, à projeter en mémoire)")
+    parser.add_argument("--batch-size", type=int, default=50_000, help="lignes lues et écrites par lot")
+    parser.add_argument("--max-open", type=int, default=32, help="fichiers ouverts au plus en même temps")
+    args = parser.parse_args(argv)
+
+    result = export_profiles(ProfileStore(args.db), args.out, fmt=args.format, batch_size=args.batch_size,
+                             max_open=args.max_open)
+    print(f"{result['rows']} lignes exportées dans {len(result['files'])} fichiers "
+          f"({result['total_rows']} au total), dernière version {result['last_seq']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import csv
+import difflib
+import functools
+import math
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+
+# Table des villes et régions reconnues (hors ligne) : nom, type, région, latitude, longitude,
+# population et autres noms séparés par '|'. Une région est placée sur sa préfecture.
+CITIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "geo_cities.csv")
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Mots ignorés dans une réponse libre ("Paris 15e", "Lyon, France", "Lille cedex"...)
+_STOP_WORDS = {"france", "cedex", "arrondissement", "arr", "centre", "ville", "region", "en", "dans", "la", "le"}
+_ABBREVIATIONS = {"st": "saint", "ste": "sainte"}
+_NUMBER = re.compile(r"^\d+(e|er|eme|ieme)?$")
+
+
+class Place:
+    """Ville ou région de la table, avec ses coordonnées."""
+
+    __slots__ = ("name", "kind", "region", "lat", "lon", "population")
+
+    def __init__(self, name, kind, region, lat, lon, population=0):
+        self.name = name
+        self.kind = kind
+        self.region = region
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.population = int(population or 0)
+
+    def __repr__(self):
+        return f"Place({self.name!r}, {self.lat}, {self.lon})"
+
+
+def normalize(text):
+    """Forme comparable d'un nom de lieu : minuscules, sans accents, ponctuation, numéros ni mots vides."""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii").lower()
+    words = re.sub(r"[^a-z0-9]+", " ", text).split()
+    words = [_ABBREVIATIONS.get(w, w) for w in words if not _NUMBER.match(w)]
+    kept = [w for w in words if w not in _STOP_WORDS]
+    # "Le Havre", "La Rochelle" : les articles ne sont retirés que s'il reste un nom
+    return " ".join(kept) if kept else " ".join(words)
+
+
+@functools.lru_cache(maxsize=1)
+def load_places(path=CITIES_PATH):
+    """{nom normalisé: Place} pour les noms et les autres noms de la table."""
+    places = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            place = Place(row["name"], row["kind"], row["region"], row["lat"], row["lon"], row["population"])
+            for name in [row["name"]] + [a for a in row["aliases"].split("|") if a]:
+                places.setdefault(normalize(name), place)
+    return places
+
+
+@functools.lru_cache(maxsize=65536)
+def locate(location):
+    """
+    Lieu (Place) correspondant à une réponse libre, ou None s'il n'est pas reconnu.
+    Essaie le texte entier, puis chaque partie séparée par une virgule, puis le plus long nom connu
+    au début du texte ("Lyon presqu'île"), enfin un nom très proche (fautes de frappe).
+    """
+    if not isinstance(location, str) or not location.strip():
+        return None
+    places = load_places()
+    parts = [location] + location.split(",")
+    for part in parts:
+        key = normalize(part)
+        if key in places:
+            return places[key]
+    for part in parts:
+        words = normalize(part).split()
+        for end in range(len(words) - 1, 0, -1):
+            key = " ".join(words[:end])
+            if key in places:
+                return places[key]
+    close = difflib.get_close_matches(normalize(location), list(places), n=1, cutoff=0.85)
+    return places[close[0]] if close else None
+
+
+def distance_km(a, b):
+    """Distance à vol d'oiseau (haversine) entre deux Place."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a.lat, a.lon, b.lat, b.lon))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+class GeoIndex:
+    """
+    Index spatial en grille (cases de cell_deg degrés) des positions du moteur de matching.
+    Les profils sont regroupés par lieu : une recherche dans un rayon ne calcule qu'une distance
+    par lieu des cases voisines. Les profils dont le lieu n'est pas reconnu sont toujours
+    renvoyés (on ne peut pas les écarter).
+    """
+
+    def __init__(self, cell_deg=1.0):
+        self.cell_deg = cell_deg
+        self.cells = {}  # (ligne, colonne) -> {nom du lieu: positions}
+        self.places = {}  # nom du lieu -> Place
+        self.place_of = []  # position -> Place ou None
+        self.unlocated = []  # positions sans lieu reconnu
+        self._arrays = {}  # cache des positions au format NumPy, invalidé à chaque ajout
+        self.lock = threading.Lock()
+
+    def _cell(self, place):
+        return (math.floor(place.lat / self.cell_deg), math.floor(place.lon / self.cell_deg))
+
+    def add(self, position, location):
+        place = locate(location)
+        with self.lock:
+            self.place_of.append(place)
+            if place is None:
+                self.unlocated.append(position)
+                self._arrays.pop(None, None)
+                return
+            self.places[place.name] = place
+            self.cells.setdefault(self._cell(place), {}).setdefault(place.name, []).append(position)
+            self._arrays.pop(place.name, None)
+
+    def _positions(self, name):
+        with self.lock:
+            if name not in self._arrays:
+                if name is None:
+                    positions = self.unlocated
+                else:
+                    positions = self.cells[self._cell(self.places[name])][name]
+                self._arrays[name] = np.array(positions, dtype=np.int64)
+            return self._arrays[name]
+
+    def nearby_places(self, place, radius_km):
+        """Lieux indexés à moins de radius_km de place."""
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(place.lat)), 0.01))
+        rows = range(math.floor((place.lat - dlat) / self.cell_deg), math.floor((place.lat + dlat) / self.cell_deg) + 1)
+        cols = range(math.floor((place.lon - dlon) / self.cell_deg), math.floor((place.lon + dlon) / self.cell_deg) + 1)
+        found = []
+        with self.lock:
+            for row in rows:
+                for col in cols:
+                    for name in self.cells.get((row, col), ()):
+                        if distance_km(place, self.places[name]) <= radius_km:
+                            found.append(name)
+        return found
+
+    def within(self, location, radius_km):
+        """
+        Positions (triées) des profils à moins de radius_km du lieu 'location' (texte libre), plus les
+        profils non localisés ; None si 'location' n'est pas reconnu (pas de filtre possible).
+        """
+        place = locate(location)
+        if place is None:
+            return None
+        groups = [self._positions(name) for name in self.nearby_places(place, radius_km)]
+        if self.unlocated:
+            groups.append(self._positions(None))
+        if not groups:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(groups))
+
+    def is_near(self, location, position, radius_km):
+        """Le profil de 'position' est-il à moins de radius_km de 'location' (vrai si l'un des deux n'est pas localisé) ?"""
+        place = locate(location)
+        other = self.place_of[position]
+        if place is None or other is None:
+            return True
+        return distance_km(place, other) <= radius_km
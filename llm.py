@@ -0,0 +1,187 @@
+import asyncio
+import atexit
+import hashlib
+import json
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+import aiohttp
+import openai
+
+from prompts import count_message_tokens
+
+
+# Dernières latences mesurées : {"call", "first_token_s", "total_s", "timestamp"}
+LATENCIES = deque(maxlen=1000)
+_latencies_lock = threading.Lock()
+
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+)
+
+
+def record_latency(call, first_token_s, total_s):
+    with _latencies_lock:
+        LATENCIES.append({
+            "call": call,
+            "first_token_s": first_token_s,
+            "total_s": total_s,
+            "timestamp": time.time(),
+        })
+
+
+def _is_retryable(error):
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    # Erreurs 5xx renvoyées comme APIError
+    return isinstance(error, openai.error.APIError) and (error.http_status or 500) >= 500
+
+
+def _retry_after(error):
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Seau à jetons : 'rate' jetons par seconde, au plus 'capacity' en réserve (utilisé dans la boucle asyncio)."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+_DONE = object()
+
+
+class LLMGateway:
+    """
+    Passerelle unique vers OpenAI pour tout le processus : une boucle asyncio dans un thread dédié,
+    qui limite le nombre d'appels simultanés (max_concurrency) et le débit (requêtes et tokens
+    par minute, en seaux à jetons), réessaie les erreurs temporaires avec un délai exponentiel
+    aléatoire (ou le Retry-After de l'API), et regroupe les prompts identiques déjà en cours :
+    un seul appel est fait, tous les demandeurs reçoivent la même réponse.
+    Les réponses sont toujours demandées en streaming ; complete() s'appelle depuis un thread
+    Streamlit et y appelle on_text au fil des tokens.
+    """
+
+    def __init__(self, max_concurrency=8, requests_per_minute=500, tokens_per_minute=160000,
+                 max_retries=5, backoff=1.0, timeout=60):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.requests = TokenBucket(requests_per_minute / 60, max(1, requests_per_minute / 60))
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute / 6)
+        self.inflight = {}  # empreinte du prompt -> asyncio.Future de la réponse
+        self.coalesced = 0
+        self.retries = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="llm-gateway", daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._setup(max_concurrency), self.loop).result()
+        atexit.register(self.close)
+
+    async def _setup(self, max_concurrency):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        # Connexions HTTP réutilisées par tous les appels de la boucle
+        self.session = aiohttp.ClientSession()
+
+    def close(self):
+        """Ferme la session HTTP partagée (appelé à l'arrêt du processus)."""
+        if not self.session.closed:
+            asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+
+    def complete(self, messages, on_text=None, call="chat", **params):
+        """Appel bloquant : renvoie le texte complet, on_text(texte_partiel) est appelé dans le thread appelant."""
+        chunks = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._complete(messages, params, chunks, call), self.loop)
+        text = ""
+        while True:
+            item = chunks.get()
+            if item is _DONE:
+                break
+            text += item
+            if on_text is not None:
+                on_text(text)
+        return future.result()
+
+    async def _complete(self, messages, params, chunks, call):
+        try:
+            key = hashlib.sha256(
+                json.dumps([messages, params], ensure_ascii=False, sort_keys=True).encode("utf-8")
+            ).hexdigest()
+            if key in self.inflight:
+                # Même prompt déjà en cours : on attend sa réponse au lieu de refaire l'appel
+                self.coalesced += 1
+                text = await asyncio.shield(self.inflight[key])
+                chunks.put(text)
+                return text
+            result = self.loop.create_future()
+            self.inflight[key] = result
+            try:
+                text = await self._request(messages, params, chunks, call)
+                result.set_result(text)
+                return text
+            except Exception as e:
+                result.set_exception(e)
+                result.exception()  # évite l'avertissement si personne d'autre n'attendait
+                raise
+            finally:
+                del self.inflight[key]
+        finally:
+            chunks.put(_DONE)
+
+    async def _request(self, messages, params, chunks, call):
+        estimated = count_message_tokens(messages) + params.get("max_tokens", 0)
+        for attempt in range(self.max_retries + 1):
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimated)
+            async with self.semaphore:
+                openai.aiosession.set(self.session)
+                start = time.perf_counter()
+                first_token_s = None
+                parts = []
+                try:
+                    response = await openai.ChatCompletion.acreate(
+                        messages=messages, stream=True, request_timeout=self.timeout, **params
+                    )
+                    async for chunk in response:
+                        choices = chunk["choices"]
+                        delta = choices[0]["delta"].get("content") if choices else None
+                        if not delta:
+                            continue
+                        if first_token_s is None:
+                            first_token_s = time.perf_counter() - start
+                        parts.append(delta)
+                        chunks.put(delta)
+                    record_latency(call, first_token_s, time.perf_counter() - start)
+                    return "".join(parts).strip()
+                except Exception as e:
+                    # Une réponse déjà commencée ne peut pas être reprise
+                    if parts or not _is_retryable(e) or attempt == self.max_retries:
+                        raise
+                    delay = _retry_after(e) or self.backoff * (2 ** attempt) * (0.5 + random.random())
+            self.retries += 1
+            await asyncio.sleep(delay)
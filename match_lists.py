@@ -0,0 +1,286 @@
+import bisect
+import json
+import logging
+import threading
+import time
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+def _create_tables(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS match_lists (user_id TEXT PRIMARY KEY, matches TEXT)")
+    conn.execute("CREATE TABLE IF NOT EXISTS match_state (key TEXT PRIMARY KEY, value INTEGER)")
+
+
+def seed_match_lists(store, lists, processed_seq, schema_fingerprint, k):
+    """
+    Remplace les listes enregistrées par celles d'un calcul par lots (rescore.py) :
+    lists : {user_id: [(match_user_id, score), ...]} pour les profils de version <= processed_seq,
+    calculées avec le schéma de score schema_fingerprint. MatchLists reprend au profil suivant.
+    """
+    with store.lock:
+        _create_tables(store.conn)
+        store.conn.execute("DELETE FROM match_lists")
+        store.conn.execute("DELETE FROM match_state")
+        store.conn.executemany(
+            "INSERT INTO match_lists VALUES (?, ?)",
+            # Les positions sont recalculées à partir des user_id au chargement
+            ((uid, json.dumps([(-score, 0, match) for match, score in matches], ensure_ascii=False))
+             for uid, matches in lists.items())
+        )
+        store.conn.executemany("INSERT INTO match_state VALUES (?, ?)", [
+            ("processed_seq", processed_seq), ("schema", schema_fingerprint), ("k", k)
+        ])
+        store.conn.commit()
+
+
+class MatchLists:
+    """
+    Listes des k meilleurs matchs de chaque utilisateur, tenues à jour au fil des inscriptions
+    et enregistrées dans la base SQLite du ProfileStore (table match_lists).
+    Chaque nouveau profil est scoré une seule fois contre les profils déjà traités :
+      - sa propre liste est calculée sur ces profils,
+      - il entre dans la liste de chaque utilisateur qu'il accepte (partner_allowed) et dont
+        il dépasse le k-ième score. Le score est symétrique, ce qui suffit à garder toutes les listes exactes.
+    Seule la dernière version du profil d'un utilisateur est prise en compte. Quand un utilisateur
+    met à jour son profil, les listes où figurait son ancienne version sont recalculées.
+    Si le schéma de score a changé depuis l'enregistrement, toutes les listes sont recalculées.
+    L'avancement est enregistré en numéro de version du ProfileStore et non en position : au redémarrage,
+    le moteur ne contient plus les anciennes versions des lignes mises à jour, les positions sont donc
+    recalculées à partir des user_id.
+    Le coût d'un profil croît avec la population déjà traitée : un premier démarrage sur une base existante
+    (rattrapage de plus de 'backfill' profils) laisse get() renvoyer None jusqu'à la fin, et la page score
+    directement. Pour les grandes bases, initialiser plutôt les listes avec rescore.py --seed-match-lists.
+    """
+
+    def __init__(self, store, k=10, chunk=64, backfill=1000):
+        self.store = store
+        self.k = k
+        self.chunk = chunk  # profils traités à chaque prise du verrou
+        self.backfill = backfill
+        self.backfilling = False
+        self.lock = threading.RLock()
+        self.update_lock = threading.Lock()  # un seul update() à la fois
+        self.lists = {}  # user_id -> [(-score, position, match_user_id), ...] trié
+        self.listed_in = {}  # match_user_id -> user_ids dont la liste le contient
+        self.processed = 0  # positions du moteur déjà traitées
+        self.current_position = {}  # user_id -> position de la dernière version traitée
+        self.current = np.zeros(0, dtype=bool)  # position -> dernière version du profil ?
+        self.kth = np.zeros(0)  # position -> k-ième score de la liste (-1 si incomplète)
+        self.buckets = np.zeros(0, dtype=np.int32)  # position -> groupe (genre, orientation)
+        self.thread = None
+        with store.lock:
+            _create_tables(store.conn)
+            store.conn.commit()
+        self._load()
+
+    # ------------------------------------------------------------------------
+    # Lecture
+    # ------------------------------------------------------------------------
+    def get(self, user_id):
+        """
+        Liste [(user_id, score), ...] des meilleurs matchs, ou None si la dernière version du profil
+        n'est pas encore traitée ou si un rattrapage est en cours (listes incomplètes).
+        """
+        if self.backfilling:
+            return None
+        positions = self.store.engine().rows_by_user.get(user_id)
+        with self.lock:
+            if user_id not in self.lists or not positions or self.current_position.get(user_id) != positions[-1]:
+                return None
+            return [(match, -neg_score) for neg_score, _, match in self.lists[user_id]]
+
+    # ------------------------------------------------------------------------
+    # Mise à jour
+    # ------------------------------------------------------------------------
+    def update(self):
+        """
+        Traite les profils arrivés dans le moteur depuis le dernier appel ; renvoie leur nombre.
+        Le verrou n'est pris que par blocs de 'chunk' profils, chacun enregistré : get() n'attend jamais plus d'un bloc.
+        """
+        with self.update_lock:
+            engine = self.store.engine()
+            size = engine.size
+            start = self.processed
+            if size <= start:
+                return 0
+            self.backfilling = size - start > self.backfill
+            try:
+                while self.processed < size:
+                    with self.lock:
+                        end = min(self.processed + self.chunk, size)
+                        self._grow(engine, end)
+                        changed = set()
+                        for position in range(self.processed, end):
+                            changed |= self._add(engine, position)
+                        self.processed = end
+                        self._save(changed)
+            finally:
+                self.backfilling = False
+            return size - start
+
+    def start(self, sync=None, interval=5.0, after=None):
+        """
+        Lance le thread de maintenance : sync() (nouvelles lignes de la Sheet) puis update(), toutes les interval secondes,
+        puis after() (autres travaux de fond sur le moteur, comme la reconstruction de l'index approximatif).
+        """
+        def run():
+            while True:
+                try:
+                    if sync is not None:
+                        sync()
+                    self.update()
+                    if after is not None:
+                        after()
+                except Exception as e:
+                    logger.error("Mise à jour des listes de matchs impossible : %s", e)
+                time.sleep(interval)
+
+        self.thread = threading.Thread(target=run, name="match-lists", daemon=True)
+        self.thread.start()
+
+    def _grow(self, engine, size):
+        extra = size - len(self.current)
+        if extra <= 0:
+            return
+        self.current = np.concatenate([self.current, np.zeros(extra, dtype=bool)])
+        self.kth = np.concatenate([self.kth, np.full(extra, -1.0)])
+        new_buckets = np.array(engine.index.bucket_of[len(self.buckets):size], dtype=np.int32)
+        self.buckets = np.concatenate([self.buckets, new_buckets])
+
+    def _accepts(self, engine, gender):
+        """Pour chaque groupe (genre, orientation), partner_allowed accepte-t-il un partenaire de ce genre ?"""
+        table = np.ones(len(engine.index.key_ids), dtype=bool)
+        for (g, orientation), bucket_id in list(engine.index.key_ids.items()):
+            if orientation == "hétérosexuel(le)":
+                table[bucket_id] = g != gender
+            elif orientation == "homosexuel(le)":
+                table[bucket_id] = g == gender
+        return table
+
+    def _add(self, engine, p):
+        """Intègre le profil de la position p ; renvoie les user_ids dont la liste a changé."""
+        user_id = engine.user_ids[p]
+        changed = {user_id}
+
+        # Ancienne version du profil : elle sort des listes et n'est plus candidate
+        for old in engine.rows_by_user[user_id]:
+            if old < p:
+                self.current[old] = False
+        # Les listes qui contenaient l'ancienne version sont recalculées sans elle
+        for other in self.listed_in.pop(user_id, set()):
+            if other in self.current_position and other != user_id:
+                self._compute_list(engine, other, self.current_position[other], p)
+                changed.add(other)
+
+        earlier = np.flatnonzero(self.current[:p])
+        scores = self._compute_list(engine, user_id, p, p, earlier)
+        gender, _ = self._bucket_key(engine, p)
+
+        # Listes des autres : le nouveau profil y entre s'il est accepté et dépasse le k-ième score
+        accepts = self._accepts(engine, gender)[self.buckets[earlier]]
+        better = accepts & (scores > self.kth[earlier])
+        for position, score in zip(earlier[better], scores[better]):
+            other = engine.user_ids[position]
+            entries = self.lists.setdefault(other, [])
+            bisect.insort(entries, (-int(score), p, user_id))
+            for _, _, dropped in entries[self.k:]:
+                self.listed_in.get(dropped, set()).discard(other)
+            del entries[self.k:]
+            self.listed_in.setdefault(user_id, set()).add(other)
+            changed.add(other)
+            self._refresh_kth(other)
+
+        self.current[p] = True
+        self.current_position[user_id] = p
+        self._refresh_kth(user_id)
+        return changed
+
+    def _compute_list(self, engine, user_id, position, upto, candidates=None):
+        """Calcule la liste de user_id (profil à 'position') parmi les profils courants situés avant 'upto'."""
+        if candidates is None:
+            candidates = np.flatnonzero(self.current[:upto])
+            candidates = candidates[candidates != position]
+        scores = engine.encoded_scores(engine.encoded_at(position), candidates) if candidates.size else np.zeros(0, dtype=np.int64)
+
+        for _, _, match in self.lists.get(user_id, []):
+            self.listed_in.get(match, set()).discard(user_id)
+        gender, orientation = self._bucket_key(engine, position)
+        allowed_ids = [engine.index.key_ids[k] for k in engine.index.allowed_keys({"gender": gender, "orientation": orientation})]
+        mine = np.isin(self.buckets[candidates], allowed_ids)
+        best = engine.rank(candidates[mine], scores[mine], self.k) if mine.any() else []
+        self.lists[user_id] = [(-score, self.current_position[uid], uid) for uid, score in best]
+        for uid, _ in best:
+            self.listed_in.setdefault(uid, set()).add(user_id)
+        self._refresh_kth(user_id)
+        return scores
+
+    def _bucket_key(self, engine, p):
+        bucket_id = self.buckets[p]
+        for key, value in engine.index.key_ids.items():
+            if value == bucket_id:
+                return key
+        return ("", "")
+
+    def _refresh_kth(self, user_id):
+        if user_id not in self.current_position:
+            return
+        entries = self.lists.get(user_id, [])
+        self.kth[self.current_position[user_id]] = -entries[-1][0] if len(entries) >= self.k else -1
+
+    # ------------------------------------------------------------------------
+    # Persistance
+    # ------------------------------------------------------------------------
+    def _save(self, user_ids):
+        rows = [(uid, json.dumps(self.lists.get(uid, []), ensure_ascii=False)) for uid in user_ids]
+        with self.store.lock:
+            self.store.conn.executemany("INSERT OR REPLACE INTO match_lists VALUES (?, ?)", rows)
+            seq = self.store.engine_seqs[self.processed - 1] if self.processed else 0
+            self.store.conn.execute(
+                "INSERT OR REPLACE INTO match_state VALUES ('processed_seq', ?)", (seq,)
+            )
+            self.store.conn.execute(
+                "INSERT OR REPLACE INTO match_state VALUES ('schema', ?)", (self.store.engine().schema.fingerprint,)
+            )
+            self.store.conn.execute("INSERT OR REPLACE INTO match_state VALUES ('k', ?)", (self.k,))
+            self.store.conn.commit()
+
+    def _load(self):
+        engine = self.store.engine()
+        with self.store.lock:
+            row = self.store.conn.execute("SELECT value FROM match_state WHERE key = 'processed_seq'").fetchone()
+            legacy = self.store.conn.execute("SELECT value FROM match_state WHERE key = 'processed'").fetchone()
+            schema = self.store.conn.execute("SELECT value FROM match_state WHERE key = 'schema'").fetchone()
+            k = self.store.conn.execute("SELECT value FROM match_state WHERE key = 'k'").fetchone()
+            if (row or legacy) and (schema is None or schema[0] != engine.schema.fingerprint
+                                    or (k is not None and k[0] != self.k)):
+                # Listes calculées avec d'autres critères, d'autres poids ou une autre longueur : on repart de zéro
+                logger.info("Schéma de score ou longueur des listes modifiés : recalcul de toutes les listes de matchs")
+                self.store.conn.execute("DELETE FROM match_lists")
+                self.store.conn.execute("DELETE FROM match_state")
+                self.store.conn.commit()
+                row = legacy = None
+            saved = self.store.conn.execute("SELECT user_id, matches FROM match_lists").fetchall()
+        if row:
+            processed = bisect.bisect_right(self.store.engine_seqs, row[0])
+        else:
+            # État enregistré avant les versions : nombre de positions, dans l'ordre de la Sheet
+            processed = min(legacy[0] if legacy else 0, engine.size)
+        self._grow(engine, engine.size)
+        for user_id, positions in engine.rows_by_user.items():
+            done = [pos for pos in positions if pos < processed]
+            if done:
+                self.current[done[-1]] = True
+                self.current_position[user_id] = done[-1]
+        for user_id, matches in saved:
+            # Position actuelle de chaque match (celle d'une version mise à jour peut avoir changé)
+            self.lists[user_id] = sorted((neg_score, engine.rows_by_user[match][-1], match)
+                                         for neg_score, _, match in json.loads(matches) if match in engine.rows_by_user)
+            for _, _, match in self.lists[user_id]:
+                self.listed_in.setdefault(match, set()).add(user_id)
+        self.processed = processed
+        for user_id in self.lists:
+            self._refresh_kth(user_id)
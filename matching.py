@@ -0,0 +1,375 @@
+import json
+import threading
+
+import numpy as np
+
+from geo import GeoIndex
+from scoring import SCHEMA
+
+
+# =============================================================================
+# 1. RÈGLES DE COMPATIBILITÉ (VERSION SCALAIRE)
+# =============================================================================
+def partner_allowed(user_static, other_static):
+    """
+    Détermine si le profil 'other_static' est admissible en fonction de l'orientation sexuelle et du genre de l'utilisateur.
+    - Pour un(e) hétérosexuel(le): le partenaire doit être de genre opposé.
+    - Pour un(e) homosexuel(le): le partenaire doit être du même genre.
+    - Pour bisexuel(le), pansexuel(le) ou Autre: tous les genres sont acceptés.
+    """
+    orientation = user_static.get("orientation", "").lower()
+    user_gender = user_static.get("gender", "").lower()
+    partner_gender = other_static.get("gender", "").lower()
+
+    if orientation == "hétérosexuel(le)":
+        return user_gender != partner_gender
+    elif orientation == "homosexuel(le)":
+        return user_gender == partner_gender
+    elif orientation in ["bisexuel(le)", "pansexuel(le)"]:
+        return True
+    else:
+        return True
+
+def compute_compatibility(user_static, other_static, schema=SCHEMA):
+    """
+    Calcule un pourcentage de compatibilité entre deux utilisateurs à partir des critères pondérés
+    du schéma de score (scoring_schema.json : réponse, type de comparaison et poids de chaque critère).
+    """
+    return schema.score(user_static, other_static)
+
+def parse_static(data_str):
+    """Extrait les static_answers d'une cellule 'data' de la Google Sheet (None si illisible)."""
+    try:
+        return json.loads(data_str).get("static_answers", {})
+    except Exception:
+        return None
+
+
+# =============================================================================
+# 2. MOTEUR DE MATCHING VECTORISÉ
+# =============================================================================
+# Nombre de bits à 1 pour chaque octet, pour compter les intersections des bitsets
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int32)
+
+
+def _hashable(value):
+    """Rend une réponse utilisable comme clé de dictionnaire (les listes deviennent des tuples)."""
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+
+class _Vocabulary:
+    """
+    Associe chaque valeur rencontrée à un code entier (0 = réponse absente).
+    Part de la table du critère (Feature.table : options du questionnaire, mêmes codes que le score scalaire).
+    """
+
+    def __init__(self, table=None):
+        self.codes = {None: 0}
+        self.codes.update(table or {})
+
+    def add(self, value):
+        key = _hashable(value)
+        if key not in self.codes:
+            self.codes[key] = len(self.codes)
+        return self.codes[key]
+
+    def lookup(self, value):
+        # -1 ne correspond à aucun profil encodé
+        return self.codes.get(_hashable(value), -1)
+
+
+class PartnerIndex:
+    """
+    Index inversé des profils par (genre, orientation), en minuscules.
+    Permet de ne récupérer que les profils admissibles pour partner_allowed avant le scoring,
+    et se met à jour de façon incrémentale à chaque nouveau profil.
+    """
+
+    def __init__(self):
+        self.buckets = {}  # (genre, orientation) -> positions des profils, dans l'ordre d'ajout
+        self.key_ids = {}  # (genre, orientation) -> numéro du groupe
+        self.bucket_of = []  # position -> numéro du groupe
+        self._arrays = {}  # cache des positions au format NumPy, invalidé à chaque ajout
+        self.lock = threading.Lock()
+
+    def add(self, position, static):
+        key = (str(static.get("gender", "")).lower(), str(static.get("orientation", "")).lower())
+        with self.lock:
+            self.buckets.setdefault(key, []).append(position)
+            self.bucket_of.append(self.key_ids.setdefault(key, len(self.key_ids)))
+            self._arrays.pop(key, None)
+
+    def _positions(self, key):
+        with self.lock:
+            if key not in self._arrays:
+                self._arrays[key] = np.array(self.buckets[key], dtype=np.int64)
+            return self._arrays[key]
+
+    def allowed_keys(self, user_static):
+        """Groupes (genre, orientation) que partner_allowed accepterait pour user_static."""
+        orientation = user_static.get("orientation", "").lower()
+        user_gender = user_static.get("gender", "").lower()
+        buckets = list(self.buckets)
+        if orientation == "hétérosexuel(le)":
+            return [k for k in buckets if k[0] != user_gender]
+        elif orientation == "homosexuel(le)":
+            return [k for k in buckets if k[0] == user_gender]
+        return buckets
+
+    def candidates(self, user_static):
+        """Positions (triées) des profils que partner_allowed accepterait pour user_static."""
+        keys = self.allowed_keys(user_static)
+        if not keys:
+            return np.zeros(0, dtype=np.int64)
+        if len(keys) == 1:
+            return self._positions(keys[0])
+        # On garde l'ordre d'enregistrement pour départager les ex-aequo
+        return np.sort(np.concatenate([self._positions(k) for k in keys]))
+
+
+class MatchingEngine:
+    """
+    Encode une seule fois les static_answers de tous les profils dans des tableaux NumPy
+    de largeur fixe, puis score un utilisateur contre toute la population en une passe.
+      - Réponses catégorielles : un code entier par profil (équivalent d'un one-hot).
+      - Curseur d'engagement : valeur flottante + indicateur de validité.
+      - Choix multiples : bitset compacté (np.packbits) par profil.
+    Les critères et leurs poids viennent du schéma de score ; les scores sont identiques
+    à ceux de compute_compatibility avec le même schéma.
+    Les nouveaux profils s'ajoutent avec extend() sans réencoder les anciens ; seuls les profils
+    admissibles (PartnerIndex) sont scorés par top_k, et seulement ceux à moins de radius_km
+    de l'utilisateur (GeoIndex) si un rayon est donné.
+    Un user_id ajouté de nouveau (profil mis à jour) remplace sa version précédente : l'ancienne ligne
+    reste encodée mais n'est plus candidate (masque current).
+    """
+
+    def __init__(self, user_ids=(), statics=(), schema=None):
+        self.schema = schema or SCHEMA
+        self.user_ids = []
+        self.rows_by_user = {}  # user_id -> positions de ses lignes
+        self.current = np.zeros(0, dtype=bool)  # position -> dernière version du profil de son user_id ?
+        self.size = 0
+        self.vocabularies = {f.key: _Vocabulary(f.table) for f in self.schema.features}
+        self.columns = {}
+        for f in self.schema.features:
+            if f.compare == "exact":
+                self.columns[f.key] = np.zeros(0, dtype=np.int32)
+            elif f.compare == "jaccard":
+                width = max(len(self.vocabularies[f.key].codes) - 1, 1)
+                self.columns[f.key] = (np.zeros((0, (width + 7) // 8), dtype=np.uint8), np.zeros(0, dtype=np.int32), width)
+            elif f.compare == "distance":
+                self.columns[f.key] = (np.zeros(0), np.zeros(0, dtype=bool))
+        self.index = PartnerIndex()
+        self.geo = GeoIndex()
+        self.extend(user_ids, statics)
+
+    @classmethod
+    def from_rows(cls, rows, schema=None):
+        """Construit le moteur à partir de couples (user_id, cellule 'data'), en ignorant les lignes illisibles."""
+        user_ids = []
+        statics = []
+        for user_id, data_str in rows:
+            static = parse_static(data_str)
+            if static is None:
+                continue
+            user_ids.append(user_id)
+            statics.append(static)
+        return cls(user_ids, statics, schema)
+
+    def extend(self, user_ids, statics):
+        """Encode et ajoute de nouveaux profils à la fin de la population."""
+        user_ids = list(user_ids)
+        statics = list(statics)
+        n = len(statics)
+        if n == 0:
+            return
+        for f in self.schema.features:
+            key = f.key
+            vocab = self.vocabularies[key]
+            if f.compare == "exact":
+                codes = np.fromiter((vocab.add(s.get(key)) for s in statics), dtype=np.int32, count=n)
+                self.columns[key] = np.concatenate([self.columns[key], codes])
+            elif f.compare == "jaccard":
+                self.columns[key] = self._extend_sets(key, vocab, statics)
+            elif f.compare == "distance":
+                values = np.full(n, float(f.default))
+                valid = np.ones(n, dtype=bool)
+                for i, s in enumerate(statics):
+                    try:
+                        values[i] = float(s.get(key, f.default))
+                    except Exception:
+                        valid[i] = False
+                old_values, old_valid = self.columns[key]
+                self.columns[key] = (np.concatenate([old_values, values]), np.concatenate([old_valid, valid]))
+
+        # Les colonnes sont complètes avant que l'index ne rende les nouvelles positions visibles
+        self.user_ids.extend(user_ids)
+        self.current = np.concatenate([self.current, np.ones(n, dtype=bool)])
+        superseded = []
+        for offset, (user_id, static) in enumerate(zip(user_ids, statics)):
+            position = self.size + offset
+            positions = self.rows_by_user.setdefault(user_id, [])
+            superseded.extend(positions[-1:])
+            positions.append(position)
+            self.index.add(position, static)
+            self.geo.add(position, static.get("location"))
+        # Anciennes versions retirées une fois la nouvelle visible
+        self.current[superseded] = False
+        self.size += n
+
+    def live(self, positions):
+        """Garde parmi 'positions' celles des dernières versions des profils."""
+        return positions[self.current[positions]]
+
+    def _extend_sets(self, key, vocab, statics):
+        """Encode une réponse à choix multiples en bitsets compactés (un octet pour 8 options)."""
+        old_packed, old_sizes, _ = self.columns[key]
+        members = []
+        for s in statics:
+            members.append([vocab.add(v) - 1 for v in set(s.get(key, []))])
+        width = max(len(vocab.codes) - 1, 1)
+        bits = np.zeros((len(statics), width), dtype=bool)
+        for i, m in enumerate(members):
+            bits[i, m] = True
+        packed = np.packbits(bits, axis=1)
+        # Nouvelles options : on élargit les anciens bitsets avec des octets à zéro
+        if old_packed.shape[1] < packed.shape[1]:
+            old_packed = np.pad(old_packed, ((0, 0), (0, packed.shape[1] - old_packed.shape[1])))
+        sizes = _POPCOUNT[packed].sum(axis=1)
+        return np.concatenate([old_packed, packed]), np.concatenate([old_sizes, sizes]), width
+
+    def _encode_user_set(self, key, user_static):
+        """Encode le choix multiple de l'utilisateur dans le même espace que la population."""
+        vocab = self.vocabularies[key]
+        _, _, width = self.columns[key]
+        values = set(user_static.get(key, []))
+        bits = np.zeros(width, dtype=bool)
+        # Les options inconnues de la population comptent dans l'union mais jamais dans l'intersection
+        for v in values:
+            code = vocab.lookup(v)
+            if 0 < code <= width:
+                bits[code - 1] = True
+        return np.packbits(bits), len(values)
+
+    def encode_user(self, user_static):
+        """Encode les réponses d'un utilisateur dans l'espace des colonnes du moteur."""
+        encoded = {}
+        for f in self.schema.features:
+            if f.compare == "exact":
+                encoded[f.key] = self.vocabularies[f.key].lookup(user_static.get(f.key))
+            elif f.compare == "jaccard":
+                encoded[f.key] = self._encode_user_set(f.key, user_static)
+            elif f.compare == "distance":
+                try:
+                    encoded[f.key] = float(user_static.get(f.key, f.default))
+                except Exception:
+                    encoded[f.key] = None
+        return encoded
+
+    def encoded_at(self, position):
+        """Réponses déjà encodées du profil situé à 'position' (même format que encode_user)."""
+        encoded = {}
+        for f in self.schema.features:
+            if f.compare == "exact":
+                encoded[f.key] = self.columns[f.key][position]
+            elif f.compare == "jaccard":
+                packed, sizes, _ = self.columns[f.key]
+                encoded[f.key] = (packed[position], sizes[position])
+            elif f.compare == "distance":
+                values, valid = self.columns[f.key]
+                encoded[f.key] = values[position] if valid[position] else None
+        return encoded
+
+    def scores(self, user_static, rows=None):
+        """
+        Renvoie le tableau des pourcentages de compatibilité de user_static avec chaque profil,
+        ou seulement avec les profils aux positions 'rows'.
+        """
+        return self.encoded_scores(self.encode_user(user_static), rows)
+
+    def encoded_scores(self, encoded, rows=None):
+        """Comme scores(), à partir de réponses déjà encodées."""
+        def column(values):
+            return values if rows is None else values[rows]
+
+        n = self.size if rows is None else len(rows)
+        total = np.zeros(n)
+        for f in self.schema.features:
+            key, weight = f.key, f.weight
+            if f.compare == "exact":
+                total += np.where(column(self.columns[key]) == encoded[key], weight, 0.0)
+            elif f.compare == "jaccard":
+                packed, sizes, _ = self.columns[key]
+                user_packed, user_size = encoded[key]
+                # Le bitset de l'utilisateur peut être plus étroit si de nouvelles options sont arrivées
+                if user_packed.shape[0] < packed.shape[1]:
+                    user_packed = np.pad(user_packed, (0, packed.shape[1] - user_packed.shape[0]))
+                inter = _POPCOUNT[column(packed) & user_packed].sum(axis=1)
+                union = column(sizes) + user_size - inter
+                ratio = np.divide(inter, union, out=np.zeros(n), where=union > 0)
+                total += np.where(union > 0, weight * ratio, 0.0)
+            elif f.compare == "distance":
+                values, valid = self.columns[key]
+                if encoded[key] is None:
+                    diff = np.zeros(n)
+                else:
+                    diff = np.where(column(valid), np.abs(encoded[key] - column(values)), 0.0)
+                total += weight * (1 - diff / f.range)
+        return np.round((total / self.schema.total_weight) * 100).astype(np.int64)
+
+    def top_k(self, user_static, k=1, exclude_user_id=None, radius_km=None):
+        """
+        Renvoie les k meilleurs profils admissibles sous forme de liste [(user_id, score), ...],
+        triés par score décroissant puis par ordre d'enregistrement (comme la boucle d'origine).
+        Avec radius_km, seuls les profils à moins de radius_km de l'utilisateur sont scorés
+        (les profils non localisés sont gardés ; aucun filtre si l'utilisateur n'est pas localisé).
+        """
+        if self.size == 0 or k <= 0:
+            return []
+        candidates = self.live(self.index.candidates(user_static))
+        if radius_km is not None:
+            nearby = self.geo.within(user_static.get("location"), radius_km)
+            if nearby is not None:
+                candidates = np.intersect1d(candidates, nearby, assume_unique=True)
+        if exclude_user_id in self.rows_by_user:
+            candidates = candidates[~np.isin(candidates, self.rows_by_user[exclude_user_id])]
+        if candidates.size == 0:
+            return []
+        return self.rank(candidates, self.scores(user_static, candidates), k)
+
+    def is_near(self, user_static, user_id, radius_km):
+        """Le dernier profil enregistré de user_id est-il à moins de radius_km de l'utilisateur ?"""
+        if radius_km is None or user_id not in self.rows_by_user:
+            return True
+        return self.geo.is_near(user_static.get("location"), self.rows_by_user[user_id][-1], radius_km)
+
+    def rank(self, candidates, cand_scores, k):
+        """Garde les k meilleurs candidats (positions + scores), en ne triant que la tête du classement."""
+        # Ex-aequo du k-ième score inclus
+        if k < candidates.size:
+            kth = np.partition(cand_scores, candidates.size - k)[candidates.size - k]
+            head = cand_scores >= kth
+            results = self._ranked(candidates[head], cand_scores[head], k)
+            if len(results) == k:
+                return results
+        # Pas assez de user_id distincts dans la tête : tri complet
+        return self._ranked(candidates, cand_scores, k)
+
+    def _ranked(self, candidates, cand_scores, k):
+        """Trie les candidats et supprime les doublons d'un même user_id (on garde le meilleur)."""
+        order = np.lexsort((candidates, -cand_scores))
+        results = []
+        seen = set()
+        for i in order:
+            user_id = self.user_ids[candidates[i]]
+            if user_id in seen:
+                continue
+            seen.add(user_id)
+            results.append((user_id, int(cand_scores[i])))
+            if len(results) == k:
+                break
+        return results
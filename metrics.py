@@ -0,0 +1,180 @@
+import bisect
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+# Bornes supérieures des classes de latence, en millisecondes
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Page en cours d'affichage dans le thread du script Streamlit (fixée par main())
+current_route = contextvars.ContextVar("current_route", default="")
+
+
+class Histogram:
+    """Nombre d'appels par classe de latence, plus total et nombre d'erreurs."""
+
+    __slots__ = ("counts", "count", "total_s", "errors")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.count = 0
+        self.total_s = 0.0
+        self.errors = 0
+
+    def quantile_ms(self, q, buckets):
+        """Borne supérieure de la classe contenant le quantile q (inf au-delà de la dernière borne)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return buckets[i] if i < len(buckets) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    """
+    Compteurs et histogrammes de latence par opération et par page, en mémoire du processus.
+    Une mesure coûte un perf_counter, une recherche dichotomique et un verrou : assez peu pour rester
+    active en production. Exportable au format texte Prometheus ou en JSON.
+    """
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.histograms = {}  # (opération, page) -> Histogram
+        self.started = time.time()
+        self.thread = None
+
+    def reset(self):
+        """Remet toutes les mesures à zéro (par exemple après une phase de préchauffage)."""
+        with self.lock:
+            self.histograms = {}
+            self.started = time.time()
+
+    def observe(self, name, seconds, route=None, error=False):
+        if route is None:
+            route = current_route.get()
+        slot = bisect.bisect_left(self.buckets, seconds * 1000)
+        with self.lock:
+            histogram = self.histograms.get((name, route))
+            if histogram is None:
+                histogram = self.histograms[(name, route)] = Histogram(len(self.buckets) + 1)
+            histogram.counts[slot] += 1
+            histogram.count += 1
+            histogram.total_s += seconds
+            if error:
+                histogram.errors += 1
+
+    @contextmanager
+    def timer(self, name, route=None):
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            # st.rerun() et st.stop() lèvent des BaseException : elles ne comptent pas comme erreurs
+            error = True
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, route, error)
+
+    def timed(self, name):
+        """Décorateur : mesure chaque appel de la fonction sous le nom 'name'."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # ------------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------------
+    def snapshot(self):
+        """Liste de dictionnaires, un par (opération, page), triée par temps total décroissant."""
+        with self.lock:
+            items = [(key, list(h.counts), h.count, h.total_s, h.errors) for key, h in self.histograms.items()]
+        rows = []
+        for (name, route), counts, count, total_s, errors in items:
+            histogram = Histogram(len(counts))
+            histogram.counts, histogram.count = counts, count
+            rows.append({
+                "operation": name,
+                "route": route,
+                "count": count,
+                "errors": errors,
+                "total_s": round(total_s, 3),
+                "mean_ms": round(total_s / count * 1000, 2) if count else None,
+                "p50_ms": histogram.quantile_ms(0.5, self.buckets),
+                "p99_ms": histogram.quantile_ms(0.99, self.buckets),
+                "buckets": counts,
+            })
+        rows.sort(key=lambda row: -row["total_s"])
+        return rows
+
+    def to_json(self):
+        return json.dumps({
+            "started": self.started,
+            "timestamp": time.time(),
+            "buckets_ms": list(self.buckets),
+            "operations": self.snapshot(),
+        }, indent=2)
+
+    def to_prometheus(self):
+        lines = [
+            "# HELP onelove_operation_seconds Durée des opérations de l'application",
+            "# TYPE onelove_operation_seconds histogram",
+        ]
+        errors = []
+        for row in self.snapshot():
+            labels = f'operation="{row["operation"]}",route="{row["route"]}"'
+            cumulative = 0
+            for bound, n in zip(self.buckets, row["buckets"]):
+                cumulative += n
+                lines.append(f'onelove_operation_seconds_bucket{{{labels},le="{bound / 1000:g}"}} {cumulative}')
+            lines.append(f'onelove_operation_seconds_bucket{{{labels},le="+Inf"}} {row["count"]}')
+            lines.append(f"onelove_operation_seconds_sum{{{labels}}} {row['total_s']}")
+            lines.append(f"onelove_operation_seconds_count{{{labels}}} {row['count']}")
+            errors.append(f"onelove_operation_errors_total{{{labels}}} {row['errors']}")
+        lines += [
+            "# HELP onelove_operation_errors_total Opérations terminées par une exception",
+            "# TYPE onelove_operation_errors_total counter",
+        ] + errors
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Écrit les mesures dans path (JSON si l'extension est .json, sinon texte Prometheus)."""
+        content = self.to_json() if path.endswith(".json") else self.to_prometheus()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def start_dump(self, path, interval=60.0):
+        """Lance un thread qui réécrit le fichier path toutes les interval secondes."""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.dump(path)
+                except OSError as e:
+                    logger.error("Écriture des mesures impossible : %s", e)
+
+        self.thread = threading.Thread(target=run, name="metrics-dump", daemon=True)
+        self.thread.start()
+
+
+# Mesures de tout le processus (partagées par toutes les sessions)
+METRICS = Metrics()
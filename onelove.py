@@ -1,10 +1,18 @@
 import streamlit as st
 import json
-import pandas as pd
+import contextvars
+import copy
 import datetime
-from oauth2client.service_account import ServiceAccountCredentials
-import gspread
-import openai
+import hmac
+import threading
+import uuid
+from metrics import METRICS, current_route
+from prompts import SAVINGS, chat_messages, chatbot_system_prompt, record_savings, summary_messages
+from questions import CHOICES, MULTI_CHOICES
+from sessions import profile_digest
+# Les dépendances lourdes (pandas, numpy, gspread, openai) et les clients ne sont importés
+# qu'à la demande, par les fonctions ci-dessous : les pages du questionnaire n'en chargent aucune,
+# la Sheet n'est chargée que par le matching et OpenAI par le chatbot et le résumé.
 
 
 
@@ -38,100 +46,233 @@ else:
 if "GCP_SERVICE_ACCOUNT" not in st.secrets:
     st.error("❌ Erreur : Impossible de charger la configuration GCP.")
 
-api_key = st.secrets["openai"]["api_key"]
-openai.api_key = api_key
+# Connexions créées une seule fois par processus (st.cache_resource) et partagées
+# par toutes les sessions : plus d'authentification OAuth à chaque rerun.
+@st.cache_resource
+def get_llm_gateway():
+    """
+    Passerelle OpenAI partagée : 8 appels simultanés au plus, débit limité, prompts identiques regroupés,
+    connexions HTTP réutilisées entre les reruns (session aiohttp de la passerelle).
+    """
+    from clients import configure_openai
+    from llm import LLMGateway
+    configure_openai(st.secrets["openai"]["api_key"])
+    return LLMGateway(max_concurrency=8, requests_per_minute=500, tokens_per_minute=160000)
 
 # =============================================================================
 # 2. CONFIGURATION GOOGLE SHEETS
 # =============================================================================
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-service_account_info = json.loads(st.secrets["GCP_SERVICE_ACCOUNT"])
-creds = ServiceAccountCredentials.from_json_keyfile_dict(service_account_info, SCOPES)
-client = gspread.authorize(creds)
-
-# La première ligne de la Google Sheet doit contenir : user_id | timestamp | data | score | feedback
+# La première ligne de chaque feuille doit contenir : user_id | timestamp | data | score | feedback
+# Les profils sont répartis en une feuille par genre (shards.py) ; la première feuille du classeur
+# garde les profils enregistrés avant ce découpage.
 SHEET_KEY = "1kJ9EfPW_LlChPp5eeuy4t-csLDrmjRyI-mIMUnmixfw"
-sheet = client.open_by_key(SHEET_KEY).sheet1
+
+@st.cache_resource
+def get_sheet_shards():
+    """Feuilles des shards de profils, chacune ouverte à sa première lecture puis réutilisée (reconnexion automatique)."""
+    import clients
+    from profile_store import COLUMNS
+    from shards import ShardedSheets, shard_title
+    service_account_info = json.loads(st.secrets["GCP_SERVICE_ACCOUNT"])
+    return ShardedSheets(lambda shard: clients.SheetConnection(
+        lambda: clients.open_google_worksheet(service_account_info, SHEET_KEY, shard_title(shard), COLUMNS)
+    ))
+
+@st.cache_resource
+def get_sheet_writer():
+    """
+    File d'écriture différée vers la Sheet : un thread de fond écrit les profils par lots, dans la feuille de leur shard.
+    Un utilisateur déjà présent voit sa ligne mise à jour sur place (index de la copie locale).
+    """
+    from sheet_writer import SheetWriter
+    return SheetWriter(get_sheet_shards(), store=get_profile_store(), batch_size=50, flush_interval=2.0)
+
+# Copie locale des profils (SQLite), synchronisée de façon incrémentale avec la Sheet
+PROFILE_DB_PATH = "onelove_profiles.db"
+
+@st.cache_resource
+def get_profile_store():
+    """Ouvre une seule fois la copie locale des profils, partagée par toutes les sessions."""
+    from profile_store import ProfileStore
+    return ProfileStore(PROFILE_DB_PATH)
+
+# Au-delà de ce nombre de profils, le matching passe par un index approximatif (IVF)
+# puis re-classe exactement les meilleurs candidats. None : toujours un scan exact.
+ANN_MIN_PROFILES = 100_000
+
+# Listes des meilleurs matchs de chaque utilisateur, précalculées au fil des inscriptions
+MATCH_LIST_SIZE = 10
+
+# Distance maximale (km, à vol d'oiseau) entre deux profils proposés l'un à l'autre, d'après
+# leur réponse "location" (voir geo.py). None : pas de limite.
+MATCH_RADIUS_KM = 100
+
+@st.cache_resource
+def get_match_lists():
+    """
+    Listes de matchs partagées, tenues à jour par un thread de fond (nouvelles lignes de tous les shards toutes les 5 s).
+    Le même thread construit puis reconstruit l'index approximatif au-delà de ANN_MIN_PROFILES profils.
+    """
+    from match_lists import MatchLists
+    store = get_profile_store()
+    sheets = get_sheet_shards()
+    ann = get_ann_index()
+
+    def refresh_ann():
+        if ANN_MIN_PROFILES is not None and store.engine().size >= ANN_MIN_PROFILES:
+            ann.refresh()
+
+    lists = MatchLists(store, k=MATCH_LIST_SIZE)
+    lists.start(sync=lambda: store.sync_shards(sheets), interval=5.0, after=refresh_ann)
+    return lists
+
+@st.cache_resource
+def get_ann_index():
+    """
+    Index approximatif sur le moteur de matching de la copie locale, construit par le thread des listes de matchs :
+    une recherche n'attend jamais le k-means, elle utilise la dernière construction publiée.
+    """
+    from ann import IVFIndex
+    return IVFIndex(get_profile_store().engine(), background=True)
+
+# Mesures de performance (compteurs et latences par opération et par page), aussi visibles
+# sur la page ?page=diagnostics (mot de passe [admin] password dans les secrets)
+METRICS_DUMP_PATH = "onelove_metrics.prom"
+
+@st.cache_resource
+def get_metrics_dump():
+    """Écrit les mesures de performance (format Prometheus) dans METRICS_DUMP_PATH toutes les minutes."""
+    METRICS.start_dump(METRICS_DUMP_PATH, interval=60.0)
+    return METRICS
+
+get_metrics_dump()
+
+# Cache des résumés de profil : LRU en mémoire + fichier SQLite (30 jours)
+SUMMARY_CACHE_PATH = "onelove_summaries.db"
+
+@st.cache_resource
+def get_summary_cache():
+    """Cache des résumés partagé par toutes les sessions."""
+    from summary_cache import SummaryCache
+    return SummaryCache(max_entries=1024, disk_path=SUMMARY_CACHE_PATH, ttl=30 * 24 * 3600)
+
+# Données lourdes des sessions (réponses, conversation, résumé) : hors de st.session_state, dans le
+# gestionnaire de sessions (sessions.py). La conversation est déchargée dans le fichier de la copie locale
+# une fois le profil enregistré ; une session inactive depuis SESSION_IDLE_TIMEOUT secondes (ou au-delà de
+# MAX_RESIDENT_SESSIONS en mémoire) y est aussi enregistrée puis rechargée au retour de l'utilisateur.
+SESSION_IDLE_TIMEOUT = 30 * 60
+MAX_RESIDENT_SESSIONS = 5000
+
+@st.cache_resource
+def get_session_manager():
+    """Gestionnaire partagé par toutes les sessions du processus (ménage par un thread de fond)."""
+    from sessions import SessionManager, SessionStore
+    manager = SessionManager(SessionStore(PROFILE_DB_PATH), idle_timeout=SESSION_IDLE_TIMEOUT,
+                             max_resident=MAX_RESIDENT_SESSIONS)
+    manager.start()
+    return manager
+
+@st.cache_resource
+def get_prefetch_pool():
+    """
+    Threads de génération des résumés en arrière-plan, partagés par toutes les sessions du processus.
+    Chaque session ne garde que sa dernière tâche (SessionRecord.prefetch) : les précédentes, et celle d'une
+    session évincée, sont retirées du pool ou sautées au démarrage.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="summary-prefetch")
+
+# Taille maximale (en tokens) des prompts envoyés à OpenAI : au-delà, les plus anciens
+# messages de la conversation sont tronqués puis omis
+CHAT_TOKEN_BUDGET = 1500
+SUMMARY_TOKEN_BUDGET = 2500
 
 # =============================================================================
 # 3. FONCTIONS UTILES
 # =============================================================================
-def get_chatbot_response(conversation):
-    """Envoie l'historique de conversation à OpenAI pour obtenir la réponse du chatbot."""
+@METRICS.timed("get_chatbot_response")
+def get_chatbot_response(conversation, on_text=None):
+    """Envoie l'historique de conversation à OpenAI pour obtenir la réponse du chatbot (affichée au fil de l'eau via on_text)."""
+    messages, original_tokens, sent_tokens = chat_messages(
+        session().static_answers, conversation, CHAT_TOKEN_BUDGET
+    )
+    record_savings("chatbot", original_tokens, sent_tokens)
+    import openai
     try:
-        response = openai.ChatCompletion.create(
+        return get_llm_gateway().complete(
+            messages,
+            on_text=on_text,
+            call="chatbot",
             model="gpt-3.5-turbo",
-            messages=conversation,
             temperature=0.7,
             max_tokens=300
         )
-        return response.choices[0].message["content"].strip()
     except openai.OpenAIError as e:
         st.error(f"Erreur avec OpenAI : {str(e)}")
         return "Désolé, une erreur est survenue."
 
+@METRICS.timed("generate_profile_summary")
+def generate_profile_summary(static_answers, chat_history, on_text=None, gateway=None):
+    """Demande à OpenAI le résumé du profil amoureux (lève une exception en cas d'erreur)."""
+    messages, original_tokens, sent_tokens = summary_messages(static_answers, chat_history, SUMMARY_TOKEN_BUDGET)
+    record_savings("summary", original_tokens, sent_tokens)
+    return (gateway or get_llm_gateway()).complete(
+        messages,
+        on_text=on_text,
+        call="summary",
+        model="gpt-3.5-turbo",
+        temperature=0.7,
+        max_tokens=300
+    )
+
+def prefetch_summary():
+    """
+    Lance en arrière-plan la génération du résumé dès que la conversation est terminée, pendant que
+    l'utilisateur lit la fin du chatbot : page_result le trouve en général déjà dans le cache.
+    Le calcul tourne dans un pool de threads partagé, une seule fois par contenu de profil
+    (même clé que page_result). En cas d'erreur, page_result relance simplement la génération.
+    """
+    from summary_cache import summary_key
+    record = session()
+    key = summary_key(record.static_answers, record.chat_history)
+    if record.prefetch is not None and record.prefetch[0] == key:
+        return
+    # Profil modifié depuis : le résumé de l'ancienne version n'est plus attendu
+    record.cancel_prefetch()
+    # Copies : la session peut encore être modifiée pendant la génération.
+    # Le cache et la passerelle sont pris ici, le thread n'ayant pas accès au contexte Streamlit.
+    static_answers = copy.deepcopy(record.static_answers)
+    chat_history = copy.deepcopy(record.chat_history)
+    cache, gateway = get_summary_cache(), get_llm_gateway()
+    abandoned = threading.Event()
+    
+    def run():
+        # Remplacé par une version plus récente ou session évincée avant le démarrage : rien à générer
+        if abandoned.is_set():
+            return None
+        with METRICS.timer("summary_prefetch"):
+            return cache.get_or_create(
+                key, lambda: generate_profile_summary(static_answers, chat_history, gateway=gateway)
+            )
+    
+    # Le contexte copié garde le nom de la page pour les mesures
+    future = get_prefetch_pool().submit(contextvars.copy_context().run, run)
+    record.prefetch = (key, future, abandoned)
+
+@METRICS.timed("store_data_to_sheet")
 def store_data_to_sheet(user_id, data_dict, score, feedback):
-    """Enregistre dans Google Sheets le profil de l'utilisateur."""
+    """Enregistre dans Google Sheets le profil de l'utilisateur (écriture différée, groupée par lots)."""
     try:
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         data_str = json.dumps(data_dict, ensure_ascii=False)
         row = [user_id, timestamp, data_str, score, feedback]
-        sheet.append_row(row)
+        get_sheet_writer().submit(user_id, row)
     except Exception as e:
         st.error(f"Erreur lors de l'enregistrement des données : {e}")
 
-def get_all_data_as_df():
-    """Récupère toutes les données de la Google Sheet sous forme de DataFrame."""
-    try:
-        records = sheet.get_all_values()
-        if not records or len(records) < 2:
-            return pd.DataFrame()
-        return pd.DataFrame(records[1:], columns=records[0])
-    except Exception as e:
-        st.error(f"Erreur lors de la récupération des données : {e}")
-        return pd.DataFrame()
-
-def compute_compatibility(user_static, other_static):
-    """
-    Calcule un pourcentage de compatibilité entre deux utilisateurs à partir de critères pondérés.
-    Pondérations (total max = 17.5 points) :
-      - Orientation : 1.5
-      - Genre : 1.0
-      - Fumeur : 2.0
-      - Enfants : 2.5
-      - Rythme de vie : 2.0
-      - Valeurs en couple : 3.0
-      - Journée idéale : 2.5
-      - Engagement : 3.0
-    """
-    total_weight = 17.5
-    user_score = 0.0
-    if user_static.get("orientation") == other_static.get("orientation"):
-        user_score += 1.5
-    if user_static.get("gender") == other_static.get("gender"):
-        user_score += 1.0
-    if user_static.get("is_smoker") == other_static.get("is_smoker"):
-        user_score += 2.0
-    if user_static.get("wants_children") == other_static.get("wants_children"):
-        user_score += 2.5
-    if user_static.get("lifestyle") == other_static.get("lifestyle"):
-        user_score += 2.0
-    user_values = set(user_static.get("couple_values", []))
-    other_values = set(other_static.get("couple_values", []))
-    if user_values or other_values:
-        ratio = len(user_values.intersection(other_values)) / len(user_values.union(other_values))
-        user_score += 3.0 * ratio
-    if user_static.get("ideal_day") == other_static.get("ideal_day"):
-        user_score += 2.5
-    try:
-        eng_user = float(user_static.get("engagement", 5))
-        eng_other = float(other_static.get("engagement", 5))
-    except:
-        eng_user = 5
-        eng_other = 5
-    diff = abs(eng_user - eng_other)
-    user_score += 3.0 * (1 - diff/9)
-    return round((user_score / total_weight) * 100)
+def session():
+    """Données lourdes de la session courante (static_answers, chat_history, profile_summary)."""
+    return get_session_manager().get(st.session_state.session_key)
 
 def go_to_page(page_name):
     st.session_state.page = page_name
@@ -141,22 +282,22 @@ def go_to_page(page_name):
 # =============================================================================
 # 4. INITIALISATION DE LA SESSION
 # =============================================================================
+if "session_key" not in st.session_state:
+    st.session_state.session_key = uuid.uuid4().hex  # Clé de la session dans le gestionnaire de sessions
 if "page" not in st.session_state:
     st.session_state.page = "login"
 if "user_id" not in st.session_state:
     st.session_state.user_id = None
-if "personal_info" not in st.session_state:
-    st.session_state.personal_info = {}
-if "static_answers" not in st.session_state:
-    st.session_state.static_answers = {}
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
 if "question_count" not in st.session_state:
     st.session_state.question_count = 0  # Pour limiter le chatbot à 3 questions
-if "profile_summary" not in st.session_state:
-    st.session_state.profile_summary = ""
 if "interaction_choice" not in st.session_state:
     st.session_state.interaction_choice = None
+if "stored_profile" not in st.session_state:
+    st.session_state.stored_profile = None  # Empreinte du dernier profil envoyé à la Sheet (évite les doublons)
+if "is_admin" not in st.session_state:
+    st.session_state.is_admin = False
+if st.query_params.get("page") == "diagnostics":
+    st.session_state.page = "diagnostics"
 
 # =============================================================================
 # 5. PAGES DE L'APPLICATION
@@ -176,17 +317,12 @@ def page_login():
 # PAGE 2 : Informations personnelles
 def page_personal():
     st.title("Informations personnelles")
-    gender = st.radio("Quel est votre genre ?", ["Homme", "Femme", "Autre"])
+    gender = st.radio("Quel est votre genre ?", CHOICES["gender"])
     age = st.number_input("Quel est votre âge ?", min_value=18, max_value=120, value=25)
     location = st.text_input("Quel est votre emplacement (ville ou région) ?", value="Paris")
     if st.button("Suivant"):
-        st.session_state.personal_info.update({
-            "gender": gender,
-            "age": age,
-            "location": location
-        })
-        # Intégrer ces infos dans static_answers pour la suite
-        st.session_state.static_answers.update({
+        # Informations personnelles gardées dans static_answers pour la suite (sans copie séparée)
+        session().static_answers.update({
             "gender": gender,
             "age": age,
             "location": location
@@ -199,7 +335,7 @@ def page_values():
     with st.form(key="values_form"):
         q_values_1 = st.radio(
             "Quel est l’élément le plus important pour toi dans une relation ?",
-            ["Confiance", "Loyauté", "Indépendance", "Complicité", "Passion"]
+            CHOICES["valeur_element_plus_important"]
         )
         q_values_2 = st.slider(
             "Jusqu’à quel point es-tu prêt(e) à faire des compromis dans une relation ?",
@@ -208,12 +344,12 @@ def page_values():
         )
         q_values_3 = st.radio(
             "Préférerais-tu une relation où :",
-            ["Chacun garde ses activités et amis séparés", "On partage tout ensemble", "Un mélange des deux"]
+            CHOICES["valeur_relation_type"]
         )
         submitted = st.form_submit_button("Suivant")
     
     if submitted:
-        st.session_state.static_answers.update({
+        session().static_answers.update({
             "valeur_element_plus_important": q_values_1,
             "valeur_compromis": q_values_2,
             "valeur_relation_type": q_values_3
@@ -234,16 +370,16 @@ def page_attachment():
         )
         q_attach_2 = st.radio(
             "Que fais-tu quand ton/ta partenaire prend de la distance émotionnelle ?",
-            ["Je respecte son espace", "Je vais lui parler immédiatement", "J’angoisse et j’ai besoin d’être rassuré(e)"]
+            CHOICES["attach_distance"]
         )
         q_attach_3 = st.radio(
             "Comment réagis-tu face à une dispute de couple ?",
-            ["Je fuis et évite le conflit", "J’essaie de résoudre immédiatement", "Je prends du recul avant d’en parler"]
+            CHOICES["attach_dispute"]
         )
         submitted = st.form_submit_button("Suivant")
     
     if submitted:
-        st.session_state.static_answers.update({
+        session().static_answers.update({
             "attach_independance": q_attach_1,
             "attach_distance": q_attach_2,
             "attach_dispute": q_attach_3
@@ -263,17 +399,16 @@ def page_communication():
         )
         q_comm_2 = st.multiselect(
             "Quel est ton langage amoureux principal ? (plusieurs choix possibles)",
-            ["Les mots et compliments", "Le contact physique", "Les petites attentions et cadeaux", 
-             "Le temps de qualité passé ensemble", "Les services rendus"]
+            MULTI_CHOICES["comm_langage_amoureux"]
         )
         q_comm_3 = st.radio(
             "Si ton/ta partenaire a une mauvaise journée, que fais-tu ?",
-            ["J’écoute et je lui parle", "J’essaie de lui changer les idées", "Je lui laisse de l’espace"]
+            CHOICES["comm_partenaire_mauvaise_journee"]
         )
         submitted = st.form_submit_button("Suivant")
     
     if submitted:
-        st.session_state.static_answers.update({
+        session().static_answers.update({
             "comm_importance": q_comm_1,
             "comm_langage_amoureux": q_comm_2,
             "comm_partenaire_mauvaise_journee": q_comm_3
@@ -288,7 +423,7 @@ def page_lifestyle():
     with st.form(key="lifestyle_form"):
         q_life_1 = st.radio(
             "Tu es plutôt :",
-            ["🌅 Du matin", "🌙 Du soir", "🔄 Ça dépend"]
+            CHOICES["lifestyle_matin_ou_soir"]
         )
         q_life_2 = st.slider(
             "Quel est ton niveau d’énergie au quotidien ?",
@@ -297,13 +432,12 @@ def page_lifestyle():
         )
         q_life_3 = st.radio(
             "À quel point es-tu organisé(e) ?",
-            ["Très structuré(e), je planifie tout", "Un bon équilibre entre planification et spontanéité", 
-             "Plutôt spontané(e), je laisse les choses venir"]
+            CHOICES["lifestyle_organisation"]
         )
         submitted = st.form_submit_button("Suivant")
     
     if submitted:
-        st.session_state.static_answers.update({
+        session().static_answers.update({
             "lifestyle_matin_ou_soir": q_life_1,
             "lifestyle_energie": q_life_2,
             "lifestyle_organisation": q_life_3
@@ -318,7 +452,7 @@ def page_sociability():
     with st.form(key="sociability_form"):
         q_soc_1 = st.radio(
             "Es-tu plutôt :",
-            ["🗣️ Extraverti(e)", "🤔 Introverti(e)", "⚖️ Ambiverti(e)"]
+            CHOICES["soc_extraverti_intro"]
         )
         q_soc_2 = st.slider(
             "Quelle importance accordes-tu aux amis dans ta vie ?",
@@ -328,7 +462,7 @@ def page_sociability():
         submitted = st.form_submit_button("Suivant")
     
     if submitted:
-        st.session_state.static_answers.update({
+        session().static_answers.update({
             "soc_extraverti_intro": q_soc_1,
             "soc_importance_amis": q_soc_2
         })
@@ -342,8 +476,7 @@ def page_vision():
     with st.form(key="vision_form"):
         q_vis_1 = st.radio(
             "Que signifie l’engagement pour toi ?",
-            ["Une union officielle (mariage, pacs)", "Un engagement mutuel sans obligation formelle", 
-             "Une vision plus libre de la relation"]
+            CHOICES["vision_engagement"]
         )
         q_vis_2 = st.slider(
             "Veux-tu des enfants ?",
@@ -352,12 +485,12 @@ def page_vision():
         )
         q_vis_3 = st.radio(
             "Serais-tu prêt(e) à une relation à distance temporaire ?",
-            ["Oui, si c’est temporaire", "Non, j’ai besoin de proximité", "Ça dépend de la situation"]
+            CHOICES["vision_distance"]
         )
         submitted = st.form_submit_button("Suivant")
     
     if submitted:
-        st.session_state.static_answers.update({
+        session().static_answers.update({
             "vision_engagement": q_vis_1,
             "vision_enfants": q_vis_2,
             "vision_distance": q_vis_3
@@ -372,7 +505,7 @@ def page_experience():
     with st.form(key="experience_form"):
         q_exp_1 = st.radio(
             "As-tu déjà vécu une relation longue durée ?",
-            ["Oui, plus de 3 ans", "Oui, entre 1 et 3 ans", "Non, jamais eu de relation longue"]
+            CHOICES["exp_relation_longue"]
         )
         q_exp_2 = st.slider(
             "As-tu déjà vécu une cohabitation avec un(e) partenaire ?",
@@ -381,13 +514,12 @@ def page_experience():
         )
         q_exp_3 = st.multiselect(
             "Quelle est la plus grande leçon que tu as tirée de tes relations passées ?",
-            ["L’importance de la communication", "Le respect des besoins de chacun", 
-             "Éviter les relations toxiques", "Trouver quelqu’un qui partage mes valeurs"]
+            MULTI_CHOICES["exp_lecon_relation"]
         )
         submitted = st.form_submit_button("Terminer")
     
     if submitted:
-        st.session_state.static_answers.update({
+        session().static_answers.update({
             "exp_relation_longue": q_exp_1,
             "exp_cohabitation": q_exp_2,
             "exp_lecon_relation": q_exp_3
@@ -399,22 +531,18 @@ def page_experience():
 def page_chatbot():
     st.title("Questions complémentaires – Chatbot")
     # Initialiser la conversation si vide
-    if not st.session_state.chat_history:
-        st.session_state.chat_history.append({
+    if not session().chat_history:
+        session().chat_history.append({
             "role": "system",
-            "content": (
-                "Tu es un chatbot de matchmaking. Tu connais déjà les informations personnelles et psychologiques de l'utilisateur : "
-                f"{st.session_state.static_answers}. Pose 3 questions complémentaires maximum sur sa personnalité et ses attentes, "
-                "sans insérer de terminaison automatique."
-            )
+            "content": chatbot_system_prompt(session().static_answers)
         })
-        st.session_state.chat_history.append({
+        session().chat_history.append({
             "role": "assistant",
             "content": "Bonjour ! Peux-tu décrire en quelques mots ce que vous recherchez en amour ?"
         })
     
     # Affichage de la conversation (hors message système)
-    for msg in st.session_state.chat_history:
+    for msg in session().chat_history:
         if msg["role"] == "system":
             continue
         elif msg["role"] == "assistant":
@@ -424,6 +552,7 @@ def page_chatbot():
     
     # Si déjà 3 réponses ont été enregistrées, terminer le questionnaire
     if st.session_state.question_count >= 3:
+        prefetch_summary()
         st.success("Vous avez répondu à 3 questions complémentaires. Le questionnaire est terminé.")
         if st.button("Voir le résumé de votre profil"):
             go_to_page("result")
@@ -433,28 +562,35 @@ def page_chatbot():
     user_msg = st.text_input("Votre réponse :")
     if st.button("Envoyer"):
         if user_msg.strip():
-            st.session_state.chat_history.append({
+            session().chat_history.append({
                 "role": "user",
                 "content": user_msg.strip()
             })
             # Incrémenter le compteur si la dernière question du chatbot contenait un "?"
-            if len(st.session_state.chat_history) >= 2:
-                last_assistant_msg = st.session_state.chat_history[-2]["content"]
+            if len(session().chat_history) >= 2:
+                last_assistant_msg = session().chat_history[-2]["content"]
                 if "?" in last_assistant_msg:
                     st.session_state.question_count += 1
             if st.session_state.question_count < 3:
-                with st.spinner("Le chatbot réfléchit..."):
-                    assistant_text = get_chatbot_response(st.session_state.chat_history)
-                st.session_state.chat_history.append({
+                # Réponse affichée token par token pendant sa génération
+                reply_box = st.empty()
+                assistant_text = get_chatbot_response(
+                    session().chat_history,
+                    on_text=lambda text: reply_box.markdown(f"**Chatbot :** {text}")
+                )
+                session().chat_history.append({
                     "role": "assistant",
                     "content": assistant_text
                 })
             else:
+                # Conversation complète : le résumé est préparé pendant que l'utilisateur lit ce message
+                prefetch_summary()
                 st.success("Vous avez répondu à 3 questions complémentaires. Le questionnaire est terminé.")
         return
     
     if st.button("Terminer maintenant"):
         st.session_state.question_count = 3
+        prefetch_summary()
         st.success("Vous avez décidé de terminer le questionnaire.")
         return
 
@@ -463,39 +599,30 @@ def page_result():
     st.title("Votre profil amoureux")
     st.write("Notre Love Psy vous a analysé et voici le profil qu'il dresse de vous !")
     
-    # Préparation des données à envoyer pour la génération du résumé
-    static_str = "\n".join([f"{k}: {v}" for k, v in st.session_state.static_answers.items()])
-    chat_str = "\n".join([
-        f"{msg['role'].upper()} : {msg['content']}"
-        for msg in st.session_state.chat_history if msg["role"] != "system"
-    ])
-    
-    # Le prompt demande expressément de s'adresser à l'utilisateur avec "vous".
-    prompt_summary = (
-        "Voici les informations d'un utilisateur (ses réponses personnelles et psychologiques, ainsi qu'un échange avec un chatbot). "
-        "Veuillez rédiger un résumé de son profil amoureux en vous adressant directement à l'utilisateur avec le pronom 'vous'. "
-        "Utilisez un ton bienveillant et professionnel, sans formules introductives génériques. "
-        "Commencez directement par décrire le profil. \n\n"
-        f"--- Informations :\n{static_str}\n---\nConversation :\n{chat_str}\n"
-    )
-    
-    with st.spinner("Génération du résumé..."):
-        try:
-            resp = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Vous êtes un expert en psychologie et en matchmaking."},
-                    {"role": "user", "content": prompt_summary}
-                ],
-                temperature=0.7,
-                max_tokens=300
+    # Un seul appel à OpenAI par profil : les reruns suivants lisent le résumé en cache.
+    # Lors de la génération, le texte s'affiche au fur et à mesure dans summary_box.
+    from summary_cache import summary_key
+    key = summary_key(session().static_answers, session().chat_history)
+    summary_box = st.empty()
+    prefetch = session().prefetch
+    try:
+        with METRICS.timer("summary"):
+            if prefetch is not None and prefetch[0] == key and not prefetch[1].done():
+                # Résumé déjà en cours de génération en arrière-plan : on attend sa fin plutôt que d'en lancer un autre
+                from concurrent.futures import wait
+                with st.spinner("Notre Love Psy termine son analyse..."):
+                    wait([prefetch[1]])
+            session().profile_summary = get_summary_cache().get_or_create(
+                key,
+                lambda: generate_profile_summary(
+                    session().static_answers, session().chat_history, on_text=summary_box.write
+                )
             )
-            st.session_state.profile_summary = resp.choices[0].message["content"].strip()
-        except Exception as e:
-            st.error(f"Erreur lors de la génération du résumé : {e}")
-            st.session_state.profile_summary = "Impossible de générer un résumé pour le moment."
+    except Exception as e:
+        st.error(f"Erreur lors de la génération du résumé : {e}")
+        session().profile_summary = "Impossible de générer un résumé pour le moment."
     
-    st.write(st.session_state.profile_summary)
+    summary_box.write(session().profile_summary)
     
     if st.button("Découvrez si nous avons quelqu’un de compatible avec vous"):
         go_to_page("matching")
@@ -503,72 +630,64 @@ def page_result():
 
 
 # PAGE 6 : Matching
-def partner_allowed(user_static, other_static):
-    """
-    Détermine si le profil 'other_static' est admissible en fonction de l'orientation sexuelle et du genre de l'utilisateur.
-    - Pour un(e) hétérosexuel(le): le partenaire doit être de genre opposé.
-    - Pour un(e) homosexuel(le): le partenaire doit être du même genre.
-    - Pour bisexuel(le), pansexuel(le) ou Autre: tous les genres sont acceptés.
-    """
-    orientation = user_static.get("orientation", "").lower()
-    user_gender = user_static.get("gender", "").lower()
-    partner_gender = other_static.get("gender", "").lower()
-    
-    if orientation == "hétérosexuel(le)":
-        return user_gender != partner_gender
-    elif orientation == "homosexuel(le)":
-        return user_gender == partner_gender
-    elif orientation in ["bisexuel(le)", "pansexuel(le)"]:
-        return True
-    else:
-        return True
-
 def page_matching():
     st.title("Recherche de match")
     st.write("Nous vérifions si nous avons un profil compatible à au moins 60% avec vous.")
     
-    # Enregistrement final du profil dans Google Sheets (score et feedback non utilisés ici)
-    store_data_to_sheet(
-        st.session_state.user_id,
-        {"static_answers": st.session_state.static_answers,
-         "chat_history": st.session_state.chat_history,
-         "profile_summary": st.session_state.profile_summary},
-        0,
-        ""
-    )
+    # Enregistrement final du profil dans Google Sheets (score et feedback non utilisés ici),
+    # une seule fois par version du profil et non à chaque rerun de la page
+    profile = {"static_answers": session().static_answers,
+               "chat_history": session().chat_history,
+               "profile_summary": session().profile_summary}
+    digest = profile_digest(profile)
+    if digest != st.session_state.stored_profile:
+        store_data_to_sheet(st.session_state.user_id, profile, 0, "")
+        st.session_state.stored_profile = digest
+        # Conversation terminée et enregistrée : elle quitte la mémoire pour la copie locale
+        get_session_manager().offload(st.session_state.session_key)
     
-    df = get_all_data_as_df()
-    if df.empty:
+    # Nouvelles lignes des seuls shards pouvant contenir un partenaire admissible, lues en parallèle :
+    # plus besoin de relire toute la population
+    from shards import eligible_shards
+    store = get_profile_store()
+    try:
+        store.sync_shards(get_sheet_shards(), eligible_shards(session().static_answers))
+    except Exception as e:
+        st.error(f"Erreur lors de la récupération des données : {e}")
+    if store.count() == 0:
         st.info("Aucun profil n’est encore enregistré.")
         return
     
-    try:
-        current_data_row = df[df["user_id"] == st.session_state.user_id]
-        if current_data_row.empty:
-            st.info("Votre profil n'a pas été trouvé dans la base.")
-            return
-        current_data = json.loads(current_data_row["data"].iloc[0])
-        current_static = current_data.get("static_answers", {})
-    except Exception:
-        current_static = st.session_state.static_answers
+    # Réponses de la session : la version qui vient d'être soumise peut encore attendre dans la file d'écriture
+    current_static = session().static_answers
+    with METRICS.timer("current_profile_lookup"):
+        # Lecture par user_id dans l'index de la copie locale : cette version y est-elle déjà ?
+        stored = store.get_data(st.session_state.user_id)
+        up_to_date = stored is not None and profile_digest(stored) == digest
     
+    # Liste précalculée si cette version du profil a déjà été traitée (limitée aux profils proches), sinon
+    # scoring des seuls profils admissibles et proches en une passe vectorisée (profils déjà encodés localement)
+    with METRICS.timer("matching"):
+        engine = store.engine()
+        match_lists = get_match_lists()
+        top = match_lists.get(st.session_state.user_id) if up_to_date else None
+        if top is not None:
+            full = len(top) >= MATCH_LIST_SIZE
+            top = [(match, score) for match, score in top
+                   if engine.is_near(current_static, match, MATCH_RADIUS_KM)]
+            if not top and full:
+                # Tous les matchs de la liste sont trop loin : d'autres profils proches peuvent exister
+                top = None
+        if top is None:
+            matcher = engine
+            if ANN_MIN_PROFILES is not None and engine.size >= ANN_MIN_PROFILES:
+                matcher = get_ann_index()
+            top = matcher.top_k(current_static, k=1, exclude_user_id=st.session_state.user_id,
+                                radius_km=MATCH_RADIUS_KM)
     best_match = None
     best_score = 0
-    for idx, row in df.iterrows():
-        if row["user_id"] == st.session_state.user_id:
-            continue
-        try:
-            other_data = json.loads(row["data"])
-            other_static = other_data.get("static_answers", {})
-        except Exception:
-            continue
-        # Filtrer par orientation/gender
-        if not partner_allowed(current_static, other_static):
-            continue
-        comp = compute_compatibility(current_static, other_static)
-        if comp > best_score:
-            best_score = comp
-            best_match = row["user_id"]
+    if top and top[0][1] > 0:
+        best_match, best_score = top[0]
     
     if not best_match:
         st.info("Aucun autre profil n’a été trouvé.")
@@ -582,40 +701,107 @@ def page_matching():
             "",
             ["discuter par chat", "par téléphone", "se rencontrer directement"]
         )
-        st.session_state.static_answers["interaction_choice"] = user_mode
+        session().static_answers["interaction_choice"] = user_mode
         if user_mode:
             st.success(f"Votre mode de communication sélectionné est : {user_mode}.")
     else:
         st.info(f"Aucun profil n’a une compatibilité >= 60%. Le meilleur match est {best_match} à {best_score}%.")
 
+# PAGE ADMIN : Diagnostics (?page=diagnostics)
+def page_diagnostics():
+    st.title("Diagnostics")
+    if "admin" not in st.secrets or "password" not in st.secrets["admin"]:
+        st.error("Page désactivée : aucun mot de passe [admin] dans les secrets.")
+        return
+    if not st.session_state.is_admin:
+        password = st.text_input("Mot de passe administrateur", type="password")
+        if not password:
+            return
+        if not hmac.compare_digest(password, st.secrets["admin"]["password"]):
+            st.error("Mot de passe incorrect.")
+            return
+        st.session_state.is_admin = True
+    
+    import pandas as pd
+    from llm import LATENCIES
+    
+    st.subheader("Opérations (depuis le démarrage du processus)")
+    operations = METRICS.snapshot()
+    if operations:
+        st.dataframe(pd.DataFrame(operations).drop(columns="buckets"), hide_index=True)
+    else:
+        st.info("Aucune mesure pour le moment.")
+    
+    st.subheader("OpenAI")
+    latencies = pd.DataFrame(list(LATENCIES))
+    if not latencies.empty:
+        st.dataframe(
+            latencies.groupby("call")[["first_token_s", "total_s"]].quantile([0.5, 0.99]).unstack(),
+        )
+    savings = pd.DataFrame(list(SAVINGS))
+    if not savings.empty:
+        st.dataframe(savings.groupby("call")[["original_tokens", "sent_tokens"]].sum())
+    gateway = get_llm_gateway()
+    st.write(f"Appels regroupés : {gateway.coalesced} — nouvelles tentatives : {gateway.retries}")
+    
+    st.subheader("Google Sheets")
+    writer = get_sheet_writer()
+    st.write(
+        f"Lignes ajoutées : {writer.rows_written}, mises à jour : {writer.rows_updated} "
+        f"en {writer.api_calls} appels — "
+        f"en attente : {len(writer.pending)} — "
+        f"remises en file après un échec : {writer.rows_failed}"
+    )
+    if writer.last_error is not None:
+        st.caption(f"Dernière erreur : {writer.last_error}")
+    
+    st.subheader("Sessions")
+    sessions = get_session_manager().stats()
+    st.write(
+        f"En mémoire : {sessions['resident']} (dont {sessions['offloaded']} avec la conversation déchargée) — "
+        f"évincées : {sessions['evicted_total']}, rechargées : {sessions['restored_total']}"
+    )
+    
+    st.download_button("Exporter (Prometheus)", METRICS.to_prometheus(), file_name="onelove_metrics.prom")
+    st.download_button("Exporter (JSON)", METRICS.to_json(), file_name="onelove_metrics.json")
+
 # =============================================================================
 # 7. ROUTAGE PRINCIPAL DE L'APPLICATION
 # =============================================================================
 def main():
-    if st.session_state.page == "login":
-        page_login()
-    elif st.session_state.page == "personal":
-        page_personal()
-    elif st.session_state.page == "values":
-        page_values()
-    elif st.session_state.page == "attachment":
-        page_attachment()
-    elif st.session_state.page == "communication":
-        page_communication()
-    elif st.session_state.page == "lifestyle":
-        page_lifestyle()
-    elif st.session_state.page == "sociability":
-        page_sociability()
-    elif st.session_state.page == "vision":
-        page_vision()
-    elif st.session_state.page == "experience":
-        page_experience()
-    elif st.session_state.page == "chatbot":
-        page_chatbot()
-    elif st.session_state.page == "result":
-        page_result()
-    elif st.session_state.page == "matching":
-        page_matching()
+    # Chaque rerun est mesuré, et les opérations appelées par la page portent son nom
+    page = st.session_state.page
+    token = current_route.set(page)
+    try:
+        with METRICS.timer("page"):
+            if st.session_state.page == "login":
+                page_login()
+            elif st.session_state.page == "personal":
+                page_personal()
+            elif st.session_state.page == "values":
+                page_values()
+            elif st.session_state.page == "attachment":
+                page_attachment()
+            elif st.session_state.page == "communication":
+                page_communication()
+            elif st.session_state.page == "lifestyle":
+                page_lifestyle()
+            elif st.session_state.page == "sociability":
+                page_sociability()
+            elif st.session_state.page == "vision":
+                page_vision()
+            elif st.session_state.page == "experience":
+                page_experience()
+            elif st.session_state.page == "chatbot":
+                page_chatbot()
+            elif st.session_state.page == "result":
+                page_result()
+            elif st.session_state.page == "matching":
+                page_matching()
+            elif st.session_state.page == "diagnostics":
+                page_diagnostics()
+    finally:
+        current_route.reset(token)
 
 
 if __name__ == "__main__":
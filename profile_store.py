@@ -0,0 +1,295 @@
+import json
+import sqlite3
+import threading
+
+from matching import MatchingEngine
+from profiles import ProfileRecord
+
+
+# Colonnes de la Google Sheet : user_id | timestamp | data | score | feedback
+COLUMNS = ["user_id", "timestamp", "data", "score", "feedback"]
+LAST_COLUMN = "E"
+
+# Numéros de ligne locaux : shard * SHARD_ROWS + numéro de ligne dans la feuille du shard (voir shards.py).
+# Le shard 0 est la première feuille du classeur : les copies locales existantes restent valables.
+SHARD_ROWS = 10_000_000
+
+
+class ProfileStore:
+    """
+    Copie locale (SQLite) des profils de la Google Sheet.
+    La synchronisation est incrémentale : seules les lignes situées après la dernière ligne
+    connue sont téléchargées. Les static_answers sont extraites une fois pour toutes au moment
+    de la synchronisation (profil compact, voir profiles.py), pour que le matching n'ait plus
+    à relire la colonne 'data'.
+    Un index user_id -> ligne, tenu à jour à chaque écriture, permet de relire un profil (get_profile)
+    et de mettre à jour sur place la ligne d'un utilisateur qui revient (voir SheetWriter).
+    Chaque ligne porte un numéro de version (seq) : une ligne mise à jour passe en fin de population
+    pour le moteur de matching, comme une ligne ajoutée.
+    Avec plusieurs feuilles (shards), chaque shard a sa plage de numéros de ligne (SHARD_ROWS).
+    Les modifications ou suppressions faites à la main dans la Sheet ne sont pas reprises :
+    supprimer le fichier local pour repartir d'une copie complète.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            " row_index INTEGER PRIMARY KEY,"  # numéro de ligne dans la Sheet (1 = en-tête)
+            " user_id TEXT, timestamp TEXT, data TEXT, score TEXT, feedback TEXT,"
+            " static_answers TEXT)"
+        )
+        self._migrate()
+        self.conn.commit()
+        self.rows_by_user = {}  # user_id -> numéro de ligne de sa dernière version
+        for user_id, row_index in self.conn.execute("SELECT user_id, row_index FROM profiles ORDER BY seq"):
+            self.rows_by_user[user_id] = row_index
+        self.seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM profiles").fetchone()[0]
+        self._engine = None
+        self._engine_seq = None
+        self.engine_seqs = []  # position dans le moteur -> version (seq) du profil
+
+    def _migrate(self):
+        """
+        Passage des static_answers en JSON au profil compact (answers : codes de ProfileRecord,
+        location, extra). Les anciennes lignes sont converties une fois, puis leur JSON est effacé.
+        """
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(profiles)")}
+        for column, kind in (("answers", "BLOB"), ("location", "TEXT"), ("extra", "TEXT"), ("seq", "INTEGER")):
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE profiles ADD COLUMN {column} {kind}")
+        # Lignes copiées avant l'ajout des versions : l'ordre de la Sheet
+        self.conn.execute("UPDATE profiles SET seq = row_index WHERE seq IS NULL")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS profiles_seq ON profiles (seq)")
+        rows = self.conn.execute(
+            "SELECT row_index, user_id, timestamp, static_answers FROM profiles"
+            " WHERE answers IS NULL AND static_answers IS NOT NULL"
+        ).fetchall()
+        updates = []
+        for row_index, user_id, timestamp, static in rows:
+            record = ProfileRecord.from_static(user_id, timestamp, json.loads(static))
+            updates.append((*self._compact(record), row_index))
+        self.conn.executemany(
+            "UPDATE profiles SET answers = ?, location = ?, extra = ?, static_answers = NULL"
+            " WHERE row_index = ?", updates
+        )
+
+    @staticmethod
+    def _compact(record):
+        extra = json.dumps(record.extra, ensure_ascii=False) if record.extra else None
+        return record.to_bytes(), record.location, extra
+
+    # ------------------------------------------------------------------------
+    # Synchronisation avec la Google Sheet
+    # ------------------------------------------------------------------------
+    def last_row(self, shard=0):
+        """Numéro de la dernière ligne de la feuille du shard déjà copiée (1 si seule l'en-tête est connue)."""
+        base = shard * SHARD_ROWS
+        with self.lock:
+            value = self.conn.execute(
+                "SELECT MAX(row_index) FROM profiles WHERE row_index > ? AND row_index < ?",
+                (base, base + SHARD_ROWS)
+            ).fetchone()[0]
+        return value - base if value is not None else 1
+
+    def sync(self, sheet, shard=0):
+        """Télécharge les nouvelles lignes de la feuille et renvoie le nombre de profils ajoutés."""
+        with self.lock:
+            start = self.last_row(shard) + 1
+            return self.add_rows(shard * SHARD_ROWS + start, self._fetch(sheet, start))
+
+    def sync_shards(self, sheets, shards=None):
+        """
+        Télécharge en parallèle les nouvelles lignes de chaque shard (ShardedSheets, tous ou seulement 'shards')
+        et renvoie le nombre de profils ajoutés. Les lignes des différents shards sont insérées dans l'ordre
+        de leur date d'enregistrement.
+        """
+        def fetch(shard, sheet):
+            start = self.last_row(shard) + 1
+            return [(shard * SHARD_ROWS + start + offset, row) for offset, row in enumerate(self._fetch(sheet, start))]
+
+        rows = [entry for entries in sheets.map(fetch, shards).values() for entry in entries]
+        # Deux synchronisations simultanées peuvent lire les mêmes lignes : les doublons sont ignorés à l'insertion
+        rows.sort(key=lambda entry: entry[1][1] if len(entry[1]) > 1 else "")
+        return self._insert(rows)
+
+    @staticmethod
+    def _fetch(sheet, start):
+        try:
+            return sheet.get_values(f"A{start}:{LAST_COLUMN}")
+        except Exception as e:
+            # La plage démarre après la dernière ligne de la grille : rien de nouveau
+            if "exceeds grid limits" in str(e):
+                return []
+            raise
+
+    def add_rows(self, start, rows):
+        """Insère des lignes brutes de la Sheet, la première portant le numéro 'start'."""
+        return self._insert([(start + offset, row) for offset, row in enumerate(rows)])
+
+    def _insert(self, rows):
+        records = []
+        for row_index, row in rows:
+            row = list(row) + [""] * (len(COLUMNS) - len(row))
+            if not any(row):
+                continue
+            records.append((row_index, *row[:len(COLUMNS)], *self._parse(row)))
+        if not records:
+            return 0
+        with self.lock:
+            records = [(*record, self.seq + i) for i, record in enumerate(records, 1)]
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO profiles"
+                f" (row_index, {', '.join(COLUMNS)}, answers, location, extra, seq)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", records
+            )
+            self.conn.commit()
+            self.seq += len(records)
+            for record in records:
+                self.rows_by_user[record[1]] = record[0]
+        return len(records)
+
+    def update_rows(self, rows):
+        """
+        Remplace sur place des lignes déjà copiées, après leur mise à jour dans la Sheet.
+        rows : couples (numéro de ligne, ligne brute). Chaque ligne reçoit un nouveau numéro de version.
+        """
+        updates = []
+        for row_index, row in rows:
+            row = list(row) + [""] * (len(COLUMNS) - len(row))
+            updates.append((*row[:len(COLUMNS)], *self._parse(row), row_index))
+        if not updates:
+            return 0
+        with self.lock:
+            updates = [(*update[:-1], self.seq + i, update[-1]) for i, update in enumerate(updates, 1)]
+            self.conn.executemany(
+                f"UPDATE profiles SET {', '.join(c + ' = ?' for c in COLUMNS)},"
+                " answers = ?, location = ?, extra = ?, seq = ? WHERE row_index = ?", updates
+            )
+            self.conn.commit()
+            self.seq += len(updates)
+            for update in updates:
+                self.rows_by_user[update[0]] = update[-1]
+        return len(updates)
+
+    def _parse(self, row):
+        try:
+            return self._compact(ProfileRecord.from_row(row))
+        except Exception:
+            return (None, None, None)  # 'data' illisible : la ligne est gardée mais ignorée par le matching
+
+    # ------------------------------------------------------------------------
+    # Lectures locales
+    # ------------------------------------------------------------------------
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+
+    def row_of(self, user_id):
+        """Numéro de ligne de la dernière version du profil de user_id, ou None."""
+        with self.lock:
+            return self.rows_by_user.get(user_id)
+
+    def get_profile(self, user_id):
+        """Dernière version du profil de user_id (ProfileRecord), ou None si inconnu ou illisible."""
+        with self.lock:
+            row_index = self.rows_by_user.get(user_id)
+            if row_index is None:
+                return None
+            row = self.conn.execute(
+                "SELECT timestamp, answers, location, extra FROM profiles WHERE row_index = ?", (row_index,)
+            ).fetchone()
+        if row is None or row[1] is None:
+            return None
+        timestamp, answers, location, extra = row
+        return ProfileRecord.from_bytes(user_id, timestamp, answers, location, extra,
+                                        loader=lambda: self._load_text(row_index))
+
+    def get_data(self, user_id):
+        """Colonne 'data' (dictionnaire) de la dernière version du profil de user_id, ou None si inconnu ou illisible."""
+        with self.lock:
+            row_index = self.rows_by_user.get(user_id)
+            if row_index is None:
+                return None
+            row = self.conn.execute("SELECT data FROM profiles WHERE row_index = ?", (row_index,)).fetchone()
+        try:
+            return json.loads(row[0])
+        except Exception:
+            return None
+
+    def records(self):
+        """Renvoie toutes les lignes au format de la Sheet (liste de listes, sans l'en-tête)."""
+        with self.lock:
+            cursor = self.conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM profiles ORDER BY row_index"
+            )
+            return [list(r) for r in cursor.fetchall()]
+
+    def versions(self, after_seq=0, limit=10_000):
+        """
+        Au plus 'limit' lignes de version supérieure à after_seq, dans l'ordre des versions, lisibles ou non :
+        (seq, row_index, user_id, timestamp, answers, location, extra, score, feedback).
+        Pour lire toute la base par lots (export) : rappeler avec le seq de la dernière ligne reçue.
+        """
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT seq, row_index, user_id, timestamp, answers, location, extra, score, feedback"
+                " FROM profiles WHERE seq > ? ORDER BY seq LIMIT ?", (after_seq, limit)
+            )
+            return cursor.fetchall()
+
+    def profiles(self, after_seq=0):
+        """
+        Renvoie les profils compacts (ProfileRecord) lisibles de version supérieure à after_seq,
+        dans l'ordre des versions (l'ordre de la Sheet, les lignes mises à jour en dernier).
+        La conversation et le résumé ne sont lus dans la base qu'au premier accès.
+        """
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT row_index, user_id, timestamp, answers, location, extra FROM profiles"
+                " WHERE answers IS NOT NULL AND seq > ? ORDER BY seq",
+                (after_seq,)
+            )
+            rows = cursor.fetchall()
+        return [
+            ProfileRecord.from_bytes(user_id, timestamp, answers, location, extra,
+                                     loader=lambda row_index=row_index: self._load_text(row_index))
+            for row_index, user_id, timestamp, answers, location, extra in rows
+        ]
+
+    def _seqs(self, after_seq=0):
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT seq FROM profiles WHERE answers IS NOT NULL AND seq > ? ORDER BY seq", (after_seq,)
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def _load_text(self, row_index):
+        with self.lock:
+            data = self.conn.execute("SELECT data FROM profiles WHERE row_index = ?", (row_index,)).fetchone()[0]
+        data = json.loads(data)
+        return data.get("chat_history", []), data.get("profile_summary", "")
+
+    def statics(self, after_seq=0):
+        """Renvoie les couples (user_id, static_answers) des profils lisibles de version supérieure à after_seq, dans l'ordre des versions."""
+        return [(record.user_id, record.static_answers()) for record in self.profiles(after_seq)]
+
+    def engine(self):
+        """
+        Moteur de matching sur tous les profils, complété avec les seules versions apparues depuis le dernier appel.
+        Une ligne mise à jour y entre comme un nouveau profil ; l'ancienne version reste encodée jusqu'au
+        redémarrage mais n'est plus candidate (MatchingEngine.current).
+        """
+        with self.lock:
+            if self._engine is None:
+                self._engine = MatchingEngine()
+                self._engine_seq = 0
+            if self._engine_seq != self.seq:
+                pairs = self.statics(after_seq=self._engine_seq)
+                self.engine_seqs.extend(self._seqs(after_seq=self._engine_seq))
+                self._engine.extend([p[0] for p in pairs], [p[1] for p in pairs])
+                self._engine_seq = self.seq
+            return self._engine
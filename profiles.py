@@ -0,0 +1,126 @@
+import json
+import sys
+from array import array
+
+from questions import CHOICES, MULTI_CHOICES, QUESTION_ORDER
+
+
+# Réponses codées dans le tableau compact, dans l'ordre des pages (location reste du texte)
+CODED_FIELDS = [key for key in QUESTION_ORDER if key != "location"]
+_CODE_INDEX = {key: i for i, key in enumerate(CODED_FIELDS)}
+ABSENT = -1
+
+
+def _encode(key, value):
+    """Code entier d'une réponse, ou None si elle ne rentre pas dans le codage (gardée telle quelle)."""
+    if key in CHOICES:
+        try:
+            return CHOICES[key].index(value)
+        except ValueError:
+            return None
+    if key in MULTI_CHOICES:
+        if not isinstance(value, list):
+            return None
+        options = MULTI_CHOICES[key]
+        mask = 0
+        for v in value:
+            if v not in options:
+                return None
+            mask |= 1 << options.index(v)
+        return mask
+    # Curseurs et âge : entiers
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value < 2 ** 15:
+        return value
+    return None
+
+
+def _decode(key, code):
+    if key in CHOICES:
+        return CHOICES[key][code]
+    if key in MULTI_CHOICES:
+        return [option for i, option in enumerate(MULTI_CHOICES[key]) if code & (1 << i)]
+    return code
+
+
+class ProfileRecord:
+    """
+    Profil compact : les réponses du questionnaire sont codées dans un array('h')
+    (indice de l'option pour les choix uniques, masque de bits pour les choix multiples,
+    valeur pour les curseurs et l'âge). Les réponses hors vocabulaire sont gardées dans 'extra'.
+    Les choix multiples sont relus dans l'ordre des options et non dans celui de la saisie.
+    Les champs lourds (chat_history, profile_summary) ne sont lus qu'à la demande, via loader().
+    """
+
+    __slots__ = ("user_id", "timestamp", "codes", "location", "extra", "_loader", "_text")
+
+    def __init__(self, user_id, timestamp, codes, location=None, extra=None, loader=None):
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.codes = codes
+        # Les villes reviennent souvent : une seule chaîne en mémoire par ville
+        self.location = sys.intern(location) if location else location
+        self.extra = extra
+        self._loader = loader
+        self._text = None
+
+    @classmethod
+    def from_static(cls, user_id, timestamp, static_answers, loader=None):
+        codes = array("h", [ABSENT] * len(CODED_FIELDS))
+        extra = {}
+        for key, value in static_answers.items():
+            if key == "location" and isinstance(value, str):
+                continue
+            code = _encode(key, value) if key in CODED_FIELDS else None
+            if code is None:
+                extra[key] = value
+            else:
+                codes[_CODE_INDEX[key]] = code
+        location = static_answers.get("location")
+        return cls(user_id, timestamp, codes, location if isinstance(location, str) else None, extra or None, loader)
+
+    @classmethod
+    def from_row(cls, row):
+        """Migration d'une ligne de la Google Sheet (user_id, timestamp, data JSON, ...) vers un profil compact."""
+        data = json.loads(row[2])
+        record = cls.from_static(row[0], row[1], data.get("static_answers", {}))
+        record._text = (data.get("chat_history", []), data.get("profile_summary", ""))
+        return record
+
+    @classmethod
+    def from_bytes(cls, user_id, timestamp, blob, location=None, extra=None, loader=None):
+        codes = array("h")
+        codes.frombytes(blob)
+        # Profil enregistré avant l'ajout de nouvelles questions
+        codes.extend([ABSENT] * (len(CODED_FIELDS) - len(codes)))
+        return cls(user_id, timestamp, codes, location, json.loads(extra) if extra else None, loader)
+
+    def to_bytes(self):
+        return self.codes.tobytes()
+
+    def static_answers(self):
+        """Reconstitue le dictionnaire static_answers (ordre des pages, puis réponses hors questionnaire)."""
+        static = {}
+        for key in QUESTION_ORDER:
+            if key == "location":
+                if self.location is not None:
+                    static[key] = self.location
+                continue
+            code = self.codes[_CODE_INDEX[key]]
+            if code != ABSENT:
+                static[key] = _decode(key, code)
+        if self.extra:
+            static.update(self.extra)
+        return static
+
+    def _load_text(self):
+        if self._text is None:
+            self._text = self._loader() if self._loader is not None else ([], "")
+        return self._text
+
+    @property
+    def chat_history(self):
+        return self._load_text()[0]
+
+    @property
+    def profile_summary(self):
+        return self._load_text()[1]
@@ -0,0 +1,193 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+
+logger = logging.getLogger(__name__)
+
+# Surcoût en tokens de chaque message et de l'amorce de réponse (format chat d'OpenAI)
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+# Tokens économisés à chaque appel : {"call", "original_tokens", "sent_tokens", "timestamp"}
+SAVINGS = deque(maxlen=1000)
+_savings_lock = threading.Lock()
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_WORD = re.compile(r"\w+|[^\w\s]")
+
+
+def _get_encoding():
+    """Encodeur tiktoken du modèle, chargé au premier comptage ; False s'il n'est pas disponible."""
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
+            except Exception as e:
+                logger.info("tiktoken indisponible, comptage approximatif des tokens : %s", e)
+                _encoding = False
+        return _encoding
+
+
+def count_tokens(text):
+    """Nombre de tokens d'un texte (exact avec tiktoken, sinon environ 4 caractères par token et par mot)."""
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return sum((len(word) + 3) // 4 for word in _WORD.findall(text))
+
+
+def count_message_tokens(messages):
+    """Nombre de tokens d'une liste de messages, tel que facturé par l'API chat."""
+    return sum(TOKENS_PER_MESSAGE + count_tokens(m["content"]) for m in messages) + TOKENS_PER_REPLY
+
+
+def compact_static(static_answers):
+    """
+    Réponses du questionnaire, une « clé: valeur » par ligne, au lieu du repr Python du dictionnaire
+    (accolades, guillemets et crochets coûtent des tokens sans rien apporter au modèle).
+    Les choix multiples vides sont omis.
+    """
+    lines = []
+    for key, value in static_answers.items():
+        if isinstance(value, list):
+            if not value:
+                continue
+            value = ", ".join(str(v) for v in value)
+        lines.append(f"{key}: {value}")
+    return "\n".join(lines)
+
+
+def chatbot_system_prompt(static_answers, compact=True):
+    """Message système du chatbot ; compact=False donne la version d'origine (repr du dictionnaire)."""
+    answers = f"\n{compact_static(static_answers)}\n" if compact else f"{static_answers}. "
+    return (
+        "Tu es un chatbot de matchmaking. Tu connais déjà les informations personnelles et psychologiques de l'utilisateur : "
+        f"{answers}Pose 3 questions complémentaires maximum sur sa personnalité et ses attentes, "
+        "sans insérer de terminaison automatique."
+    )
+
+
+def _truncate(text, max_tokens):
+    """Début du texte tenant en max_tokens tokens, suivi de « … »."""
+    encoding = _get_encoding()
+    if encoding:
+        return encoding.decode(encoding.encode(text)[:max_tokens]).rstrip() + " …"
+    kept, used = [], 0
+    for word in text.split():
+        used += count_tokens(word)
+        if used > max_tokens:
+            break
+        kept.append(word)
+    return " ".join(kept) + " …"
+
+
+def fit_budget(messages, budget, min_tokens=20):
+    """
+    Conversation tenant dans 'budget' tokens : les messages système et le dernier message sont
+    toujours gardés, puis les tours les plus récents. Le premier tour qui ne tient plus est tronqué
+    (s'il en reste au moins min_tokens), les plus anciens sont remplacés par une note.
+    """
+    system = [m for m in messages if m["role"] == "system"]
+    turns = [m for m in messages if m["role"] != "system"]
+    if not turns:
+        return list(system)
+    kept = [turns[-1]]
+    used = count_message_tokens(system + kept)
+    omitted = 0
+    for i in range(len(turns) - 2, -1, -1):
+        message = turns[i]
+        cost = TOKENS_PER_MESSAGE + count_tokens(message["content"])
+        if used + cost <= budget:
+            kept.append(message)
+            used += cost
+            continue
+        room = budget - used - TOKENS_PER_MESSAGE
+        if room >= min_tokens:
+            kept.append({"role": message["role"], "content": _truncate(message["content"], room)})
+            omitted = i
+        else:
+            omitted = i + 1
+        break
+    kept.reverse()
+    if omitted:
+        note = {"role": "system", "content": f"({omitted} messages précédents omis)"}
+        return system + [note] + kept
+    return system + kept
+
+
+def record_savings(call, original_tokens, sent_tokens):
+    with _savings_lock:
+        SAVINGS.append({
+            "call": call,
+            "original_tokens": original_tokens,
+            "sent_tokens": sent_tokens,
+            "timestamp": time.time(),
+        })
+    logger.info("%s : %d tokens envoyés au lieu de %d", call, sent_tokens, original_tokens)
+
+
+def chat_messages(static_answers, chat_history, budget):
+    """
+    Messages envoyés au chatbot : historique ramené à 'budget' tokens.
+    Renvoie (messages, tokens de l'historique complet avec le repr du dictionnaire, tokens envoyés).
+    """
+    original = [
+        {"role": "system", "content": chatbot_system_prompt(static_answers, compact=False)}
+        if m["role"] == "system" else m
+        for m in chat_history
+    ]
+    messages = fit_budget(chat_history, budget)
+    return messages, count_message_tokens(original), count_message_tokens(messages)
+
+
+SUMMARY_SYSTEM = "Vous êtes un expert en psychologie et en matchmaking."
+
+
+def _summary_prompt(static_str, chat_str):
+    # Le prompt demande expressément de s'adresser à l'utilisateur avec "vous".
+    return (
+        "Voici les informations d'un utilisateur (ses réponses personnelles et psychologiques, ainsi qu'un échange avec un chatbot). "
+        "Veuillez rédiger un résumé de son profil amoureux en vous adressant directement à l'utilisateur avec le pronom 'vous'. "
+        "Utilisez un ton bienveillant et professionnel, sans formules introductives génériques. "
+        "Commencez directement par décrire le profil. \n\n"
+        f"--- Informations :\n{static_str}\n---\nConversation :\n{chat_str}\n"
+    )
+
+
+def _transcript(messages):
+    return "\n".join(
+        m["content"] if m["role"] == "system" else f"{m['role'].upper()} : {m['content']}"
+        for m in messages
+    )
+
+
+def summary_messages(static_answers, chat_history, budget):
+    """
+    Messages de la demande de résumé : réponses compactes et conversation ramenée à 'budget' tokens.
+    Renvoie (messages, tokens du prompt d'origine, tokens envoyés).
+    """
+    turns = [m for m in chat_history if m["role"] != "system"]
+    original_static = "\n".join([f"{k}: {v}" for k, v in static_answers.items()])
+    original = [
+        {"role": "system", "content": SUMMARY_SYSTEM},
+        {"role": "user", "content": _summary_prompt(original_static, _transcript(turns))},
+    ]
+
+    static_str = compact_static(static_answers)
+    fixed = count_message_tokens([
+        {"role": "system", "content": SUMMARY_SYSTEM},
+        {"role": "user", "content": _summary_prompt(static_str, "")},
+    ])
+    # Chaque tour coûte son préfixe « ROLE : » au lieu du surcoût d'un message
+    kept = fit_budget(turns, max(budget - fixed, 0) + TOKENS_PER_REPLY)
+    messages = [
+        {"role": "system", "content": SUMMARY_SYSTEM},
+        {"role": "user", "content": _summary_prompt(static_str, _transcript(kept))},
+    ]
+    return messages, count_message_tokens(original), count_message_tokens(messages)
@@ -0,0 +1,67 @@
+# =============================================================================
+# RÉPONSES POSSIBLES DU QUESTIONNAIRE
+# =============================================================================
+# Source unique des choix proposés par les pages : l'ordre des options sert aussi
+# à coder les réponses dans les profils compacts (profiles.py). Ne jamais réordonner
+# ni supprimer une option existante, seulement en ajouter à la fin.
+
+# Réponses à choix unique (st.radio)
+CHOICES = {
+    "gender": ["Homme", "Femme", "Autre"],
+    "valeur_element_plus_important": ["Confiance", "Loyauté", "Indépendance", "Complicité", "Passion"],
+    "valeur_relation_type": [
+        "Chacun garde ses activités et amis séparés", "On partage tout ensemble", "Un mélange des deux"
+    ],
+    "attach_distance": [
+        "Je respecte son espace", "Je vais lui parler immédiatement", "J’angoisse et j’ai besoin d’être rassuré(e)"
+    ],
+    "attach_dispute": [
+        "Je fuis et évite le conflit", "J’essaie de résoudre immédiatement", "Je prends du recul avant d’en parler"
+    ],
+    "comm_partenaire_mauvaise_journee": [
+        "J’écoute et je lui parle", "J’essaie de lui changer les idées", "Je lui laisse de l’espace"
+    ],
+    "lifestyle_matin_ou_soir": ["🌅 Du matin", "🌙 Du soir", "🔄 Ça dépend"],
+    "lifestyle_organisation": [
+        "Très structuré(e), je planifie tout", "Un bon équilibre entre planification et spontanéité",
+        "Plutôt spontané(e), je laisse les choses venir"
+    ],
+    "soc_extraverti_intro": ["🗣️ Extraverti(e)", "🤔 Introverti(e)", "⚖️ Ambiverti(e)"],
+    "vision_engagement": [
+        "Une union officielle (mariage, pacs)", "Un engagement mutuel sans obligation formelle",
+        "Une vision plus libre de la relation"
+    ],
+    "vision_distance": ["Oui, si c’est temporaire", "Non, j’ai besoin de proximité", "Ça dépend de la situation"],
+    "exp_relation_longue": ["Oui, plus de 3 ans", "Oui, entre 1 et 3 ans", "Non, jamais eu de relation longue"],
+}
+
+# Réponses à choix multiples (st.multiselect)
+MULTI_CHOICES = {
+    "comm_langage_amoureux": [
+        "Les mots et compliments", "Le contact physique", "Les petites attentions et cadeaux",
+        "Le temps de qualité passé ensemble", "Les services rendus"
+    ],
+    "exp_lecon_relation": [
+        "L’importance de la communication", "Le respect des besoins de chacun",
+        "Éviter les relations toxiques", "Trouver quelqu’un qui partage mes valeurs"
+    ],
+}
+
+# Curseurs de 1 à 10 (st.slider)
+SLIDERS = [
+    "valeur_compromis", "attach_independance", "comm_importance", "lifestyle_energie",
+    "soc_importance_amis", "vision_enfants", "exp_cohabitation",
+]
+SLIDER_RANGE = (1, 10)
+
+# Ordre des réponses, tel que les pages les remplissent
+QUESTION_ORDER = [
+    "gender", "age", "location",
+    "valeur_element_plus_important", "valeur_compromis", "valeur_relation_type",
+    "attach_independance", "attach_distance", "attach_dispute",
+    "comm_importance", "comm_langage_amoureux", "comm_partenaire_mauvaise_journee",
+    "lifestyle_matin_ou_soir", "lifestyle_energie", "lifestyle_organisation",
+    "soc_extraverti_intro", "soc_importance_amis",
+    "vision_engagement", "vision_enfants", "vision_distance",
+    "exp_relation_longue", "exp_cohabitation", "exp_lecon_relation",
+]
@@ -0,0 +1,262 @@
+"""
+Recalcul des matchs de tous les profils, hors de l'application (par exemple après un changement
+des poids du schéma de score ; --schema permet d'essayer un autre schéma avant de le mettre en place).
+
+Les profils sont lus dans la copie locale SQLite (--db), dans un export CSV de la Google Sheet
+(--csv, colonnes user_id, timestamp, data, ...) ou dans un export en colonnes (--export, voir export.py).
+Seule la dernière version du profil de chaque utilisateur est prise en compte. Le travail est découpé
+en blocs d'utilisateurs répartis sur un ProcessPoolExecutor ; chaque bloc est écrit dans son propre
+fichier part-NNNNN.csv du dossier de sortie, ce qui sert aussi de point de reprise : avec --resume,
+les blocs déjà écrits sont sautés.
+
+Avec --seed-match-lists (profils lus avec --db, mode top-k), les listes calculées remplacent celles
+que l'application tient à jour (tables match_lists et match_state de la copie locale) : l'application
+reprend au profil suivant au lieu de tout rattraper au démarrage. Arrêter l'application pendant ce temps.
+
+Exemples, depuis la racine du dépôt :
+    python rescore.py --db onelove_profiles.db --out rescore --top-k 10
+    python rescore.py --csv export.csv --out rescore --all-pairs --resume
+    python rescore.py --export export_profils --out rescore
+    python rescore.py --db onelove_profiles.db --out rescore --top-k 10 --seed-match-lists
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from matching import MatchingEngine, parse_static
+from scoring import SCORING_SCHEMA_PATH, ScoringSchema
+
+
+MANIFEST = "manifest.json"
+
+# Moteur et réponses de la population, construits une fois par processus de calcul
+_engine = None
+_statics = None
+
+
+# =============================================================================
+# Lecture des profils
+# =============================================================================
+def read_csv(path):
+    """Couples (user_id, static_answers) d'un export CSV de la Sheet, en ignorant les lignes illisibles."""
+    csv.field_size_limit(sys.maxsize)
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # en-tête
+        for row in reader:
+            if len(row) < 3:
+                continue
+            static = parse_static(row[2])
+            if static is not None:
+                yield row[0], static
+
+
+def read_db(store, upto_seq=None):
+    """Couples (user_id, static_answers) des profils lisibles d'un ProfileStore, de version <= upto_seq si donné."""
+    from profiles import ProfileRecord
+    last = 0
+    while True:
+        rows = store.versions(last)
+        if not rows:
+            return
+        for seq, _, user_id, timestamp, answers, location, extra, _, _ in rows:
+            if upto_seq is not None and seq > upto_seq:
+                return
+            if answers is not None:
+                yield user_id, ProfileRecord.from_bytes(user_id, timestamp, answers, location, extra).static_answers()
+        last = rows[-1][0]
+
+
+def read_export(path):
+    """Couples (user_id, static_answers) de la dernière version de chaque profil d'un export en colonnes."""
+    from export import latest_profiles as exported_profiles, static_answers
+    for row in exported_profiles(path).to_pylist():
+        static = static_answers(row)
+        if static is not None:
+            yield row["user_id"], static
+
+
+def latest_profiles(pairs):
+    """Dernière version de chaque profil, dans l'ordre de la Sheet (même départage des ex-aequo que l'application)."""
+    latest = {}
+    for user_id, static in pairs:
+        latest.pop(user_id, None)
+        latest[user_id] = static
+    return list(latest), list(latest.values())
+
+
+# =============================================================================
+# Calcul (processus de calcul)
+# =============================================================================
+def _init_worker(user_ids, statics, schema):
+    global _engine, _statics
+    _engine = MatchingEngine(user_ids, statics, ScoringSchema.from_dict(schema))
+    _statics = statics
+
+
+def _score_block(block, start, end, k, all_pairs, out_dir):
+    """Calcule les matchs des profils [start, end) et les écrit dans part-<block>.csv ; renvoie le nombre de lignes."""
+    path = os.path.join(out_dir, f"part-{block:05d}.csv")
+    tmp_path = f"{path}.tmp"
+    count = 0
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for position in range(start, end):
+            user_id = _engine.user_ids[position]
+            candidates = _engine.index.candidates(_statics[position])
+            candidates = candidates[candidates != position]
+            if candidates.size == 0:
+                continue
+            scores = _engine.encoded_scores(_engine.encoded_at(position), candidates)
+            if all_pairs:
+                rows = [(user_id, _engine.user_ids[c], int(s)) for c, s in zip(candidates, scores)]
+            else:
+                rows = [(user_id, rank, match, score)
+                        for rank, (match, score) in enumerate(_engine.rank(candidates, scores, k), 1)]
+            writer.writerows(rows)
+            count += len(rows)
+    # Renommage atomique : un fichier part présent est toujours complet
+    os.replace(tmp_path, path)
+    return count
+
+
+# =============================================================================
+# Orchestration
+# =============================================================================
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def fingerprint(user_ids, schema, k, all_pairs, block_size):
+    digest = hashlib.sha256("\n".join(user_ids).encode("utf-8")).hexdigest()
+    return {"profiles": len(user_ids), "user_ids_sha256": digest, "schema": schema.fingerprint,
+            "mode": "all_pairs" if all_pairs else "top_k", "k": None if all_pairs else k,
+            "block_size": block_size}
+
+
+def prepare_output(out_dir, manifest, resume):
+    """Crée le dossier de sortie, ou vérifie qu'une reprise porte bien sur le même calcul."""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    if os.path.exists(manifest_path):
+        if not resume:
+            raise SystemExit(f"{out_dir} contient déjà un calcul : utiliser --resume ou un autre dossier.")
+        with open(manifest_path, encoding="utf-8") as f:
+            if json.load(f) != manifest:
+                raise SystemExit("Les profils ou les paramètres ont changé depuis le calcul en cours : reprise impossible.")
+        return
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def rescore(user_ids, statics, out_dir, schema, k=10, all_pairs=False, block_size=1000, workers=None, resume=False):
+    """Répartit les blocs restants sur les processus de calcul ; renvoie le nombre de lignes écrites."""
+    prepare_output(out_dir, fingerprint(user_ids, schema, k, all_pairs, block_size), resume)
+    blocks = [(b, start, min(start + block_size, len(user_ids)))
+              for b, start in enumerate(range(0, len(user_ids), block_size))]
+    todo = [blk for blk in blocks if not os.path.exists(os.path.join(out_dir, f"part-{blk[0]:05d}.csv"))]
+    print(f"{len(user_ids)} profils, {len(blocks)} blocs dont {len(todo)} à calculer", file=sys.stderr)
+
+    workers = workers or available_cores()
+    written = 0
+    done = len(blocks) - len(todo)
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(user_ids, statics, schema.to_dict())) as pool:
+        # Au plus deux blocs en attente par processus : la mémoire reste bornée quel que soit le nombre de blocs
+        pending = set()
+        queue = iter(todo)
+        while True:
+            for blk in queue:
+                pending.add(pool.submit(_score_block, *blk, k, all_pairs, out_dir))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                written += future.result()
+                done += 1
+            print(f"\r{done}/{len(blocks)} blocs ({time.perf_counter() - started:.0f} s)", end="", file=sys.stderr)
+    print(file=sys.stderr)
+    return written
+
+
+def merge(out_dir, all_pairs):
+    """Concatène les fichiers part-*.csv, dans l'ordre, en un seul matches.csv avec en-tête."""
+    header = ["user_id", "match_user_id", "score"] if all_pairs else ["user_id", "rank", "match_user_id", "score"]
+    path = os.path.join(out_dir, "matches.csv")
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        csv.writer(out).writerow(header)
+        for name in sorted(n for n in os.listdir(out_dir) if n.startswith("part-") and n.endswith(".csv")):
+            with open(os.path.join(out_dir, name), encoding="utf-8") as part:
+                for chunk in iter(lambda: part.read(1 << 20), ""):
+                    out.write(chunk)
+    return path
+
+
+def read_lists(out_dir):
+    """Listes {user_id: [(match_user_id, score), ...]} des fichiers part-*.csv d'un calcul top-k, dans l'ordre des rangs."""
+    lists = {}
+    for name in sorted(n for n in os.listdir(out_dir) if n.startswith("part-") and n.endswith(".csv")):
+        with open(os.path.join(out_dir, name), newline="", encoding="utf-8") as f:
+            for user_id, _, match, score in csv.reader(f):
+                lists.setdefault(user_id, []).append((match, int(score)))
+    return lists
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--db", help="copie locale SQLite des profils (onelove_profiles.db)")
+    source.add_argument("--csv", help="export CSV de la Google Sheet")
+    source.add_argument("--export", help="dossier d'un export en colonnes (export.py)")
+    parser.add_argument("--schema", default=SCORING_SCHEMA_PATH, help="schéma de score (JSON)")
+    parser.add_argument("--out", required=True, help="dossier de sortie (fichiers part-*.csv et manifest.json)")
+    parser.add_argument("--top-k", type=int, default=10, help="nombre de matchs gardés par utilisateur")
+    parser.add_argument("--all-pairs", action="store_true", help="écrire le score de chaque paire admissible")
+    parser.add_argument("--block-size", type=int, default=1000, help="utilisateurs par bloc")
+    parser.add_argument("--workers", type=int, default=None, help="processus de calcul (défaut : cœurs disponibles)")
+    parser.add_argument("--resume", action="store_true", help="reprendre un calcul interrompu dans --out")
+    parser.add_argument("--merge", action="store_true", help="réunir les blocs dans matches.csv à la fin")
+    parser.add_argument("--seed-match-lists", action="store_true",
+                        help="enregistrer les listes calculées comme listes de matchs de l'application (--db)")
+    args = parser.parse_args(argv)
+    if args.seed_match_lists and (not args.db or args.all_pairs):
+        parser.error("--seed-match-lists demande --db et le mode top-k")
+
+    store = None
+    if args.export:
+        pairs = read_export(args.export)
+    elif args.csv:
+        pairs = read_csv(args.csv)
+    else:
+        from profile_store import ProfileStore
+        store = ProfileStore(args.db)
+        # Versions lues figées à l'ouverture : les listes enregistrées portent exactement sur ces profils
+        processed_seq = store.seq
+        pairs = read_db(store, upto_seq=processed_seq)
+    user_ids, statics = latest_profiles(pairs)
+    schema = ScoringSchema.load(args.schema)
+    written = rescore(user_ids, statics, args.out, schema, k=args.top_k, all_pairs=args.all_pairs,
+                      block_size=args.block_size, workers=args.workers, resume=args.resume)
+    print(f"{written} lignes écrites dans {args.out}", file=sys.stderr)
+    if args.merge:
+        print(merge(args.out, args.all_pairs), file=sys.stderr)
+    if args.seed_match_lists:
+        from match_lists import seed_match_lists
+        lists = read_lists(args.out)
+        seed_match_lists(store, lists, processed_seq, schema.fingerprint, args.top_k)
+        print(f"Listes de matchs de {len(lists)} utilisateurs enregistrées dans {args.db}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
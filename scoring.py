@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+
+from questions import CHOICES, MULTI_CHOICES
+
+
+# Schéma de score utilisé par l'application : modifiable sans toucher au code
+SCORING_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_schema.json")
+
+# Comparaisons possibles entre deux réponses
+#   exact    : poids entier si les deux réponses sont égales (deux réponses absentes sont égales)
+#   distance : poids * (1 - écart / range) pour les curseurs ; 'default' remplace une réponse absente,
+#              et une réponse non numérique annule l'écart
+#   jaccard  : poids * |intersection| / |union| pour les choix multiples (0 si les deux sont vides)
+COMPARATORS = ("exact", "distance", "jaccard")
+
+
+class Feature:
+    """
+    Critère du score : réponse comparée, type de comparaison et poids.
+    Compilé à la création : 'table' associe chaque option connue du questionnaire à son code
+    (1, 2, ... ; 0 est réservé à la réponse absente), et points() est directement la comparaison
+    du critère. Le MatchingEngine part des mêmes codes (voir MatchingEngine.vocabularies) et le
+    score scalaire s'en sert pour les choix multiples (masques de bits au lieu d'ensembles).
+    """
+
+    __slots__ = ("key", "compare", "weight", "default", "range", "table", "points")
+
+    def __init__(self, key, compare, weight, default=None, range=None):
+        if compare not in COMPARATORS:
+            raise ValueError(f"{key} : comparaison inconnue '{compare}' (attendu : {', '.join(COMPARATORS)})")
+        if weight < 0:
+            raise ValueError(f"{key} : le poids doit être positif")
+        if compare == "distance" and (default is None or not range or range <= 0):
+            raise ValueError(f"{key} : une comparaison 'distance' demande 'default' et 'range' > 0")
+        self.key = key
+        self.compare = compare
+        self.weight = float(weight)
+        self.default = default
+        self.range = range
+        options = CHOICES.get(key, MULTI_CHOICES.get(key, [])) if compare != "distance" else []
+        self.table = {option: code for code, option in enumerate(options, 1)}
+        # points(user_static, other_static) : points apportés par ce critère (version scalaire du moteur vectorisé)
+        self.points = getattr(self, f"_{compare}")
+
+    def _exact(self, user_static, other_static):
+        return self.weight if user_static.get(self.key) == other_static.get(self.key) else 0.0
+
+    def _members(self, values):
+        """Masque de bits des options connues (codes de la table) et ensemble des autres réponses."""
+        mask = 0
+        rest = None
+        for value in values:
+            code = self.table.get(value)
+            if code is not None:
+                mask |= 1 << code
+            elif rest is None:
+                rest = {value}
+            else:
+                rest.add(value)
+        return mask, rest
+
+    def _jaccard(self, user_static, other_static):
+        user_mask, user_rest = self._members(user_static.get(self.key, []))
+        other_mask, other_rest = self._members(other_static.get(self.key, []))
+        inter = (user_mask & other_mask).bit_count()
+        union = user_mask.bit_count() + other_mask.bit_count() - inter
+        if user_rest or other_rest:
+            # Réponses hors questionnaire : comparées comme avant, en ensembles
+            common = len(user_rest & other_rest) if user_rest and other_rest else 0
+            inter += common
+            union += len(user_rest or ()) + len(other_rest or ()) - common
+        if union == 0:
+            return 0.0
+        return self.weight * (inter / union)
+
+    def _distance(self, user_static, other_static):
+        try:
+            diff = abs(float(user_static.get(self.key, self.default)) - float(other_static.get(self.key, self.default)))
+        except (TypeError, ValueError, OverflowError):
+            diff = 0.0
+        return self.weight * (1 - diff / self.range)
+
+    def to_dict(self):
+        entry = {"key": self.key, "compare": self.compare, "weight": self.weight}
+        if self.compare == "distance":
+            entry.update(default=self.default, range=self.range)
+        return entry
+
+
+class ScoringSchema:
+    """
+    Liste ordonnée des critères, compilée une seule fois : validation, tables des options, poids total et empreinte.
+    Le score scalaire (compute_compatibility) et le MatchingEngine additionnent les critères dans
+    le même ordre, ce qui garantit exactement les mêmes arrondis.
+    """
+
+    def __init__(self, features):
+        self.features = list(features)
+        keys = [f.key for f in self.features]
+        if not keys:
+            raise ValueError("Le schéma de score ne contient aucun critère")
+        if len(set(keys)) != len(keys):
+            raise ValueError("Un critère apparaît deux fois dans le schéma de score")
+        self.total_weight = sum(f.weight for f in self.features)
+        self._points = [f.points for f in self.features]
+        if self.total_weight <= 0:
+            raise ValueError("La somme des poids du schéma de score doit être positive")
+        # Change dès qu'un critère ou un poids change (listes de matchs à recalculer)
+        self.fingerprint = hashlib.sha256(
+            json.dumps(self.to_dict(), sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(Feature(**entry) for entry in data["features"])
+
+    @classmethod
+    def load(cls, path=SCORING_SCHEMA_PATH):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self):
+        return {"features": [f.to_dict() for f in self.features]}
+
+    def score(self, user_static, other_static):
+        """Pourcentage de compatibilité entre deux profils."""
+        total = 0.0
+        for points in self._points:
+            total += points(user_static, other_static)
+        return round((total / self.total_weight) * 100)
+
+
+# Schéma chargé une fois par processus
+SCHEMA = ScoringSchema.load()
@@ -0,0 +1,289 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def profile_digest(profile):
+    """Empreinte d'un profil enregistré (remplace la copie complète gardée pour éviter les doublons)."""
+    payload = json.dumps(profile, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SessionRecord:
+    """
+    Données lourdes d'une session : réponses du questionnaire, conversation du chatbot et résumé.
+    Les textes libres sont internés (une seule chaîne par ville en mémoire). Une fois la conversation
+    déchargée (offloaded), chat_history et profile_summary sont relus dans la base à chaque accès,
+    en lecture seule ; une nouvelle affectation les remet en mémoire.
+    'prefetch' est le résumé lancé en arrière-plan (clé du profil, Future, Event d'abandon), jamais enregistré.
+    """
+
+    __slots__ = ("key", "static_answers", "_chat_history", "_profile_summary", "_loader", "last_seen", "prefetch")
+
+    def __init__(self, key, static_answers=None, chat_history=None, profile_summary="", loader=None):
+        self.key = key
+        self.static_answers = static_answers if static_answers is not None else {}
+        self._chat_history = chat_history if chat_history is not None else []
+        self._profile_summary = profile_summary
+        self._loader = loader  # None : conversation en mémoire
+        self.last_seen = 0.0
+        self.prefetch = None
+
+    @property
+    def offloaded(self):
+        return self._loader is not None
+
+    @property
+    def chat_history(self):
+        if self._loader is not None:
+            return self._loader()[0]
+        return self._chat_history
+
+    @chat_history.setter
+    def chat_history(self, value):
+        if self._loader is not None:
+            self._profile_summary = self._loader()[1]
+            self._loader = None
+        self._chat_history = value
+
+    @property
+    def profile_summary(self):
+        if self._loader is not None:
+            return self._loader()[1]
+        return self._profile_summary
+
+    @profile_summary.setter
+    def profile_summary(self, value):
+        if self._loader is not None:
+            self._chat_history = self._loader()[0]
+            self._loader = None
+        self._profile_summary = value
+
+    def cancel_prefetch(self):
+        """Abandonne le résumé lancé en arrière-plan : retiré du pool s'il n'a pas démarré, sauté sinon."""
+        if self.prefetch is not None:
+            _, future, abandoned = self.prefetch
+            abandoned.set()
+            future.cancel()
+            self.prefetch = None
+
+    def compact(self):
+        """Interne les réponses en texte libre (ville...)."""
+        for key, value in self.static_answers.items():
+            if isinstance(value, str):
+                self.static_answers[key] = sys.intern(value)
+
+    def to_dict(self):
+        return {"static_answers": self.static_answers, "chat_history": self.chat_history,
+                "profile_summary": self.profile_summary, "offloaded": self.offloaded}
+
+
+class SessionStore:
+    """
+    Sessions déchargées, dans une table 'sessions' du fichier SQLite de la copie locale des profils
+    (connexion séparée : sqlite3 seul, sans charger le moteur de matching).
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Données de session temporaires : pas de synchronisation disque à chaque enregistrement
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (session_key TEXT PRIMARY KEY, data TEXT, saved_at REAL)"
+        )
+        self.conn.commit()
+
+    def save(self, key, data):
+        self.save_many([(key, data)])
+
+    def save_many(self, items):
+        """Enregistre des couples (clé de session, données) en une seule transaction."""
+        self.write([(key, json.dumps(data, ensure_ascii=False)) for key, data in items])
+
+    def write(self, sessions, answers=()):
+        """
+        Enregistre en une seule transaction des sessions complètes (clé, données en JSON) et, pour les sessions
+        déjà déchargées, leurs seules réponses (clé, static_answers en JSON) : la conversation déjà en base
+        n'est ni relue ni réécrite.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO sessions (session_key, data, saved_at) VALUES (?, ?, ?)",
+                [(key, data, now) for key, data in sessions]
+            )
+            self.conn.executemany(
+                "UPDATE sessions SET data = json_set(data, '$.static_answers', json(?)), saved_at = ?"
+                " WHERE session_key = ?",
+                [(data, now, key) for key, data in answers]
+            )
+            self.conn.commit()
+
+    def load(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM sessions WHERE session_key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def prune(self, older_than):
+        """Supprime les sessions déchargées depuis plus de older_than secondes ; renvoie leur nombre."""
+        with self.lock:
+            cursor = self.conn.execute("DELETE FROM sessions WHERE saved_at < ?", (time.time() - older_than,))
+            self.conn.commit()
+            return cursor.rowcount
+
+
+class SessionManager:
+    """
+    Données lourdes de toutes les sessions du processus (SessionRecord), hors de st.session_state
+    qui ne garde que des valeurs légères (page, user_id, compteurs, clé de session).
+      - offload(key) : conversation terminée (profil enregistré) écrite dans la base, libérée de la mémoire.
+      - Sessions inactives depuis idle_timeout secondes, ou au-delà de max_resident sessions en mémoire
+        (les moins récentes d'abord, jamais celles vues depuis moins de grace secondes) : enregistrées dans
+        la base puis évincées ; get(key) les recharge de façon transparente au retour de l'utilisateur.
+      - Les sessions déchargées depuis plus de retention secondes sont supprimées de la base.
+    Le ménage est fait par un thread de fond (start()) toutes les sweep_interval secondes, hors des requêtes
+    des utilisateurs ; les écritures dans la base se font sans bloquer get().
+    """
+
+    def __init__(self, store, idle_timeout=1800, max_resident=None, grace=60, retention=7 * 24 * 3600,
+                 sweep_interval=30, clock=time.monotonic):
+        self.store = store
+        self.idle_timeout = idle_timeout
+        self.max_resident = max_resident
+        self.grace = grace
+        self.retention = retention
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self.records = OrderedDict()  # clé de session -> SessionRecord, de la moins à la plus récente
+        self.lock = threading.RLock()
+        # Sessions évincées en cours d'écriture dans la base : get() les reprend telles quelles
+        self.evicting = {}
+        # Ordonne les écritures du ménage et celles de offload() pour une même session
+        self.saving = threading.Lock()
+        self.thread = None
+        self.stopping = threading.Event()
+        self.evicted = 0
+        self.restored = 0
+        self.offloaded = 0
+
+    def get(self, key):
+        """Enregistrement de la session 'key' (créé, ou rechargé depuis la base s'il a été évincé)."""
+        with self.lock:
+            record = self.records.get(key)
+            if record is None:
+                record = self.evicting.get(key)
+            if record is None:
+                data = self.store.load(key)
+                if data is None:
+                    record = SessionRecord(key)
+                elif data.get("offloaded"):
+                    record = SessionRecord(key, data.get("static_answers"), loader=self._loader(key))
+                    self.restored += 1
+                else:
+                    # Session évincée en cours de questionnaire : la conversation peut encore changer
+                    record = SessionRecord(key, data.get("static_answers"), data.get("chat_history"),
+                                           data.get("profile_summary", ""))
+                    self.restored += 1
+                record.compact()
+            if key not in self.records:
+                self.records[key] = record
+            self.records.move_to_end(key)
+            record.last_seen = self.clock()
+            return record
+
+    def _loader(self, key):
+        def load():
+            data = self.store.load(key) or {}
+            return data.get("chat_history", []), data.get("profile_summary", "")
+        return load
+
+    def offload(self, key):
+        """Écrit la session dans la base et ne garde en mémoire que ses réponses au questionnaire."""
+        with self.lock:
+            record = self.records.get(key)
+            if record is None or record.offloaded:
+                return
+            record.compact()
+            with self.saving:
+                self.store.save(key, dict(record.to_dict(), offloaded=True))
+            record._chat_history = None
+            record._profile_summary = None
+            record._loader = self._loader(key)
+            self.offloaded += 1
+
+    def start(self):
+        """Lance le thread de ménage : sweep() toutes les sweep_interval secondes, jusqu'à stop()."""
+        def run():
+            while not self.stopping.wait(self.sweep_interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error("Ménage des sessions impossible : %s", e)
+
+        self.thread = threading.Thread(target=run, name="session-sweep", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def sweep(self, now=None):
+        """Évince les sessions inactives (et celles au-delà de max_resident) ; renvoie leur nombre."""
+        now = self.clock() if now is None else now
+        evicted, sessions, answers = {}, [], []
+        with self.lock:
+            # Les plus anciennes en tête : on s'arrête à la première session encore active
+            for key, record in list(self.records.items()):
+                over = self.max_resident is not None and len(self.records) > self.max_resident
+                idle = now - record.last_seen
+                if idle < self.idle_timeout and not (over and idle >= self.grace):
+                    break
+                evicted[key] = self.records.pop(key)
+                # Plus personne n'attend le résumé en arrière-plan de cette session
+                record.cancel_prefetch()
+                # Sérialisé sous le verrou : la page peut modifier la session dès sa reprise
+                if record.offloaded:
+                    # Conversation déjà dans la base : seules les réponses, qui ont pu changer, sont réécrites
+                    answers.append((key, json.dumps(record.static_answers, ensure_ascii=False)))
+                else:
+                    sessions.append((key, json.dumps(record.to_dict(), ensure_ascii=False)))
+            self.evicting.update(evicted)
+            self.saving.acquire()
+        try:
+            self.store.write(sessions, answers)
+        except Exception:
+            # Rien n'a été enregistré : les sessions restent en mémoire, en tête pour le prochain ménage
+            with self.lock:
+                for key, record in reversed(evicted.items()):
+                    if key not in self.records:
+                        self.records[key] = record
+                        self.records.move_to_end(key, last=False)
+            raise
+        finally:
+            self.saving.release()
+            with self.lock:
+                for key, record in evicted.items():
+                    if self.evicting.get(key) is record:
+                        del self.evicting[key]
+        with self.lock:
+            self.evicted += len(evicted)
+        if self.retention is not None:
+            self.store.prune(self.retention)
+        return len(evicted)
+
+    def stats(self):
+        with self.lock:
+            return {"resident": len(self.records),
+                    "offloaded": sum(r.offloaded for r in self.records.values()),
+                    "evicted_total": self.evicted, "restored_total": self.restored,
+                    "offloaded_total": self.offloaded}
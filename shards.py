@@ -0,0 +1,83 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from matching import partner_allowed
+from questions import CHOICES
+
+
+# Les profils sont répartis entre plusieurs feuilles du classeur, une par genre : partner_allowed ne
+# regarde que le genre du partenaire, c'est donc la clé qui permet d'écarter des feuilles entières.
+# Le shard 0 est la première feuille du classeur (profils enregistrés avant le découpage) : il est
+# toujours lu, comme un shard qui peut contenir tous les genres.
+SHARD_GENDERS = CHOICES["gender"]
+LEGACY_SHARD = 0
+ALL_SHARDS = list(range(len(SHARD_GENDERS) + 1))
+
+
+def shard_title(shard):
+    """Nom de la feuille du shard (None : première feuille du classeur)."""
+    if shard == LEGACY_SHARD:
+        return None
+    return f"profils_{SHARD_GENDERS[shard - 1].lower()}"
+
+
+def shard_of(static_answers):
+    """Shard où enregistrer un profil (shard 0 si le genre est inconnu)."""
+    gender = str(static_answers.get("gender", "")).lower()
+    for shard, value in enumerate(SHARD_GENDERS, 1):
+        if value.lower() == gender:
+            return shard
+    return LEGACY_SHARD
+
+
+def shard_of_row(row):
+    """Shard d'une ligne brute de la Sheet (user_id, timestamp, data, ...)."""
+    try:
+        return shard_of(json.loads(row[2]).get("static_answers", {}))
+    except Exception:
+        return LEGACY_SHARD
+
+
+def eligible_shards(user_static):
+    """Shards pouvant contenir des partenaires admissibles pour user_static (même règle que partner_allowed)."""
+    return [LEGACY_SHARD] + [shard for shard, gender in enumerate(SHARD_GENDERS, 1)
+                             if partner_allowed(user_static, {"gender": gender})]
+
+
+class ShardedSheets:
+    """
+    Feuilles de tous les shards, ouvertes à la première utilisation par open_shard(shard)
+    (une SheetConnection par feuille dans l'application), et lectures en parallèle.
+    route(ligne) donne le shard où écrire une ligne brute.
+    """
+
+    def __init__(self, open_shard, shards=ALL_SHARDS, route=shard_of_row, max_workers=4):
+        self.open_shard = open_shard
+        self.shards = list(shards)
+        self.route = route
+        self.sheets = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard-read")
+
+    @classmethod
+    def single(cls, sheet):
+        """Une seule feuille (shard 0) : comportement d'avant le découpage."""
+        return cls(lambda shard: sheet, shards=[LEGACY_SHARD], route=lambda row: LEGACY_SHARD, max_workers=1)
+
+    def sheet(self, shard):
+        with self.lock:
+            if shard not in self.sheets:
+                self.sheets[shard] = self.open_shard(shard)
+            return self.sheets[shard]
+
+    def map(self, func, shards=None):
+        """Appelle func(shard, feuille) pour chaque shard, en parallèle ; renvoie {shard: résultat}."""
+        shards = self.shards if shards is None else [s for s in self.shards if s in shards]
+        call = lambda shard: func(shard, self.sheet(shard))
+        try:
+            futures = [self.pool.submit(call, shard) for shard in shards]
+        except RuntimeError:
+            # Arrêt de l'interpréteur (dernière écriture de SheetWriter) : plus de nouveaux threads
+            return {shard: call(shard) for shard in shards}
+        return {shard: future.result() for shard, future in zip(shards, futures)}
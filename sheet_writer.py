@@ -0,0 +1,216 @@
+import atexit
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from profile_store import SHARD_ROWS
+from shards import LEGACY_SHARD, ShardedSheets
+
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = (429, 500, 502, 503)
+
+
+def is_retryable(error):
+    """Quota dépassé (429) ou erreur temporaire de l'API Google."""
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) in RETRYABLE_STATUS
+
+
+class SheetWriter:
+    """
+    File d'écriture différée vers la Google Sheet.
+    Les profils soumis sont regroupés par user_id (seule la dernière version est écrite),
+    puis envoyés en un seul append_rows dès que batch_size profils sont en attente ou
+    flush_interval secondes après le premier profil en attente. Les erreurs de quota sont
+    réessayées avec un délai exponentiel. Un thread de fond fait les écritures :
+    la page n'attend jamais la Google Sheet.
+    Après un échec définitif (reprises épuisées, connexion impossible), les profils du lot reviennent
+    dans la file, sauf si une version plus récente y a été soumise entre-temps, et sont réessayés au
+    plus tôt retry_after secondes plus tard : la page ne les soumet qu'une fois.
+    'sheets' est une feuille unique ou un ShardedSheets : chaque profil est alors écrit dans la feuille
+    de son shard (un append_rows par shard).
+    Avec un ProfileStore (store), l'écriture est un upsert : la ligne d'un utilisateur déjà présent
+    dans la Sheet est remplacée sur place (batch_update) au lieu d'être ajoutée une nouvelle fois,
+    puis la copie locale est mise à jour. Avant de l'écraser, on vérifie que la ligne porte bien
+    le même user_id ; sinon (Sheet modifiée à la main) le profil est ajouté en fin de feuille.
+    Si cette vérification ne peut pas être lue, le profil revient dans la file plutôt que d'être
+    ajouté une seconde fois.
+    Une ligne de l'ancienne feuille (shard 0) est mise à jour sur place ; si le profil doit changer
+    de shard (changement de genre), la nouvelle version est ajoutée dans son shard.
+    """
+
+    def __init__(self, sheets, store=None, batch_size=50, flush_interval=2.0, max_retries=5, backoff=1.0,
+                 retry_after=30.0):
+        self.sheets = sheets if isinstance(sheets, ShardedSheets) else ShardedSheets.single(sheets)
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.retry_after = retry_after
+        self.pending = OrderedDict()  # user_id -> ligne
+        self.first_pending_at = None
+        self.retry_at = 0.0  # pas de nouvel essai avant cette date (time.monotonic) après un échec
+        self.cond = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.rows_written = 0
+        self.rows_updated = 0
+        self.api_calls = 0
+        self.rows_failed = 0  # profils remis dans la file après un échec définitif
+        self.last_error = None
+        self.thread = threading.Thread(target=self._run, name="sheet-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, user_id, row):
+        """Ajoute (ou remplace) le profil de user_id dans la file d'attente."""
+        with self.cond:
+            self.pending.pop(user_id, None)
+            self.pending[user_id] = row
+            if self.first_pending_at is None:
+                # Premier profil en attente : le thread démarre le compte à rebours
+                self.first_pending_at = time.monotonic()
+                self.cond.notify()
+            elif len(self.pending) >= self.batch_size:
+                self.cond.notify()
+
+    def flush(self):
+        """Écrit immédiatement tout ce qui est en attente (utilisé à l'arrêt du processus)."""
+        self._write(self._take())
+        if self.pending:
+            logger.error("%d profils non écrits dans la Google Sheet : %s", len(self.pending), self.last_error)
+
+    def _take(self):
+        with self.cond:
+            rows = list(self.pending.values())
+            self.pending.clear()
+            self.first_pending_at = None
+            return rows
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while True:
+                    if self.first_pending_at is None:
+                        self.cond.wait()
+                        continue
+                    now = time.monotonic()
+                    due = now if len(self.pending) >= self.batch_size else self.first_pending_at + self.flush_interval
+                    remaining = max(due, self.retry_at) - now
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+            self._write(self._take())
+
+    def _requeue(self, rows):
+        """Remet en tête de file les profils d'un lot en échec, sauf ceux dont une version plus récente attend déjà."""
+        with self.cond:
+            for row in reversed(rows):
+                if row[0] in self.pending:
+                    continue
+                self.pending[row[0]] = row
+                self.pending.move_to_end(row[0], last=False)
+                self.rows_failed += 1
+            if self.pending and self.first_pending_at is None:
+                self.first_pending_at = time.monotonic()
+            self.retry_at = time.monotonic() + self.retry_after
+            self.cond.notify()
+
+    def _write(self, rows):
+        if not rows:
+            return
+        with self.write_lock:
+            appends = {}
+            for row in rows:
+                appends.setdefault(self.sheets.route(row), []).append(row)
+            updates, failed = {}, []
+            if self.store is not None:
+                split = self._split(appends)
+                if split is None:
+                    # Sans synchronisation, on ne sait pas quelles lignes existent déjà : rien n'est écrit
+                    self._requeue(rows)
+                    return
+                updates, appends, failed = split
+            for shard, shard_updates in updates.items():
+                data = [{"range": f"A{row_index}:{_column(len(row))}{row_index}", "values": [row]}
+                        for row_index, row in shard_updates]
+                if self._call("batch_update", len(shard_updates),
+                              lambda: self.sheets.sheet(shard).batch_update(data)) is not None:
+                    self.rows_updated += len(shard_updates)
+                    self.store.update_rows([(shard * SHARD_ROWS + row_index, row) for row_index, row in shard_updates])
+                else:
+                    failed.extend(row for _, row in shard_updates)
+            for shard, shard_rows in appends.items():
+                if self._call("append_rows", len(shard_rows),
+                              lambda: self.sheets.sheet(shard).append_rows(shard_rows)) is not None:
+                    self.rows_written += len(shard_rows)
+                else:
+                    failed.extend(shard_rows)
+            if failed:
+                self._requeue(failed)
+
+    def _split(self, appends):
+        """
+        Sépare, shard par shard, les profils déjà présents dans la Sheet {shard: [(numéro de ligne, ligne)]}
+        des profils à ajouter {shard: [ligne]} et de ceux dont la ligne n'a pas pu être relue [ligne]
+        (à remettre dans la file) ; None si la copie locale n'a pas pu être synchronisée.
+        """
+        count = sum(len(rows) for rows in appends.values())
+        # Lignes ajoutées depuis la dernière synchronisation (par exemple le lot précédent)
+        if self._call("sync", count, lambda: self.store.sync_shards(self.sheets)) is None:
+            return None
+        known = {}
+        remaining = {}
+        for shard, rows in appends.items():
+            for row in rows:
+                row_index = self.store.row_of(row[0])
+                if row_index is not None and row_index // SHARD_ROWS in (shard, LEGACY_SHARD):
+                    current, local_row = divmod(row_index, SHARD_ROWS)
+                    known.setdefault(current, []).append((local_row, row))
+                else:
+                    remaining.setdefault(shard, []).append(row)
+        updates = {}
+        unread = []
+        for shard, entries in known.items():
+            cells = self._call("batch_get", len(entries),
+                               lambda: self.sheets.sheet(shard).batch_get([f"A{row_index}" for row_index, _ in entries]))
+            if cells is None:
+                # Ligne non vérifiée : l'ajouter risquerait de dupliquer le profil
+                unread.extend(row for _, row in entries)
+                continue
+            for i, (row_index, row) in enumerate(entries):
+                cell = cells[i] if i < len(cells) else None
+                if cell and cell[0] and cell[0][0] == row[0]:
+                    updates.setdefault(shard, []).append((row_index, row))
+                else:
+                    remaining.setdefault(self.sheets.route(row), []).append(row)
+        return updates, remaining, unread
+
+    def _call(self, name, count, func):
+        """Appel à la Google Sheet avec reprises ; renvoie son résultat, ou None après un échec définitif."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.api_calls += 1
+                result = func()
+                return {} if result is None else result
+            except Exception as e:
+                self.last_error = e
+                if not is_retryable(e) or attempt == self.max_retries:
+                    logger.error("Écriture de %d profils dans la Google Sheet impossible (%s), nouvel essai plus tard : %s",
+                                 count, name, e)
+                    return None
+                # Délai exponentiel avec une part d'aléatoire pour étaler les reprises
+                time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+
+
+def _column(number):
+    """Lettre de la colonne 'number' (1 -> A), pour les plages A1."""
+    name = ""
+    while number:
+        number, rest = divmod(number - 1, 26)
+        name = chr(ord("A") + rest) + name
+    return name
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def summary_key(static_answers, chat_history):
+    """Empreinte du contenu d'un profil : static_answers + conversation (hors message système)."""
+    content = {
+        "static_answers": static_answers,
+        "chat": [[m["role"], m["content"]] for m in chat_history if m["role"] != "system"],
+    }
+    payload = json.dumps(content, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """
+    Cache des résumés de profil générés par OpenAI, à deux niveaux :
+      - LRU en mémoire (max_entries résumés),
+      - optionnellement, un fichier SQLite (disk_path) avec une durée de vie (ttl, en secondes)
+        et un nombre maximum d'entrées (disk_max_entries, les plus anciennes sont supprimées).
+    get_or_create garantit un seul appel de génération par clé, même si plusieurs reruns
+    arrivent en même temps.
+    """
+
+    def __init__(self, max_entries=1024, disk_path=None, ttl=None, disk_max_entries=100000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_max_entries = disk_max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.conn = None
+        if disk_path:
+            self.conn = sqlite3.connect(disk_path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                " key TEXT PRIMARY KEY, summary TEXT, created_at REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS summaries_created ON summaries (created_at)")
+            self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+            if self.conn is None:
+                return None
+            row = self.conn.execute(
+                "SELECT summary, created_at FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            summary, created_at = row
+            if self.ttl is not None and time.time() - created_at > self.ttl:
+                self.conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self._remember(key, summary)
+            return summary
+
+    def set(self, key, summary):
+        with self.lock:
+            self._remember(key, summary)
+            if self.conn is None:
+                return
+            self.conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)", (key, summary, time.time())
+            )
+            self._evict_disk()
+            self.conn.commit()
+
+    def get_or_create(self, key, create):
+        """Renvoie le résumé en cache, ou appelle create() une seule fois pour le générer."""
+        summary = self.get(key)
+        if summary is not None:
+            return summary
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Un autre rerun a pu générer le résumé pendant qu'on attendait
+            summary = self.get(key)
+            if summary is None:
+                summary = create()
+                self.set(key, summary)
+        with self.lock:
+            self.key_locks.pop(key, None)
+        return summary
+
+    def _remember(self, key, summary):
+        self.memory[key] = summary
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _evict_disk(self):
+        if self.ttl is not None:
+            self.conn.execute("DELETE FROM summaries WHERE created_at < ?", (time.time() - self.ttl,))
+        count = self.conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+        if count > self.disk_max_entries:
+            self.conn.execute(
+                "DELETE FROM summaries WHERE key IN ("
+                " SELECT key FROM summaries ORDER BY created_at LIMIT ?)",
+                (count - self.disk_max_entries,)
+            )
@@ -0,0 +1,38 @@
+"""Index approximatif IVFIndex sur un MatchingEngine de profils synthétiques."""
+from ann import IVFIndex
+from benchmarks.synthetic import generate_profiles
+from matching import MatchingEngine
+
+
+def engine_of(count, start=0, engine=None):
+    engine = engine or MatchingEngine()
+    pairs = list(generate_profiles(count, seed=2, start=start))
+    engine.extend([u for u, _ in pairs], [s for _, s in pairs])
+    return engine
+
+
+def test_background_index_is_never_built_by_a_search():
+    engine = engine_of(2000)
+    index = IVFIndex(engine, background=True)
+    queries = [s for _, s in generate_profiles(10, seed=9)]
+    # Avant la première construction : scan exact des profils admissibles
+    for user in queries:
+        assert index.top_k(user, k=3) == engine.top_k(user, k=3)
+    assert index.snapshot is None
+
+    index.refresh()
+    assert index.indexed == 2000
+    engine_of(500, start=2000, engine=engine)
+    for user in queries:
+        index.top_k(user, k=3)
+    # Croissance au-delà de rebuild_ratio : l'ancienne construction reste servie jusqu'au prochain refresh()
+    assert index.indexed == 2000
+    index.refresh()
+    assert index.indexed == 2500
+
+
+def test_search_rebuilds_without_background():
+    engine = engine_of(2000)
+    index = IVFIndex(engine)
+    index.top_k(next(generate_profiles(1, seed=9))[1], k=3)
+    assert index.indexed == 2000
@@ -0,0 +1,119 @@
+"""Passerelle LLMGateway contre le faux serveur OpenAI local (benchmarks/fakes.py)."""
+import threading
+import time
+
+import openai
+import pytest
+
+import llm
+from benchmarks.fakes import FakeOpenAIServer
+from llm import LLMGateway
+
+
+MESSAGES = [{"role": "user", "content": "Bonjour"}]
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """Démarre un FakeOpenAIServer et y dirige le client openai."""
+    servers = []
+
+    def start(**options):
+        server = FakeOpenAIServer(**options).__enter__()
+        servers.append(server)
+        monkeypatch.setattr(openai, "api_key", "test")
+        monkeypatch.setattr(openai, "api_base", server.api_base)
+        return server
+
+    yield start
+    for server in servers:
+        server.__exit__(None, None, None)
+
+
+@pytest.fixture
+def gateway_factory():
+    gateways = []
+
+    def make(**options):
+        options = {"requests_per_minute": 60_000, "backoff": 0.01, **options}
+        gateways.append(LLMGateway(**options))
+        return gateways[-1]
+
+    yield make
+    for gateway in gateways:
+        gateway.close()
+
+
+def complete_all(gateway, prompts):
+    """Appelle complete() depuis un thread par prompt, comme des sessions Streamlit simultanées."""
+    results = [None] * len(prompts)
+
+    def call(i):
+        results[i] = gateway.complete([{"role": "user", "content": prompts[i]}], model="gpt-4")
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(prompts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_rate_limit_is_retried_after_retry_after(serve, gateway_factory):
+    server = serve(rate_limited=2, retry_after=0.3)
+    # Délai exponentiel bien plus long que Retry-After : seul ce dernier permet de finir à temps
+    gateway = gateway_factory(backoff=30)
+    start = time.perf_counter()
+    text = gateway.complete(MESSAGES, model="gpt-4")
+    elapsed = time.perf_counter() - start
+    assert text == server.reply
+    assert len(server.requests) == 3
+    assert gateway.retries == 2
+    assert 0.6 <= elapsed < 5
+
+
+def test_identical_prompts_in_flight_are_coalesced(serve, gateway_factory):
+    server = serve(first_token_delay=0.5)
+    gateway = gateway_factory()
+    results = complete_all(gateway, ["même question"] * 5)
+    assert results == [server.reply] * 5
+    assert len(server.requests) == 1
+    assert gateway.coalesced == 4
+
+
+def test_concurrency_is_limited(serve, gateway_factory):
+    server = serve(first_token_delay=0.1)
+    gateway = gateway_factory(max_concurrency=2)
+    results = complete_all(gateway, [f"question {i}" for i in range(8)])
+    assert results == [server.reply] * 8
+    assert len(server.requests) == 8
+    assert server.max_concurrent <= 2
+
+
+def test_error_after_first_token_is_not_retried(serve, gateway_factory, monkeypatch):
+    server = serve(fail_after=2)
+    # L'erreur compte comme temporaire : seul le texte déjà envoyé empêche de réessayer
+    monkeypatch.setattr(llm, "_is_retryable", lambda error: True)
+    gateway = gateway_factory()
+    partial = []
+    with pytest.raises(openai.error.APIError):
+        gateway.complete(MESSAGES, on_text=partial.append, model="gpt-4")
+    assert partial and server.reply.startswith(partial[-1])
+    assert len(server.requests) == 1
+    assert gateway.retries == 0
+
+
+def test_streaming_partial_text_and_latencies(serve, gateway_factory):
+    server = serve(first_token_delay=0.2, token_delay=0.02)
+    gateway = gateway_factory()
+    llm.LATENCIES.clear()
+    partial = []
+    text = gateway.complete(MESSAGES, on_text=partial.append, call="welcome", model="gpt-4")
+    assert text == server.reply
+    # Un appel par mot, chaque texte partiel prolonge le précédent
+    assert len(partial) == len(server.reply.split())
+    for shorter, longer in zip(partial, partial[1:]):
+        assert len(longer) > len(shorter) and longer.startswith(shorter)
+    assert partial[-1].strip() == server.reply
+    [latency] = [entry for entry in llm.LATENCIES if entry["call"] == "welcome"]
+    assert 0.2 <= latency["first_token_s"] < latency["total_s"]
@@ -0,0 +1,83 @@
+"""Listes de matchs tenues à jour (MatchLists) contre une recherche complète du moteur (top_k)."""
+import json
+import os
+import random
+
+import pytest
+
+from benchmarks.synthetic import generate_profiles
+from match_lists import MatchLists
+from profile_store import ProfileStore
+
+
+K = 5
+
+
+def rows(profiles, minute):
+    return [[user_id, f"2024-01-01 00:{minute:02d}:00", json.dumps({"static_answers": static}, ensure_ascii=False), "0", ""]
+            for user_id, static in profiles]
+
+
+def mismatches(store, lists, profiles):
+    """user_ids dont la liste diffère des k meilleurs profils admissibles de la dernière version."""
+    engine = store.engine()
+    return [user_id for user_id, static in profiles.items()
+            if lists.get(user_id) != engine.top_k(static, k=K, exclude_user_id=user_id)]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return os.path.join(tmp_path, "profiles.db")
+
+
+def test_lists_match_top_k_after_inserts_updates_and_reload(path):
+    profiles = dict(generate_profiles(300, seed=3))
+    ordered = list(profiles.items())
+    store = ProfileStore(path)
+    store.add_rows(2, rows(ordered[:150], 0))
+    lists = MatchLists(store, k=K, chunk=7)
+    assert lists.update() == 150
+    assert mismatches(store, lists, dict(ordered[:150])) == []
+
+    store.add_rows(152, rows(ordered[150:], 1))
+    assert lists.update() == 150
+    assert mismatches(store, lists, profiles) == []
+
+    # Mises à jour de profils : les listes où figurait l'ancienne version sont recalculées
+    rng = random.Random(1)
+    updated = []
+    for i, user_id in enumerate(rng.sample(sorted(profiles), 40)):
+        profiles[user_id] = next(generate_profiles(1, seed=1000 + i))[1]
+        updated.append((store.row_of(user_id), rows([(user_id, profiles[user_id])], 2)[0]))
+    store.update_rows(updated)
+    # Liste calculée pour l'ancienne version : plus servie
+    assert lists.get(updated[0][1][0]) is None
+    assert lists.update() == 40
+    assert mismatches(store, lists, profiles) == []
+    store.conn.close()
+
+    # Redémarrage : reprise au numéro de version enregistré, les anciennes versions ne sont plus dans le moteur
+    store = ProfileStore(path)
+    lists = MatchLists(store, k=K, chunk=7)
+    assert lists.processed == store.engine().size
+    assert mismatches(store, lists, profiles) == []
+    more = dict(generate_profiles(30, seed=3, start=300))
+    profiles.update(more)
+    store.add_rows(302, rows(more.items(), 3))
+    assert lists.update() == 30
+    assert mismatches(store, lists, profiles) == []
+    store.conn.close()
+
+
+def test_lists_are_recomputed_when_k_changes(path):
+    profiles = dict(generate_profiles(60, seed=5))
+    store = ProfileStore(path)
+    store.add_rows(2, rows(profiles.items(), 0))
+    MatchLists(store, k=K).update()
+    lists = MatchLists(store, k=K + 2)
+    assert lists.processed == 0
+    lists.update()
+    engine = store.engine()
+    assert all(lists.get(user_id) == engine.top_k(static, k=K + 2, exclude_user_id=user_id)
+               for user_id, static in profiles.items())
+    store.conn.close()
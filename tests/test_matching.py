@@ -0,0 +1,76 @@
+"""MatchingEngine contre la boucle scalaire d'origine (compute_compatibility, partner_allowed)."""
+import random
+
+import pytest
+
+from benchmarks.synthetic import generate_profiles
+from matching import MatchingEngine, compute_compatibility, partner_allowed
+from scoring import SCHEMA
+
+
+def messy_profiles(count, seed):
+    """Profils synthétiques abîmés comme dans la Sheet : réponses absentes, curseurs non numériques, options inconnues."""
+    rng = random.Random(seed)
+    profiles = []
+    for user_id, static in generate_profiles(count, seed=seed):
+        for feature in SCHEMA.features:
+            roll = rng.random()
+            if roll < 0.1:
+                static.pop(feature.key, None)
+            elif roll < 0.2:
+                if feature.compare == "distance":
+                    static[feature.key] = rng.choice(["", "abc", None, "7", 4.5, [3]])
+                elif feature.compare == "jaccard":
+                    static[feature.key] = static.get(feature.key, []) + ["Option inconnue"]
+                else:
+                    static[feature.key] = rng.choice(["Option inconnue", "", None, 3])
+        for key in ("gender", "orientation"):
+            if rng.random() < 0.05:
+                static.pop(key, None)
+        profiles.append((user_id, static))
+    return profiles
+
+
+def scalar_best(profiles, user_id, user_static):
+    """Ancienne boucle de page_matching : premier profil admissible au meilleur score (> 0)."""
+    best_match, best_score = None, 0
+    for other_id, other in profiles:
+        if other_id == user_id or not partner_allowed(user_static, other):
+            continue
+        score = compute_compatibility(user_static, other)
+        if score > best_score:
+            best_match, best_score = other_id, score
+    return best_match, best_score
+
+
+@pytest.fixture(scope="module")
+def population():
+    profiles = messy_profiles(400, seed=7)
+    return profiles, MatchingEngine([u for u, _ in profiles], [s for _, s in profiles])
+
+
+def test_scores_match_scalar_loop(population):
+    profiles, engine = population
+    for _, user_static in profiles[:40]:
+        expected = [compute_compatibility(user_static, other) for _, other in profiles]
+        assert engine.scores(user_static).tolist() == expected
+
+
+def test_scores_for_unseen_user(population):
+    profiles, engine = population
+    # Requêtes absentes du moteur, avec leurs propres options inconnues
+    for _, user_static in messy_profiles(20, seed=8):
+        expected = [compute_compatibility(user_static, other) for _, other in profiles]
+        assert engine.scores(user_static).tolist() == expected
+
+
+def test_top_1_matches_scalar_loop(population):
+    profiles, engine = population
+    for user_id, user_static in profiles[:80]:
+        best_match, best_score = scalar_best(profiles, user_id, user_static)
+        result = engine.top_k(user_static, k=1, exclude_user_id=user_id)
+        if best_match is None:
+            # La boucle d'origine ne retient pas un score nul
+            assert result == [] or result[0][1] == 0
+        else:
+            assert result == [(best_match, best_score)]
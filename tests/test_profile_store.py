@@ -0,0 +1,120 @@
+"""Copie locale ProfileStore synchronisée depuis une feuille en mémoire (benchmarks/fakes.py)."""
+import json
+import os
+import sqlite3
+
+import pytest
+
+from benchmarks.fakes import FakeWorksheet
+from benchmarks.synthetic import sheet_rows
+from profile_store import ProfileStore
+from questions import MULTI_CHOICES
+
+
+class LoggedWorksheet(FakeWorksheet):
+    """FakeWorksheet qui garde les plages lues par get_values."""
+
+    def __init__(self):
+        super().__init__()
+        self.ranges = []
+
+    def get_values(self, range_name):
+        self.ranges.append(range_name)
+        return super().get_values(range_name)
+
+
+def in_option_order(static):
+    """Réponses telles que relues d'un profil compact : les choix multiples dans l'ordre des options."""
+    return {key: sorted(value, key=MULTI_CHOICES[key].index) if key in MULTI_CHOICES else value
+            for key, value in static.items()}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return os.path.join(tmp_path, "profiles.db")
+
+
+@pytest.fixture
+def store(path):
+    store = ProfileStore(path)
+    yield store
+    store.conn.close()
+
+
+def test_incremental_sync_reads_only_new_rows(store):
+    sheet = LoggedWorksheet()
+    sheet.rows.extend(sheet_rows(5))
+    assert store.sync(sheet) == 5
+    assert store.last_row() == 6
+    sheet.rows.extend(sheet_rows(3, start=5))
+    assert store.sync(sheet) == 3
+    assert sheet.ranges == ["A2:E", "A7:E"]
+    assert store.count() == 8
+    assert [r[0] for r in store.records()] == [f"user{i}" for i in range(8)]
+
+
+def test_sync_without_new_rows_returns_nothing(store):
+    sheet = LoggedWorksheet()
+    sheet.rows.extend(sheet_rows(2))
+    store.sync(sheet)
+    # La plage demandée commence après la dernière ligne : l'API répond « exceeds grid limits »
+    assert store.sync(sheet) == 0
+    assert sheet.ranges[-1] == "A4:E"
+    assert store.count() == 2
+
+
+def test_other_read_errors_are_raised(store):
+    sheet = FakeWorksheet()
+
+    def failing(range_name):
+        raise RuntimeError("quota")
+
+    sheet.get_values = failing
+    with pytest.raises(RuntimeError):
+        store.sync(sheet)
+
+
+def test_unreadable_data_is_kept_but_not_matched(store):
+    sheet = FakeWorksheet()
+    sheet.rows.extend(sheet_rows(2))
+    sheet.rows.append(["broken", "2024-01-01 00:00:00", "{pas du json", "0", ""])
+    sheet.rows.append(["", "", "", "", ""])
+    sheet.rows.extend(sheet_rows(1, start=2))
+    assert store.sync(sheet) == 4
+    assert store.row_of("broken") == 4
+    assert store.get_profile("broken") is None
+    assert [record.user_id for record in store.profiles()] == ["user0", "user1", "user2"]
+    assert store.engine().user_ids == ["user0", "user1", "user2"]
+    # La ligne vide compte dans la numérotation : la synchronisation suivante repart après
+    assert store.last_row() == 6
+
+
+def test_legacy_static_answers_are_migrated(path):
+    rows = sheet_rows(3)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE profiles (row_index INTEGER PRIMARY KEY, user_id TEXT, timestamp TEXT, data TEXT,"
+        " score TEXT, feedback TEXT, static_answers TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO profiles VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(i + 2, *row, json.dumps(json.loads(row[2])["static_answers"], ensure_ascii=False))
+         for i, row in enumerate(rows)]
+    )
+    conn.commit()
+    conn.close()
+
+    store = ProfileStore(path)
+    try:
+        for row in rows:
+            data = json.loads(row[2])
+            record = store.get_profile(row[0])
+            assert record.static_answers() == in_option_order(data["static_answers"])
+            assert record.profile_summary == data["profile_summary"]
+        left = store.conn.execute("SELECT COUNT(*) FROM profiles WHERE static_answers IS NOT NULL").fetchone()[0]
+        assert left == 0
+        # Versions des anciennes lignes : l'ordre de la Sheet
+        assert store.seq == 4
+        assert store.engine().user_ids == [row[0] for row in rows]
+    finally:
+        store.conn.close()
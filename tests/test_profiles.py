@@ -0,0 +1,114 @@
+"""Profils compacts (ProfileRecord) : aller-retour des réponses par les codes int16 et 'extra'."""
+import json
+import os
+import random
+import sqlite3
+
+import pytest
+
+from benchmarks.synthetic import generate_profiles
+from profile_store import ProfileStore
+from profiles import ABSENT, CODED_FIELDS, ProfileRecord
+from questions import MULTI_CHOICES
+
+
+# Réponses que le codage ne couvre pas : gardées telles quelles dans 'extra'
+ODD_ANSWERS = [
+    ("gender", "Non binaire"),
+    ("valeur_element_plus_important", None),
+    ("valeur_compromis", "7"),
+    ("attach_independance", 4.5),
+    ("comm_importance", True),
+    ("lifestyle_energie", -1),
+    ("age", 40_000),
+    ("comm_langage_amoureux", ["Le contact physique", "Option inconnue"]),
+    ("exp_lecon_relation", "L’importance de la communication"),
+    ("location", 75),
+    ("orientation", "bisexuel(le)"),
+    ("interaction_choice", "par téléphone"),
+]
+
+
+def in_option_order(static):
+    """Les choix multiples sont relus dans l'ordre des options (masque de bits), pas dans l'ordre des clics."""
+    return {key: sorted(value, key=MULTI_CHOICES[key].index)
+            if key in MULTI_CHOICES and isinstance(value, list) and set(value) <= set(MULTI_CHOICES[key]) else value
+            for key, value in static.items()}
+
+
+def stored(record):
+    """Aller-retour par les colonnes de la base, comme ProfileStore._compact puis get_profile."""
+    extra = json.dumps(record.extra, ensure_ascii=False) if record.extra else None
+    return ProfileRecord.from_bytes(record.user_id, record.timestamp, record.to_bytes(), record.location, extra)
+
+
+def messy_profiles(count, seed):
+    rng = random.Random(seed)
+    for user_id, static in generate_profiles(count, seed=seed):
+        for key, value in rng.sample(ODD_ANSWERS, 3):
+            static[key] = value
+        for key in rng.sample(sorted(static), 2):
+            del static[key]
+        yield user_id, static
+
+
+def test_questionnaire_answers_fit_in_codes():
+    for user_id, static in generate_profiles(200, seed=1):
+        record = ProfileRecord.from_static(user_id, "t", static)
+        # Seule l'orientation (hors questionnaire) reste en dehors des codes
+        assert record.extra == {"orientation": static["orientation"]}
+        assert record.static_answers() == in_option_order(static)
+        assert stored(record).static_answers() == in_option_order(static)
+
+
+@pytest.mark.parametrize("key, value", ODD_ANSWERS)
+def test_answers_outside_the_coding_go_to_extra(key, value):
+    record = ProfileRecord.from_static("u", "t", {"gender": "Femme", key: value})
+    assert record.extra == {key: value}
+    if key in CODED_FIELDS:
+        assert record.codes[CODED_FIELDS.index(key)] == ABSENT
+    assert stored(record).static_answers() == {"gender": "Femme", key: value}
+
+
+def test_messy_answers_round_trip():
+    for user_id, static in messy_profiles(200, seed=2):
+        record = stored(ProfileRecord.from_static(user_id, "t", static))
+        assert record.static_answers() == in_option_order(static)
+
+
+def test_record_saved_before_new_questions_is_padded():
+    record = ProfileRecord.from_static("u", "t", {"gender": "Homme", "age": 30})
+    old = ProfileRecord.from_bytes("u", "t", record.to_bytes()[:4])
+    assert len(old.codes) == len(CODED_FIELDS)
+    assert old.static_answers() == {"gender": "Homme", "age": 30}
+
+
+def test_from_row_keeps_conversation_and_summary():
+    data = {"static_answers": {"gender": "Autre"}, "chat_history": [{"role": "user", "content": "Bonjour"}],
+            "profile_summary": "Résumé"}
+    record = ProfileRecord.from_row(["u", "t", json.dumps(data), "0", ""])
+    assert record.static_answers() == {"gender": "Autre"}
+    assert record.chat_history == data["chat_history"]
+    assert record.profile_summary == "Résumé"
+
+
+def test_legacy_rows_round_trip_through_migration(tmp_path):
+    path = os.path.join(tmp_path, "profiles.db")
+    profiles = list(messy_profiles(100, seed=3))
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE profiles (row_index INTEGER PRIMARY KEY, user_id TEXT, timestamp TEXT, data TEXT,"
+        " score TEXT, feedback TEXT, static_answers TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO profiles VALUES (?, ?, 't', '{}', '0', '', ?)",
+        [(i + 2, user_id, json.dumps(static, ensure_ascii=False)) for i, (user_id, static) in enumerate(profiles)]
+    )
+    conn.commit()
+    conn.close()
+
+    store = ProfileStore(path)
+    try:
+        assert store.statics() == [(user_id, in_option_order(static)) for user_id, static in profiles]
+    finally:
+        store.conn.close()
@@ -0,0 +1,131 @@
+"""Schéma de score compilé (scoring.py) : tables des options, validation et poids de l'ancien score codé en dur."""
+import random
+
+import pytest
+
+from matching import MatchingEngine, compute_compatibility
+from questions import CHOICES, MULTI_CHOICES, SLIDERS
+from scoring import SCHEMA, Feature, ScoringSchema
+
+
+# Pondérations de l'ancien compute_compatibility (total 17.5), dans son ordre d'addition
+LEGACY_FEATURES = [
+    {"key": "orientation", "compare": "exact", "weight": 1.5},
+    {"key": "gender", "compare": "exact", "weight": 1.0},
+    {"key": "is_smoker", "compare": "exact", "weight": 2.0},
+    {"key": "wants_children", "compare": "exact", "weight": 2.5},
+    {"key": "lifestyle", "compare": "exact", "weight": 2.0},
+    {"key": "couple_values", "compare": "jaccard", "weight": 3.0},
+    {"key": "ideal_day", "compare": "exact", "weight": 2.5},
+    {"key": "engagement", "compare": "distance", "weight": 3.0, "default": 5, "range": 9},
+]
+
+
+def legacy_compatibility(user_static, other_static):
+    """Ancien score codé en dur, recopié tel quel."""
+    total_weight = 17.5
+    user_score = 0.0
+    if user_static.get("orientation") == other_static.get("orientation"):
+        user_score += 1.5
+    if user_static.get("gender") == other_static.get("gender"):
+        user_score += 1.0
+    if user_static.get("is_smoker") == other_static.get("is_smoker"):
+        user_score += 2.0
+    if user_static.get("wants_children") == other_static.get("wants_children"):
+        user_score += 2.5
+    if user_static.get("lifestyle") == other_static.get("lifestyle"):
+        user_score += 2.0
+    user_values = set(user_static.get("couple_values", []))
+    other_values = set(other_static.get("couple_values", []))
+    if user_values or other_values:
+        ratio = len(user_values.intersection(other_values)) / len(user_values.union(other_values))
+        user_score += 3.0 * ratio
+    if user_static.get("ideal_day") == other_static.get("ideal_day"):
+        user_score += 2.5
+    try:
+        eng_user = float(user_static.get("engagement", 5))
+        eng_other = float(other_static.get("engagement", 5))
+    except Exception:
+        eng_user = 5
+        eng_other = 5
+    diff = abs(eng_user - eng_other)
+    user_score += 3.0 * (1 - diff / 9)
+    return round((user_score / total_weight) * 100)
+
+
+def legacy_profiles(count, seed):
+    """Profils de l'ancien formulaire, avec réponses absentes et engagements illisibles."""
+    rng = random.Random(seed)
+    profiles = []
+    for _ in range(count):
+        static = {
+            "gender": rng.choice(["Homme", "Femme", "Autre"]),
+            "orientation": rng.choice(["hétérosexuel(le)", "homosexuel(le)", "bisexuel(le)"]),
+            "is_smoker": rng.random() < 0.3,
+            "wants_children": rng.choice(["Oui", "Non", "Peut-être"]),
+            "lifestyle": rng.choice(["Calme", "Actif", "Festif"]),
+            "couple_values": rng.sample(["Confiance", "Humour", "Respect", "Liberté", "Famille"], rng.randint(0, 3)),
+            "ideal_day": rng.choice(["Nature", "Ville", "Maison"]),
+            "engagement": rng.choice([1, 3, 5, 9, "7", "", "abc", None]),
+        }
+        for key in rng.sample(sorted(static), rng.randint(0, 2)):
+            del static[key]
+        profiles.append(static)
+    return profiles
+
+
+@pytest.fixture(scope="module")
+def legacy():
+    return ScoringSchema.from_dict({"features": LEGACY_FEATURES})
+
+
+def test_legacy_weights_reproduce_old_score(legacy):
+    assert legacy.total_weight == 17.5
+    profiles = legacy_profiles(300, seed=1)
+    engine = MatchingEngine([f"user{i}" for i in range(len(profiles))], profiles, legacy)
+    for user_static in legacy_profiles(30, seed=2):
+        expected = [legacy_compatibility(user_static, other) for other in profiles]
+        assert [compute_compatibility(user_static, other, legacy) for other in profiles] == expected
+        assert engine.scores(user_static).tolist() == expected
+
+
+def test_shipped_schema_follows_question_types():
+    for f in SCHEMA.features:
+        if f.key in MULTI_CHOICES:
+            assert f.compare == "jaccard"
+        elif f.key in CHOICES:
+            assert f.compare == "exact"
+        else:
+            assert f.key in SLIDERS
+            assert f.compare == "distance" and f.range == 9
+
+
+def test_tables_code_questionnaire_options():
+    for f in SCHEMA.features:
+        options = CHOICES.get(f.key, MULTI_CHOICES.get(f.key, []))
+        assert list(f.table) == options
+        assert sorted(f.table.values()) == list(range(1, len(options) + 1))
+        # Le moteur part des mêmes codes
+        assert MatchingEngine([], [], SCHEMA).vocabularies[f.key].codes == {None: 0, **f.table}
+
+
+def test_unknown_options_count_in_union_only():
+    key = next(key for key in MULTI_CHOICES if key in {f.key for f in SCHEMA.features})
+    first, second = MULTI_CHOICES[key][:2]
+    feature = Feature(key, "jaccard", 1.0)
+    assert feature.points({key: [first, "Autre chose"]}, {key: [first, second]}) == 1 / 3
+    assert feature.points({key: ["Autre chose"]}, {key: ["Autre chose", first]}) == 1 / 2
+    assert feature.points({}, {key: []}) == 0.0
+
+
+@pytest.mark.parametrize("features", [
+    [],
+    [{"key": "gender", "compare": "exact", "weight": 1.0}, {"key": "gender", "compare": "exact", "weight": 2.0}],
+    [{"key": "gender", "compare": "cosine", "weight": 1.0}],
+    [{"key": "gender", "compare": "exact", "weight": -1.0}],
+    [{"key": "gender", "compare": "exact", "weight": 0.0}],
+    [{"key": "age", "compare": "distance", "weight": 1.0}],
+])
+def test_invalid_schemas_are_rejected(features):
+    with pytest.raises(ValueError):
+        ScoringSchema.from_dict({"features": features})
@@ -0,0 +1,209 @@
+"""Gestionnaire de sessions (SessionManager) : déchargement, ménage en arrière-plan et rechargement."""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sessions import SessionManager, SessionRecord, SessionStore
+
+
+class ManualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LoggedStore(SessionStore):
+    """SessionStore qui compte les relectures et peut bloquer ou faire échouer les écritures."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.loads = 0
+        self.gate = None
+        self.failure = None
+
+    def load(self, key):
+        self.loads += 1
+        return super().load(key)
+
+    def write(self, sessions, answers=()):
+        if self.gate is not None:
+            self.gate.wait(3)
+        if self.failure is not None:
+            raise self.failure
+        return super().write(sessions, answers)
+
+
+CHAT = [{"role": "assistant", "content": "Bonjour"}, {"role": "user", "content": "Salut"}]
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "délai dépassé"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LoggedStore(os.path.join(tmp_path, "profiles.db"))
+    yield store
+    store.conn.close()
+
+
+@pytest.fixture
+def clock():
+    return ManualClock()
+
+
+def played(manager, key):
+    record = manager.get(key)
+    record.static_answers["gender"] = "Femme"
+    record.chat_history = list(CHAT)
+    record.profile_summary = "Résumé"
+    return record
+
+
+def test_get_never_sweeps(store, clock):
+    manager = SessionManager(store, idle_timeout=10, sweep_interval=0, clock=clock)
+    played(manager, "a")
+    clock.now = 100.0
+    manager.get("b")
+    assert manager.stats()["resident"] == 2
+    assert manager.sweep() == 1
+    assert list(manager.records) == ["b"]
+
+
+def test_offloaded_transcript_is_not_reread_on_eviction(store, clock):
+    manager = SessionManager(store, idle_timeout=10, clock=clock)
+    played(manager, "a")
+    manager.offload("a")
+    # Réponse modifiée après l'enregistrement du profil
+    manager.get("a").static_answers["interaction_choice"] = "discuter par chat"
+    loads = store.loads
+    clock.now = 100.0
+    assert manager.sweep() == 1
+    assert store.loads == loads
+
+    record = manager.get("a")
+    assert record.offloaded
+    assert record.static_answers == {"gender": "Femme", "interaction_choice": "discuter par chat"}
+    assert record.chat_history == CHAT and record.profile_summary == "Résumé"
+    assert manager.stats()["restored_total"] == 1
+
+
+def test_session_in_progress_is_restored(store, clock):
+    manager = SessionManager(store, idle_timeout=10, clock=clock)
+    played(manager, "a")
+    clock.now = 100.0
+    manager.sweep()
+    record = manager.get("a")
+    assert not record.offloaded
+    assert record.chat_history == CHAT and record.profile_summary == "Résumé"
+
+
+def test_session_being_written_is_taken_back(store, clock):
+    manager = SessionManager(store, idle_timeout=10, clock=clock)
+    record = played(manager, "a")
+    clock.now = 100.0
+    store.gate = threading.Event()
+    sweep = threading.Thread(target=manager.sweep)
+    sweep.start()
+    wait_for(lambda: "a" in manager.evicting)
+    # Retour de l'utilisateur pendant l'écriture : ni attente ni relecture d'une version périmée
+    loads = store.loads
+    assert manager.get("a") is record
+    assert store.loads == loads
+    store.gate.set()
+    sweep.join()
+    assert not manager.evicting and list(manager.records) == ["a"]
+
+
+def test_failed_write_keeps_sessions_in_memory(store, clock):
+    manager = SessionManager(store, idle_timeout=10, clock=clock)
+    played(manager, "a")
+    clock.now = 5.0
+    manager.get("b")
+    clock.now = 100.0
+    store.failure = RuntimeError("disque plein")
+    with pytest.raises(RuntimeError):
+        manager.sweep()
+    assert list(manager.records) == ["a", "b"] and not manager.evicting
+    assert manager.get("a").chat_history == CHAT
+    store.failure = None
+    assert manager.sweep() == 1
+
+
+def test_background_thread_evicts_idle_sessions(store):
+    manager = SessionManager(store, idle_timeout=0.05, sweep_interval=0.02)
+    played(manager, "a")
+    manager.start()
+    try:
+        wait_for(lambda: manager.stats()["evicted_total"] == 1)
+        assert manager.get("a").chat_history == CHAT
+    finally:
+        manager.stop()
+
+
+# =============================================================================
+# Résumé lancé en arrière-plan (SessionRecord.prefetch)
+# =============================================================================
+def prefetch(pool, record, key, ran):
+    """Comme prefetch_summary : tâche sautée si elle est abandonnée avant de démarrer."""
+    abandoned = threading.Event()
+
+    def run():
+        if abandoned.is_set():
+            return None
+        ran.append(key)
+        return key
+
+    record.cancel_prefetch()
+    record.prefetch = (key, pool.submit(run), abandoned)
+    return record.prefetch[1]
+
+
+@pytest.fixture
+def pool():
+    pool = ThreadPoolExecutor(max_workers=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_superseded_prefetch_is_cancelled(pool):
+    record, ran = SessionRecord("a"), []
+    busy = threading.Event()
+    pool.submit(busy.wait, 3)
+    first = prefetch(pool, record, "v1", ran)
+    second = prefetch(pool, record, "v2", ran)
+    busy.set()
+    assert second.result() == "v2"
+    assert first.cancelled() and ran == ["v2"]
+
+
+def test_abandoned_prefetch_is_skipped_when_it_starts(pool):
+    record, ran = SessionRecord("a"), []
+    busy = threading.Event()
+    pool.submit(busy.wait, 3)
+    future = prefetch(pool, record, "v1", ran)
+    # Comme une tâche déjà prise par un thread : l'annulation n'a pas lieu, seul l'abandon est signalé
+    record.prefetch[2].set()
+    busy.set()
+    assert future.result() is None and ran == []
+
+
+def test_eviction_abandons_prefetch(store, clock, pool):
+    manager = SessionManager(store, idle_timeout=10, clock=clock)
+    record, ran = played(manager, "a"), []
+    busy = threading.Event()
+    pool.submit(busy.wait, 3)
+    future = prefetch(pool, record, "v1", ran)
+    clock.now = 100.0
+    manager.sweep()
+    busy.set()
+    assert record.prefetch is None and future.cancelled()
+    assert manager.get("a").prefetch is None and ran == []
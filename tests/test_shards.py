@@ -0,0 +1,105 @@
+"""Profils répartis en shards (une feuille par genre) sur un classeur en mémoire (benchmarks/fakes.py)."""
+import json
+import os
+
+import pytest
+
+from benchmarks.fakes import FakeSpreadsheet
+from benchmarks.synthetic import sheet_rows
+from profile_store import SHARD_ROWS, ProfileStore
+from shards import LEGACY_SHARD, ShardedSheets, eligible_shards, shard_of_row, shard_title
+
+
+HOMME, FEMME, AUTRE = 1, 2, 3
+
+
+def row(user_id, static):
+    return [user_id, "2024-01-01 00:00:00", json.dumps({"static_answers": static}), "0", ""]
+
+
+def sharded(rows):
+    """Classeur dont chaque ligne est rangée dans la feuille de son shard, et ses ShardedSheets."""
+    book = FakeSpreadsheet()
+    for r in rows:
+        book.worksheet(shard_title(shard_of_row(r))).rows.append(r)
+    return book, ShardedSheets(lambda shard: book.worksheet(shard_title(shard)))
+
+
+@pytest.fixture
+def store(tmp_path):
+    stores = []
+
+    def make(name="profiles.db"):
+        stores.append(ProfileStore(os.path.join(tmp_path, name)))
+        return stores[-1]
+
+    yield make
+    for s in stores:
+        s.conn.close()
+
+
+def test_rows_are_routed_by_gender():
+    assert shard_of_row(row("a", {"gender": "Homme"})) == HOMME
+    assert shard_of_row(row("b", {"gender": "femme"})) == FEMME
+    assert shard_of_row(row("c", {"gender": "Autre"})) == AUTRE
+    # Genre inconnu, absent ou ligne illisible : ancienne feuille
+    assert shard_of_row(row("d", {"gender": "?"})) == LEGACY_SHARD
+    assert shard_of_row(row("e", {})) == LEGACY_SHARD
+    assert shard_of_row(["f", "", "{pas du json"]) == LEGACY_SHARD
+    assert [shard_title(shard) for shard in (LEGACY_SHARD, HOMME, FEMME)] == [None, "profils_homme", "profils_femme"]
+
+
+@pytest.mark.parametrize("static, expected", [
+    ({"gender": "Femme", "orientation": "hétérosexuel(le)"}, [LEGACY_SHARD, HOMME, AUTRE]),
+    ({"gender": "Femme", "orientation": "homosexuel(le)"}, [LEGACY_SHARD, FEMME]),
+    ({"gender": "Homme", "orientation": "bisexuel(le)"}, [LEGACY_SHARD, HOMME, FEMME, AUTRE]),
+    ({"gender": "Homme"}, [LEGACY_SHARD, HOMME, FEMME, AUTRE]),
+])
+def test_eligible_shards_follow_partner_allowed(static, expected):
+    assert eligible_shards(static) == expected
+
+
+def test_each_shard_has_its_own_row_range(store):
+    rows = [row("old", {"gender": "?"}), row("h1", {"gender": "Homme"}), row("f1", {"gender": "Femme"}),
+            row("h2", {"gender": "Homme"})]
+    _, sheets = sharded(rows)
+    s = store()
+    assert s.sync_shards(sheets) == 4
+    assert s.row_of("old") == 2
+    assert s.row_of("h1") == HOMME * SHARD_ROWS + 2
+    assert s.row_of("h2") == HOMME * SHARD_ROWS + 3
+    assert s.row_of("f1") == FEMME * SHARD_ROWS + 2
+    assert [s.last_row(shard) for shard in sheets.shards] == [2, 3, 2, 1]
+
+
+def test_only_requested_shards_are_read(store):
+    book, sheets = sharded([row("h1", {"gender": "Homme"}), row("f1", {"gender": "Femme"})])
+    s = store()
+    assert s.sync_shards(sheets, [LEGACY_SHARD, FEMME]) == 1
+    assert s.row_of("f1") is not None and s.row_of("h1") is None
+    assert book.worksheet(shard_title(HOMME)).calls == 0
+
+
+def test_shards_are_read_sequentially_once_the_pool_is_shut_down(store):
+    _, sheets = sharded([row("h1", {"gender": "Homme"}), row("f1", {"gender": "Femme"})])
+    # Comme à l'arrêt de l'interpréteur : le pool refuse les nouvelles tâches
+    sheets.pool.shutdown()
+    with pytest.raises(RuntimeError):
+        sheets.pool.submit(print)
+    s = store()
+    assert s.sync_shards(sheets) == 2
+
+
+def test_parallel_shard_sync_matches_single_sheet(store):
+    rows = sheet_rows(300, seed=4)
+    single = FakeSpreadsheet()
+    single.sheet1.rows.extend(rows)
+    _, sheets = sharded(rows)
+    flat, split = store("single.db"), store("sharded.db")
+    flat.sync(single.sheet1)
+    split.sync_shards(sheets)
+
+    assert sorted(flat.records()) == sorted(split.records())
+    # Lignes insérées dans l'ordre des dates : même ordre d'enregistrement dans le moteur
+    assert flat.engine().user_ids == split.engine().user_ids
+    assert flat.statics() == split.statics()
@@ -0,0 +1,199 @@
+"""File d'écriture différée SheetWriter contre une feuille en mémoire (benchmarks/fakes.py)."""
+import json
+import os
+import time
+
+import pytest
+
+from benchmarks.fakes import FakeWorksheet
+from profile_store import ProfileStore
+from sheet_writer import SheetWriter
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeAPIError(Exception):
+    """Comme gspread.exceptions.APIError : l'erreur porte la réponse HTTP."""
+
+    def __init__(self, status_code):
+        super().__init__(f"APIError [{status_code}]")
+        self.response = FakeResponse(status_code)
+
+
+class FlakyWorksheet(FakeWorksheet):
+    """FakeWorksheet qui journalise les appels d'écriture et lève les erreurs de failures[nom], dans l'ordre."""
+
+    def __init__(self):
+        super().__init__()
+        self.log = []
+        self.failures = {}
+
+    def _check(self, name):
+        self.log.append(name)
+        if self.failures.get(name):
+            raise self.failures[name].pop(0)
+
+    def append_rows(self, rows):
+        self._check("append_rows")
+        return super().append_rows(rows)
+
+    def batch_get(self, ranges):
+        self._check("batch_get")
+        return super().batch_get(ranges)
+
+    def batch_update(self, data):
+        self._check("batch_update")
+        return super().batch_update(data)
+
+
+def row(user_id, version):
+    data = {"static_answers": {"gender": "Femme", "age": version}, "chat_history": [], "profile_summary": ""}
+    return [user_id, "2024-01-01 00:00:00", json.dumps(data, ensure_ascii=False), 0, ""]
+
+
+def sheet_versions(sheet):
+    """(user_id, âge) de chaque ligne de la feuille, l'âge servant de numéro de version."""
+    return [(r[0], json.loads(r[2])["static_answers"]["age"]) for r in sheet.rows[1:]]
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "délai dépassé"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def sheet():
+    return FlakyWorksheet()
+
+
+@pytest.fixture
+def make_writer(sheet):
+    writers = []
+
+    def make(**options):
+        # Pas d'écriture du thread de fond pendant le test, sauf si flush_interval ou batch_size le demandent
+        options = {"flush_interval": 60, "backoff": 0.001, "max_retries": 2, "retry_after": 60, **options}
+        writers.append(SheetWriter(sheet, **options))
+        return writers[-1]
+
+    yield make
+    for writer in writers:
+        writer.pending.clear()
+
+
+def test_burst_for_one_user_is_one_append(sheet, make_writer):
+    writer = make_writer()
+    for version in range(1, 6):
+        writer.submit("alice", row("alice", version))
+    writer.flush()
+    assert sheet.log == ["append_rows"]
+    assert sheet_versions(sheet) == [("alice", 5)]
+
+
+def test_full_batch_is_written_without_waiting(sheet, make_writer):
+    writer = make_writer(batch_size=3)
+    for i in range(3):
+        writer.submit(f"user{i}", row(f"user{i}", 1))
+    wait_for(lambda: len(sheet.rows) == 4)
+    assert sheet.log == ["append_rows"]
+    assert writer.rows_written == 3
+
+
+def test_pending_rows_are_written_after_flush_interval(sheet, make_writer):
+    writer = make_writer(flush_interval=0.2)
+    start = time.monotonic()
+    writer.submit("alice", row("alice", 1))
+    wait_for(lambda: len(sheet.rows) == 2)
+    assert time.monotonic() - start >= 0.2
+    assert sheet.log == ["append_rows"]
+
+
+def test_quota_errors_are_retried(sheet, make_writer):
+    writer = make_writer()
+    sheet.failures["append_rows"] = [FakeAPIError(429), FakeAPIError(503)]
+    writer.submit("alice", row("alice", 1))
+    writer.flush()
+    assert sheet.log == ["append_rows"] * 3
+    assert sheet_versions(sheet) == [("alice", 1)]
+    assert writer.rows_failed == 0 and not writer.pending
+
+
+def test_failed_batch_is_requeued_without_overwriting_newer_version(sheet, make_writer):
+    writer = make_writer()
+
+    def failing_append(rows):
+        # Nouvelle version soumise par la page pendant l'écriture du lot
+        writer.submit("alice", row("alice", 2))
+        raise FakeAPIError(400)
+
+    append_rows = sheet.append_rows
+    sheet.append_rows = failing_append
+    writer.submit("alice", row("alice", 1))
+    writer.submit("bob", row("bob", 1))
+    writer.flush()
+    assert len(sheet.rows) == 1
+    assert list(writer.pending) == ["bob", "alice"]
+    assert writer.pending["alice"] == row("alice", 2)
+    assert writer.rows_failed == 1
+    assert writer.retry_at > time.monotonic()
+
+    sheet.append_rows = append_rows
+    writer.flush()
+    assert sorted(sheet_versions(sheet)) == [("alice", 2), ("bob", 1)]
+
+
+# =============================================================================
+# Upsert avec la copie locale (ProfileStore)
+# =============================================================================
+@pytest.fixture
+def store(tmp_path):
+    store = ProfileStore(os.path.join(tmp_path, "profiles.db"))
+    yield store
+    store.conn.close()
+
+
+def test_known_user_is_updated_in_place(sheet, make_writer, store):
+    writer = make_writer(store=store)
+    writer.submit("alice", row("alice", 1))
+    writer.flush()
+    writer.submit("bob", row("bob", 1))
+    writer.submit("alice", row("alice", 2))
+    writer.flush()
+    assert sheet_versions(sheet) == [("alice", 2), ("bob", 1)]
+    assert sheet.log == ["append_rows", "batch_get", "batch_update", "append_rows"]
+    assert writer.rows_updated == 1 and writer.rows_written == 2
+    assert store.get_data("alice")["static_answers"]["age"] == 2
+
+
+def test_row_changed_by_hand_is_appended(sheet, make_writer, store):
+    writer = make_writer(store=store)
+    writer.submit("alice", row("alice", 1))
+    writer.flush()
+    store.sync(sheet)
+    # La ligne d'alice a été remplacée à la main : elle n'est pas écrasée
+    sheet.rows[1] = [str(v) for v in row("carol", 1)]
+    writer.submit("alice", row("alice", 2))
+    writer.flush()
+    assert sheet_versions(sheet) == [("carol", 1), ("alice", 2)]
+    assert writer.rows_updated == 0
+
+
+def test_unreadable_row_is_requeued_not_appended(sheet, make_writer, store):
+    writer = make_writer(store=store)
+    writer.submit("alice", row("alice", 1))
+    writer.flush()
+    sheet.failures["batch_get"] = [FakeAPIError(400)]
+    writer.submit("alice", row("alice", 2))
+    writer.flush()
+    assert sheet_versions(sheet) == [("alice", 1)]
+    assert sheet.log.count("append_rows") == 1
+    assert list(writer.pending) == ["alice"] and writer.rows_failed == 1
+
+    writer.flush()
+    assert sheet_versions(sheet) == [("alice", 2)]
+    assert not writer.pending